@@ -0,0 +1,148 @@
+# app/jobs.py
+"""
+Hàng đợi cho các job video (/process, /process-remix).
+
+- Tối đa MAX_VIDEO_JOBS job render chạy cùng lúc, job còn lại ở trạng thái "queued".
+  Preview chạy ở lane riêng (PREVIEW_JOB_SLOTS slot) nên không phải chờ sau các bản render đầy đủ.
+- cancel(job_id): job đang chờ bị hủy ngay; job đang chạy nhận CancelledError
+  (ffmpeg bị kill cả process group trong process_runner) và cờ `cancel_event`
+  được bật để Whisper trong threadpool tự dừng giữa các segment.
+- Khi job kết thúc (xong/lỗi/hủy) slot được trả lại và workdir tạm bị xóa.
+- trace_event(): các bước trong job ghi lại quyết định (VD profile lọc nhiễu) vào
+  JOB_STATUS[job_id]["trace"].
+"""
+import os
+import time
+import shutil
+import asyncio
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+MAX_VIDEO_JOBS = int(os.getenv("MAX_VIDEO_JOBS", "2"))
+PREVIEW_JOB_SLOTS = int(os.getenv("PREVIEW_JOB_SLOTS", "2"))
+RENDER_LANE = "render"
+PREVIEW_LANE = "preview"
+# Thời gian DELETE /process/{job_id} chờ job dừng hẳn trước khi trả kết quả
+JOB_CANCEL_WAIT = float(os.getenv("JOB_CANCEL_WAIT", "10"))
+
+# job_id -> {"status": queued|processing|complete|failed|cancelled, ...}
+JOB_STATUS: Dict[str, Dict] = {}
+
+_CANCEL_EVENT: ContextVar[Optional[threading.Event]] = ContextVar("mfa_job_cancel", default=None)
+_TRACE: ContextVar[Optional[List[Dict]]] = ContextVar("mfa_job_trace", default=None)
+
+
+class JobCancelled(Exception):
+    """Raise trong worker thread khi job đã bị hủy (kiểm tra cooperative)."""
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """Cờ hủy của job hiện tại (None nếu không chạy trong scheduler)."""
+    return _CANCEL_EVENT.get()
+
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled("Job đã bị hủy.")
+
+
+def trace_event(event: str, **data: Any) -> None:
+    """Ghi một mục vào trace của job hiện tại (bỏ qua nếu không chạy trong scheduler)."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.append({"event": event, "at": round(time.time(), 3), **data})
+
+
+class _Job:
+    __slots__ = ("job_id", "lane", "task", "cancel_event", "workdir", "created", "started", "trace")
+
+    def __init__(self, job_id: str, lane: str, workdir: Optional[Path]):
+        self.job_id = job_id
+        self.lane = lane
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_event = threading.Event()
+        self.workdir = workdir
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.trace: List[Dict] = []
+
+
+class JobScheduler:
+    def __init__(self, lanes: Dict[str, int]):
+        # lane -> số slot; mỗi lane có semaphore riêng
+        self.lanes = {name: max(1, slots) for name, slots in lanes.items()}
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._jobs: Dict[str, _Job] = {}
+
+    def _semaphore(self, lane: str) -> asyncio.Semaphore:
+        # Tạo trên event loop đang chạy (không tạo lúc import module)
+        if lane not in self._sems:
+            self._sems[lane] = asyncio.Semaphore(self.lanes[lane])
+        return self._sems[lane]
+
+    def submit(self, job_id: str, fn: Callable[..., Awaitable[Any]], *args,
+               workdir: Optional[Path] = None, lane: str = RENDER_LANE, **kwargs) -> None:
+        job = _Job(job_id, lane, workdir)
+        JOB_STATUS[job_id] = {"status": "queued"}
+        self._jobs[job_id] = job
+        job.task = asyncio.create_task(self._run(job, fn, args, kwargs))
+
+    async def _run(self, job: _Job, fn, args, kwargs) -> None:
+        _CANCEL_EVENT.set(job.cancel_event)
+        _TRACE.set(job.trace)
+        try:
+            async with self._semaphore(job.lane):
+                job.started = time.time()
+                JOB_STATUS[job.job_id] = {"status": "processing", "trace": job.trace}
+                await fn(*args, **kwargs)
+        except (asyncio.CancelledError, JobCancelled):
+            JOB_STATUS[job.job_id] = {"status": "cancelled"}
+            print(f"[{job.job_id}] Đã hủy job.")
+        except Exception as e:
+            JOB_STATUS[job.job_id] = {"status": "failed", "error": str(e)}
+        finally:
+            if job.trace and job.job_id in JOB_STATUS:
+                JOB_STATUS[job.job_id]["trace"] = job.trace
+            self._jobs.pop(job.job_id, None)
+            if job.workdir is not None:
+                await run_in_threadpool(shutil.rmtree, job.workdir, True)
+
+    async def cancel(self, job_id: str, wait: float = JOB_CANCEL_WAIT) -> Optional[str]:
+        """
+        Hủy job; trả trạng thái sau khi chờ tối đa `wait` giây
+        ("cancelled", hoặc "cancelling" nếu Whisper chưa kịp dừng), None nếu job không còn chạy/chờ.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.task is None:
+            return None
+        # Bật cờ trước để worker thread (Whisper) dừng sớm, rồi mới cancel task
+        job.cancel_event.set()
+        job.task.cancel()
+        done, _ = await asyncio.wait({job.task}, timeout=wait)
+        return JOB_STATUS.get(job_id, {}).get("status") if done else "cancelling"
+
+    async def cancel_all(self) -> None:
+        for job_id in list(self._jobs):
+            await self.cancel(job_id, wait=0)
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        out = {}
+        for lane, slots in self.lanes.items():
+            jobs = [j for j in self._jobs.values() if j.lane == lane]
+            out[lane] = {
+                "slots": slots,
+                "running": [
+                    {"job_id": j.job_id, "elapsed_sec": round(now - j.started, 1)}
+                    for j in jobs if j.started is not None
+                ],
+                "queued": [j.job_id for j in jobs if j.started is None],
+            }
+        return out
+
+
+video_jobs = JobScheduler({RENDER_LANE: MAX_VIDEO_JOBS, PREVIEW_LANE: PREVIEW_JOB_SLOTS})
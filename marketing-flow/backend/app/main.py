@@ -5,7 +5,7 @@ import os
 import shutil
 from pathlib import Path
 from uuid import uuid4
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -14,7 +14,7 @@ import asyncio
 import re 
 import requests # <-- Giữ lại cho Tool 3
 from pydantic import BaseModel # <-- Giữ lại cho Tool 3
-from app.services.sheets import export_rows, read_sheet_data, update_sheet_cell 
+from app.services.sheets import export_rows, update_sheet_cell
 from gspread_asyncio import AsyncioGspreadClient
 from app.media import remix_video_by_scenes, SceneSegment, auto_subtitle_and_bgm
 from app.routers.video import SPREADSHEET_ID
@@ -31,10 +31,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from app.services.sheets import _get_async_client_manager
+from app.services.sheets import _get_async_client_manager, sheets_quota_snapshot
+from app.services.sheet_mirror import mirror, mirror_enabled
+from app.services.sheet_maintenance import archive_enabled, run_archive_loop
+from app.services.browser_pool import browser_pool
+from app.services import http_fetch
+from app.services.process_runner import process_stats
+from app.jobs import JOB_STATUS, JobCancelled, PREVIEW_LANE, RENDER_LANE, video_jobs
+from app.services import bgm_library, render_cache
+from app.services.output_profiles import OutputProfile, parse_profiles
 from app.dependencies import get_sheet_client 
-from .media import auto_subtitle_and_bgm, flip_video_horizontal, upload_to_dropbox
-from app.routers import analyze, keywords, export, mvp, video
+from .media import auto_subtitle_and_bgm, flip_video_horizontal, upload_to_dropbox, bind_sheet_client
+from app.routers import analyze, keywords, export, mvp, video, artifacts, publishing, bgm as bgm_router
 from app.routers.video import _to_public_url
 
 @asynccontextmanager
@@ -49,10 +57,32 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"LỖI NGHIÊM TRỌNG: Không thể xác thực Google Sheet: {e}")
         app.state.gc = None 
+
+    # Upload Dropbox (chạy trong threadpool) ghi link vào sheet qua client dùng chung
+    bind_sheet_client(app.state.gc, asyncio.get_running_loop())
+
+    # Đồng bộ nền bản sao SQLite của các tab hay dùng
+    mirror_task = None
+    if app.state.gc is not None and mirror_enabled():
+        mirror_task = asyncio.create_task(mirror.run(app.state.gc, SPREADSHEET_ID))
+
+    # Định kỳ chuyển hàng đã xong/quá cũ ra tab lưu trữ (MFA_SHEET_ARCHIVE=1 để bật)
+    archive_task = None
+    if app.state.gc is not None and archive_enabled():
+        archive_task = asyncio.create_task(run_archive_loop(app.state.gc, SPREADSHEET_ID))
     
     yield
     
     print("Server đang tắt.")
+    await video_jobs.cancel_all()
+    if mirror_task:
+        mirror_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+    bind_sheet_client(None, None)
+    # Đóng Chromium của pool crawl (nếu đã được khởi động)
+    await run_in_threadpool(browser_pool.close)
+    await http_fetch.aclose()
 
 app = FastAPI(
     title="Marketing Flow Automation",
@@ -61,8 +91,6 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-JOB_STATUS: Dict[str, Dict] = {}
-
 # ... (Hàm run_video_job giữ nguyên) ...
 async def run_video_job(
     job_id: str,
@@ -72,32 +100,41 @@ async def run_video_job(
     language: Optional[str],
     burn_in: bool,
     temp_workdir: Path,
-    flip_video: bool
+    flip_video: bool,
+    preview_key: Optional[str] = None,
 ):
     try:
         video_to_process = temp_video_path
         
-        if flip_video:
+        # Preview: lật ngay trong filter graph của bước subtitle thay vì encode riêng một lượt
+        if flip_video and not preview_key:
             flipped_path = str(temp_workdir / "flipped.mp4")
             try:
-                await run_in_threadpool(flip_video_horizontal, temp_video_path, flipped_path, do_upload=False)
+                await flip_video_horizontal(temp_video_path, flipped_path, do_upload=False)
                 video_to_process = flipped_path
             except Exception as e:
                 JOB_STATUS[job_id] = {"status": "failed", "error": f"Failed to flip video: {e}"}
                 shutil.rmtree(temp_workdir)
                 return
         
-        final_path_str = await run_in_threadpool(
-            auto_subtitle_and_bgm,
+        final_path_str = await auto_subtitle_and_bgm(
             video_path=video_to_process,
             output_path=final_output_path,
             bgm_path=bgm_path,
             language=language,
             burn_in=burn_in,
-            do_upload=False 
+            flip_video=bool(flip_video and preview_key),
+            do_upload=False,
+            preview=bool(preview_key),
         )
-        JOB_STATUS[job_id] = {"status": "complete", "path": final_path_str}
+        if preview_key:
+            final_path_str = await run_in_threadpool(
+                render_cache.put, preview_key, final_path_str, Path(final_path_str).suffix
+            )
+        JOB_STATUS[job_id] = {"status": "complete", "path": final_path_str, "preview": bool(preview_key)}
     
+    except JobCancelled:
+        raise
     except Exception as e:
         JOB_STATUS[job_id] = {"status": "failed", "error": str(e)}
     
@@ -132,7 +169,7 @@ async def _find_sheet_cell_coords_main(
     url_col_name: str = "Link Video gốc"
 ) -> (Optional[int], Optional[int]):
     try:
-        data = await read_sheet_data(gc, SPREADSHEET_ID, sheet_title)
+        data = await mirror.read(gc, SPREADSHEET_ID, sheet_title)
         if not data:
             print(f"[main.py] Sheet '{sheet_title}' trống.")
             return None, None
@@ -209,7 +246,9 @@ async def run_remix_job(
     bgm_path_str: Optional[str],
     remove_original_audio: bool,
     burn_in: bool,
-    flip_video: bool
+    flip_video: bool,
+    preview_key: Optional[str] = None,
+    profiles: Optional[List[OutputProfile]] = None,
 ):
     try:
         video_to_process = source_video_path
@@ -220,23 +259,39 @@ async def run_remix_job(
                 highlights = [SceneSegment(**s) for s in highlights_data if s]
                 if not highlights:
                     raise ValueError("Không có highlights hợp lệ để remix.")
-                remix_path = str(temp_workdir / "remixed.mp4")
-                await run_in_threadpool(
-                    remix_video_by_scenes,
-                    video_to_process, 
-                    remix_path, 
-                    highlights
+                # Softsub không flip: bước subtitle sau giữ nguyên hình -> remix không cần encode
+                stream_copy = not burn_in and not flip_video
+                # Bản remix (độ phân giải gốc) dùng chung giữa preview và bản render cuối
+                remix_key = render_cache.cache_key(
+                    "remix",
+                    source=await run_in_threadpool(render_cache.fingerprint, source_video_path),
+                    highlights=[s for s in highlights_data if s],
+                    stream_copy=stream_copy,
                 )
-                video_to_process = remix_path
-                print(f"[{job_id}] Remix hoàn tất.")
+                cached_remix = render_cache.get(remix_key, ".mp4")
+                if cached_remix:
+                    video_to_process = cached_remix
+                    print(f"[{job_id}] Dùng lại bản remix đã render (cache).")
+                else:
+                    remix_path = str(temp_workdir / "remixed.mp4")
+                    await remix_video_by_scenes(
+                        video_to_process, 
+                        remix_path, 
+                        highlights,
+                        stream_copy=stream_copy,
+                    )
+                    video_to_process = await run_in_threadpool(render_cache.put, remix_key, remix_path, ".mp4")
+                    print(f"[{job_id}] Remix hoàn tất.")
             except Exception as e_remix:
                 print(f"[{job_id}] LỖI Remix: {e_remix}. Sẽ dùng video gốc.")
                 video_to_process = source_video_path 
-        if flip_video:
+        # Preview / nhiều profile: lật ngay trong filter graph thay vì encode riêng một lượt
+        inline_flip = bool(flip_video and (preview_key or profiles))
+        if flip_video and not inline_flip:
             print(f"[{job_id}] Bắt đầu Flip...")
             flipped_path = str(temp_workdir / "flipped.mp4")
             try:
-                await run_in_threadpool(flip_video_horizontal, video_to_process, flipped_path, do_upload=False)
+                await flip_video_horizontal(video_to_process, flipped_path, do_upload=False)
                 video_to_process = flipped_path
                 print(f"[{job_id}] Flip hoàn tất.")
             except Exception as e_flip:
@@ -245,10 +300,11 @@ async def run_remix_job(
                 return
         print(f"[{job_id}] Bắt đầu Subtitle/BGM...")
         stem = Path(video_to_process).stem
+        if preview_key:
+            stem += "_preview"
         out_name = f"{stem}_{job_id}.mp4" if burn_in else f"{stem}_{job_id}.mkv"
         final_output_path = str(EXPORTS_DIR / out_name)
-        await run_in_threadpool(
-            auto_subtitle_and_bgm,
+        rendered = await auto_subtitle_and_bgm(
             video_path=video_to_process,
             output_path=final_output_path,
             bgm_path=bgm_path_str,
@@ -256,9 +312,31 @@ async def run_remix_job(
             segments_json=segments_json,
             burn_in=burn_in,
             remove_original_audio=remove_original_audio,
-            do_upload=False 
+            flip_video=inline_flip,
+            do_upload=False,
+            preview=bool(preview_key),
+            profiles=profiles or None,
         )
+        # Nhiều profile -> {profile: path}; profile đầu tiên là bản chính (ghi vào Sheet)
+        outputs: Dict[str, str] = rendered if profiles else {}
+        final_output_path = next(iter(outputs.values())) if profiles else rendered
         print(f"[{job_id}] Subtitle/BGM hoàn tất. Path: {final_output_path}")
+        if preview_key:
+            # Preview không upload Dropbox / ghi Sheet
+            if profiles:
+                for i, (key, path) in enumerate(outputs.items()):
+                    outputs[key] = await run_in_threadpool(
+                        render_cache.put, f"{preview_key}_{i}", path, Path(path).suffix
+                    )
+                final_output_path = next(iter(outputs.values()))
+            else:
+                final_output_path = await run_in_threadpool(
+                    render_cache.put, preview_key, final_output_path, Path(final_output_path).suffix
+                )
+            JOB_STATUS[job_id] = {"status": "complete", "path": final_output_path, "preview": True}
+            if outputs:
+                JOB_STATUS[job_id]["outputs"] = outputs
+            return
         print(f"[{job_id}] Bắt đầu Upload và cập nhật Sheet...")
         await _upload_and_update_remix_sheet(
             gc=gc,
@@ -267,6 +345,20 @@ async def run_remix_job(
             source_url=source_url
         )
         JOB_STATUS[job_id] = {"status": "complete", "path": final_output_path}
+        if outputs:
+            # Các khung còn lại chỉ upload Dropbox (Sheet chỉ có một cột link)
+            dropbox_urls = {}
+            for key, path in list(outputs.items())[1:]:
+                try:
+                    dropbox_urls[key] = await run_in_threadpool(upload_to_dropbox, path)
+                except Exception as e_upload:
+                    print(f"[{job_id}] LỖI upload {key}: {e_upload}")
+            JOB_STATUS[job_id] = {
+                "status": "complete", "path": final_output_path,
+                "outputs": outputs, "dropbox_urls": dropbox_urls,
+            }
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"[{job_id}] LỖI NGHIÊM TRỌNG: {e}")
         JOB_STATUS[job_id] = {"status": "failed", "error": str(e)}
@@ -328,6 +420,9 @@ app.include_router(keywords.router, prefix="/keywords", tags=["Keyword Report"])
 app.include_router(export.router,   prefix="/export",   tags=["Export"])
 app.include_router(mvp.router,      prefix="/mvp",      tags=["MVP"])
 app.include_router(video.router, tags=["Video"])
+app.include_router(artifacts.router, prefix="/artifacts", tags=["Artifacts"])
+app.include_router(publishing.router, prefix="/publishing", tags=["Publishing"])
+app.include_router(bgm_router.router, prefix="/bgm", tags=["BGM"])
 
 # ---- Static media ----
 MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
@@ -342,6 +437,21 @@ app.mount("/media", StaticFiles(directory=MEDIA_ROOT), name="media")
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/health/sheets-quota")
+def health_sheets_quota():
+    """Headroom của token bucket đọc/ghi Google Sheets."""
+    return sheets_quota_snapshot()
+
+@app.get("/health/browser-pool")
+def health_browser_pool():
+    """Trạng thái pool Chromium dùng cho crawl render JS."""
+    return browser_pool.snapshot()
+
+@app.get("/health/processes")
+def health_processes():
+    """Job video đang chạy/chờ, tiến trình ffmpeg/ffprobe + CPU time/RSS của các lần gọi gần đây."""
+    return {"jobs": video_jobs.snapshot(), **process_stats()}
 # ... (các endpoint debug khác giữ nguyên) ...
 @app.get("/debug/ffmpeg_cmd")
 def debug_ffmpeg_cmd():
@@ -362,16 +472,43 @@ def debug_ffmpeg():
     except Exception as e:
         return {"ok": False, "bin": exe, "err": str(e)}
 
+def _resolve_bgm(bgm_id: Optional[str]) -> Optional[Dict]:
+    """Track trong thư viện BGM (job dùng thẳng file đã chuẩn hóa, không upload lại)."""
+    return bgm_library.get_track(bgm_id) if bgm_id else None
+
+
+async def _preview_key(kind: str, files: Dict[str, Optional[str]], **params) -> str:
+    """Khóa cache preview: dấu vân tay các file đầu vào + tham số render."""
+    for name, path in files.items():
+        params[name] = await run_in_threadpool(render_cache.fingerprint, path) if path else None
+    return render_cache.cache_key(kind, **params)
+
+
+def _complete_from_cache(job_id: str, workdir: Path, cached: str,
+                         outputs: Optional[Dict[str, str]] = None) -> Dict:
+    JOB_STATUS[job_id] = {"status": "complete", "path": cached, "preview": True}
+    if outputs:
+        JOB_STATUS[job_id]["outputs"] = outputs
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(f"[{job_id}] Dùng lại bản preview đã render: {cached}")
+    return {"status": "complete", "job_id": job_id, "cached": True}
+
+
 # ---- Auto-subtitle endpoint (Tool 3 CŨ) ----
 @app.post("/process", tags=["Video"])
 async def process_video(
-    background_tasks: BackgroundTasks,
     video: UploadFile = File(...),
     bgm: Optional[UploadFile] = File(None),
     burn_in: bool = Form(True),
     language: Optional[str] = Form(None),
-    flip: bool = Form(False, description="Flip video horizontally")
+    flip: bool = Form(False, description="Flip video horizontally"),
+    preview: bool = Form(False, description="Render nhanh bản xem trước 480p"),
+    bgm_id: Optional[str] = Form(None, description="ID nhạc nền trong thư viện /bgm (thay cho upload `bgm`)"),
 ):
+    bgm_track = _resolve_bgm(bgm_id)
+    if bgm_id and not bgm_track:
+        return JSONResponse(status_code=404, content={"status": "failed", "error": f"BGM '{bgm_id}' not found."})
+
     job_id = str(uuid4())
     workdir = TEMP_DIR / job_id
     workdir.mkdir(parents=True, exist_ok=True)
@@ -386,7 +523,9 @@ async def process_video(
         finally:
             await video.close()
             
-        if bgm:
+        if bgm_track:
+            bgm_path_str = bgm_track["path"]
+        elif bgm:
             bgm_path = workdir / (bgm.filename or "music.mp3")
             try:
                 with bgm_path.open("wb") as f:
@@ -398,16 +537,29 @@ async def process_video(
     except Exception as e:
         return JSONResponse(status_code=400, content={"status": "failed", "error": f"File save error: {e}"})
 
+    preview_key: Optional[str] = None
+    if preview:
+        preview_key = await _preview_key(
+            "preview_process",
+            {"source": str(video_path), "bgm": bgm_path_str},
+            language=language, burn_in=burn_in, flip=flip,
+        )
+        cached = render_cache.get(preview_key, ".mp4" if burn_in else ".mkv")
+        if cached:
+            return _complete_from_cache(job_id, workdir, cached)
+
     stem = video_path.stem
     if flip:
         stem += "_flipped"
+    if preview:
+        stem += "_preview"
     
     out_name = f"{stem}_{job_id}.mp4" if burn_in else f"{stem}_{job_id}.mkv"
     out_path = EXPORTS_DIR / out_name
 
-    JOB_STATUS[job_id] = {"status": "processing"}
-
-    background_tasks.add_task(
+    # Chạy qua hàng đợi video_jobs (giới hạn số encode song song, hủy được)
+    video_jobs.submit(
+        job_id,
         run_video_job, 
         job_id,
         str(video_path),
@@ -416,16 +568,18 @@ async def process_video(
         language,
         burn_in,
         workdir,
-        flip
+        flip,
+        preview_key,
+        workdir=workdir,
+        lane=PREVIEW_LANE if preview else RENDER_LANE,
     )
 
-    return {"status": "processing", "job_id": job_id}
+    return {"status": JOB_STATUS[job_id]["status"], "job_id": job_id}
 
 
 # ---- Endpoint MỚI (Tool 3 MỚI) ----
 @app.post("/process-remix", tags=["Video"])
 async def process_remix_video(
-    background_tasks: BackgroundTasks,
     gc: AsyncioGspreadClient = Depends(get_sheet_client), 
     
     source_video_path: str = Form(...),
@@ -437,8 +591,19 @@ async def process_remix_video(
     remove_original_audio: bool = Form(False),
     burn_in: bool = Form(True),
     flip_video: bool = Form(False),
+    preview: bool = Form(False),
+    output_profiles: str = Form("", description="Nhiều khung hình từ một lần render, VD: 9:16,1:1,4:5:pad,16:9"),
+    bgm_id: Optional[str] = Form(None),
     bgm: Optional[UploadFile] = File(None)
 ):
+    try:
+        profiles = parse_profiles(output_profiles)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "failed", "error": str(e)})
+    bgm_track = _resolve_bgm(bgm_id)
+    if bgm_id and not bgm_track:
+        return JSONResponse(status_code=404, content={"status": "failed", "error": f"BGM '{bgm_id}' not found."})
+
     job_id = str(uuid4())
     workdir = TEMP_DIR / job_id
     workdir.mkdir(parents=True, exist_ok=True)
@@ -446,7 +611,9 @@ async def process_remix_video(
     bgm_path_str: Optional[str] = None
     
     try:
-        if bgm:
+        if bgm_track:
+            bgm_path_str = bgm_track["path"]
+        elif bgm:
             bgm_path = workdir / (bgm.filename or "music.mp3")
             try:
                 with bgm_path.open("wb") as f:
@@ -461,9 +628,31 @@ async def process_remix_video(
     except Exception as e:
         return JSONResponse(status_code=400, content={"status": "failed", "error": f"File save error: {e}"})
 
-    JOB_STATUS[job_id] = {"status": "processing"}
-
-    background_tasks.add_task(
+    preview_key: Optional[str] = None
+    if preview:
+        preview_key = await _preview_key(
+            "preview_remix",
+            {"source": source_video_path, "bgm": bgm_path_str},
+            do_remix=do_remix,
+            highlights=highlights_json if do_remix else None,
+            segments=segments_json,
+            remove_original_audio=remove_original_audio,
+            burn_in=burn_in,
+            flip_video=flip_video,
+            profiles=[p.key for p in profiles],
+        )
+        suffix = ".mp4" if burn_in else ".mkv"
+        if profiles:
+            cached_outputs = {p.key: render_cache.get(f"{preview_key}_{i}", suffix) for i, p in enumerate(profiles)}
+            if all(cached_outputs.values()):
+                return _complete_from_cache(job_id, workdir, next(iter(cached_outputs.values())), cached_outputs)
+        else:
+            cached = render_cache.get(preview_key, suffix)
+            if cached:
+                return _complete_from_cache(job_id, workdir, cached)
+
+    video_jobs.submit(
+        job_id,
         run_remix_job,
         job_id,
         gc,
@@ -477,10 +666,14 @@ async def process_remix_video(
         bgm_path_str,
         remove_original_audio,
         burn_in,
-        flip_video
+        flip_video,
+        preview_key,
+        profiles,
+        workdir=workdir,
+        lane=PREVIEW_LANE if preview else RENDER_LANE,
     )
 
-    return {"status": "processing", "job_id": job_id}
+    return {"status": JOB_STATUS[job_id]["status"], "job_id": job_id}
 
 
 
@@ -502,6 +695,24 @@ def get_job_status(job_id: str):
             
         public_url = _to_public_url(path)
         
-        return {"status": "complete", "download_url": public_url}
+        result = {"status": "complete", "download_url": public_url, "preview": status.get("preview", False)}
+        if status.get("outputs"):
+            result["outputs"] = {key: _to_public_url(p) for key, p in status["outputs"].items()}
+        if status.get("trace"):
+            result["trace"] = status["trace"]
+        return result
         
-    return status
\ No newline at end of file
+    return status
+
+
+@app.delete("/process/{job_id}", tags=["Video"])
+async def cancel_job(job_id: str):
+    """Hủy job video: job đang chờ bị bỏ ngay, job đang chạy bị kill ffmpeg/Whisper và dọn workdir."""
+    state = await video_jobs.cancel(job_id)
+    if state is None:
+        status = JOB_STATUS.get(job_id)
+        if not status:
+            raise HTTPException(status_code=404, detail="Job not found.")
+        # Job đã kết thúc từ trước, không còn gì để hủy
+        return {"job_id": job_id, "cancelled": False, "status": status.get("status")}
+    return {"job_id": job_id, "cancelled": True, "status": state}
\ No newline at end of file
@@ -1,11 +1,14 @@
 import os
-import subprocess
+import math
+import time
+import asyncio
+import threading
 import tempfile
 import dropbox
 import gspread
 import json
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Optional, List, Sequence, Tuple, Dict, Union
 from tqdm import tqdm
 from pydantic import BaseModel # <-- ĐÃ THÊM
 from pathlib import Path
@@ -13,6 +16,18 @@ from typing import Optional
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from gspread_asyncio import AsyncioGspreadClient
+from app.services.sheets import add_write_listener, call_with_quota
+from app.services.process_runner import run_process, run_process_blocking
+from app.services import audio_cleanup, bgm_library, loudness, render_cache, whisper_chunks
+from app.services.loudness import linear_gain_db
+from app.services.output_profiles import OutputProfile
+from app.jobs import current_cancel_event, raise_if_cancelled, trace_event
+from app.services.chunked_render import (
+    chunked_enabled, copy_spans, keyframe_times, offset_cues, plan_spans, render_video_chunks,
+    snap_spans,
+)
+from fastapi.concurrency import run_in_threadpool
 # ---------- FFmpeg / ffprobe resolvers ----------
 def get_ffmpeg_bin() -> str:
     env = os.getenv("FFMPEG_BIN")
@@ -32,6 +47,21 @@ def get_ffprobe_bin() -> str:
             return str(guess)
     return "ffprobe"
 
+# ffprobe chỉ đọc header, không nên chạy lâu
+FFPROBE_TIMEOUT = float(os.getenv("FFPROBE_TIMEOUT", "60"))
+# Remix stream-copy: độ lệch tối đa (giây) khi dời ranh giới cảnh về keyframe
+REMIX_SNAP_TOLERANCE = float(os.getenv("REMIX_SNAP_TOLERANCE", "0.5"))
+# Bản preview: cùng filter graph, thu nhỏ + ultrafast + giới hạn bitrate
+PREVIEW_HEIGHT = int(os.getenv("PREVIEW_HEIGHT", "480"))
+PREVIEW_CRF = int(os.getenv("PREVIEW_CRF", "30"))
+PREVIEW_MAXRATE = os.getenv("PREVIEW_MAXRATE", "900k")
+# Loudness mục tiêu (LUFS): audio đưa vào Whisper và voice/BGM trong bản mix cuối
+ASR_TARGET_LUFS = float(os.getenv("ASR_TARGET_LUFS", "-18"))
+MIX_TARGET_LUFS = float(os.getenv("MIX_TARGET_LUFS", "-16"))
+MIX_TRUE_PEAK = float(os.getenv("MIX_TRUE_PEAK", "-1.5"))
+# Ducking: ngưỡng sidechain thấp hơn loudness của voice (sau gain) N dB
+DUCK_THRESHOLD_BELOW_DB = float(os.getenv("DUCK_THRESHOLD_BELOW_DB", "10"))
+
 def ensure_ffmpeg_on_path():
     try:
         ff = get_ffmpeg_bin()
@@ -89,12 +119,13 @@ def write_ass(
     outlinecol="&H00000000&",  # black
     backcol="&H60000000&",      # box ~62% opaque black
     outline: int = 1,
+    play_res: Tuple[int, int] = (1080, 1920),
 ):
     header = f"""[Script Info]
 ScriptType: v4.00+
 Collisions: Normal
-PlayResX: 1080
-PlayResY: 1920
+PlayResX: {play_res[0]}
+PlayResY: {play_res[1]}
 WrapStyle: 2
 
 [V4+ Styles]
@@ -138,14 +169,14 @@ def split_long_line(text: str, max_len: int = 36, max_lines: int = 2) -> str:
 
 
 # --- probe video size to scale font/margins
-def ffprobe_size(path: str) -> tuple[int, int]:
+async def ffprobe_size(path: str) -> tuple[int, int]:
     try:
-        r = subprocess.run(
+        r = await run_process(
             [get_ffprobe_bin(), "-v", "error",
              "-select_streams", "v:0",
              "-show_entries", "stream=width,height",
              "-of", "csv=p=0:s=x", path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False
+            timeout=FFPROBE_TIMEOUT,
         )
         w, h = r.stdout.strip().split("x")
         return int(w), int(h)
@@ -183,17 +214,39 @@ def regroup_segments_by_words(ws_segments, max_chars=36, max_dur=2.8):
 
 
 # --- create clean mono 16k WAV to improve ASR
-def preprocess_audio(src_path: str, out_wav: str):
+def preprocess_audio(src_path: str, out_wav: str, cancel_event: Optional[threading.Event] = None):
+    # Gain tuyến tính từ lần đo loudness đã cache; chưa đo được -> loudnorm một pass như cũ
+    gain = linear_gain_db(
+        loudness.analyze_blocking(get_ffmpeg_bin(), src_path, cancel_event), ASR_TARGET_LUFS, MIX_TRUE_PEAK
+    )
+    # Mức lọc nhiễu theo SNR ước lượng trên vài giây đầu (afftdn chỉ khi thật sự nhiễu)
+    snr = audio_cleanup.estimate(get_ffmpeg_bin(), src_path, cancel_event)
+    profile = audio_cleanup.choose_profile(snr)
+    filters = audio_cleanup.cleanup_filters(profile, snr, gain or 0.0)
+    if gain is None:
+        filters.append(f"loudnorm=I={ASR_TARGET_LUFS}:TP=-1.5:LRA=11")
+    else:
+        filters.insert(0, f"volume={gain}dB")
+    af = ",".join(filters) or "anull"
+    print(f"[preprocess_audio] SNR {snr and snr['snr_db']} dB -> profile '{profile}'")
+    trace_event("audio_cleanup", profile=profile, gain_db=gain, filters=af, **(snr or {}))
     cmd = [
         get_ffmpeg_bin(), "-y", "-loglevel", "error",
         "-i", src_path,
         "-vn",
-        "-af", "highpass=f=180,lowpass=f=6500,afftdn=nf=-20,loudnorm=I=-18:TP=-1.5:LRA=11",
+        "-af", af,
         "-ac", "1", "-ar", "16000",
         "-c:a", "pcm_s16le",
         out_wav
     ]
-    subprocess.run(cmd, check=True)
+    # Chạy trong worker thread của transcribe_to_srt (cùng thread với Whisper)
+    run_process_blocking(cmd, cancel_event=cancel_event, check=True)
+
+
+def _until_cancelled(segments, cancel_event: Optional[threading.Event]):
+    for seg in segments:
+        raise_if_cancelled(cancel_event)
+        yield seg
 
 
 def transcribe_to_srt(
@@ -202,7 +255,9 @@ def transcribe_to_srt(
     language: Optional[str] = None,
     model_size: str = "base",
     compute_type: str = "int8",
+    cancel_event: Optional[threading.Event] = None,
 ) -> List[Tuple[int, float, float, str]]:
+    """`cancel_event` (job bị hủy) được kiểm tra giữa các segment Whisper."""
     ensure_ffmpeg_on_path()
 
     try:
@@ -214,21 +269,23 @@ def transcribe_to_srt(
     from faster_whisper import WhisperModel
 
     prefer = os.getenv("WHISPER_MODEL")
+    # Chế độ chunked: nhiều thread transcribe song song trên cùng model
+    model_kw = whisper_chunks.model_kwargs()
     try:
         if prefer:
             model = WhisperModel(prefer, device=("cuda" if _has_cuda else "cpu"),
-                                 compute_type=("float16" if _has_cuda else compute_type))
+                                 compute_type=("float16" if _has_cuda else compute_type), **model_kw)
         elif _has_cuda:
             try:
-                model = WhisperModel("large-v3", device="cuda", compute_type="float16")
+                model = WhisperModel("large-v3", device="cuda", compute_type="float16", **model_kw)
             except Exception:
-                model = WhisperModel("medium", device="cuda", compute_type="float16")
+                model = WhisperModel("medium", device="cuda", compute_type="float16", **model_kw)
         else:
-            model = WhisperModel("medium", device="cpu", compute_type=compute_type)
+            model = WhisperModel("medium", device="cpu", compute_type=compute_type, **model_kw)
         _ = model.transcribe(audio=video_path, language=language or "vi",
                              vad_filter=True, beam_size=1, best_of=1)
     except Exception:
-        model = WhisperModel(model_size, device="cpu", compute_type=compute_type)
+        model = WhisperModel(model_size, device="cpu", compute_type=compute_type, **model_kw)
 
     # --- SỬA LỖI LOGIC: ---
     # Toàn bộ logic xử lý (preprocess, transcribe, regroup)
@@ -236,14 +293,12 @@ def transcribe_to_srt(
     # để file `clean_wav` không bị xóa quá sớm.
     with tempfile.TemporaryDirectory() as _tmp:
         clean_wav = str(Path(_tmp) / "clean.wav")
-        preprocess_audio(video_path, clean_wav)
+        preprocess_audio(video_path, clean_wav, cancel_event=cancel_event)
+        raise_if_cancelled(cancel_event)
 
-        segments_gen, _info = model.transcribe(
-            audio=clean_wav,
+        decode_kw = dict(
             language=language or "vi",
             task="transcribe",
-            vad_filter=True,
-            vad_parameters=dict(min_silence_duration_ms=260),
             word_timestamps=True,
             temperature=[0.0, 0.2, 0.4],
             compression_ratio_threshold=2.4,
@@ -253,7 +308,33 @@ def transcribe_to_srt(
             initial_prompt="Tiếng Việt có dấu, đọc số liệu chính xác, không thêm từ thừa."
         )
 
-        segs = regroup_segments_by_words(segments_gen, max_chars=36, max_dur=2.8)
+        audio = None
+        if whisper_chunks.CHUNKED_WHISPER:
+            from faster_whisper.audio import decode_audio
+            audio = decode_audio(clean_wav, sampling_rate=whisper_chunks.SAMPLE_RATE)
+        duration = len(audio) / whisper_chunks.SAMPLE_RATE if audio is not None else 0.0
+
+        if audio is not None and whisper_chunks.enabled(duration):
+            # VAD một lần -> chunk 30–60 s cắt ở khoảng lặng -> transcribe song song, cộng offset
+            started = time.perf_counter()
+            chunks = whisper_chunks.plan_chunks(whisper_chunks.speech_spans(audio, 260), duration)
+            raw_segments = whisper_chunks.transcribe_chunks(model, audio, chunks, cancel_event, **decode_kw)
+            raise_if_cancelled(cancel_event)
+            elapsed = round(time.perf_counter() - started, 2)
+            print(f"[transcribe] {len(chunks)} chunk, {whisper_chunks.WHISPER_WORKERS} worker, {elapsed}s")
+            trace_event("transcribe", mode="chunked", audio_sec=round(duration, 1), chunks=len(chunks),
+                        workers=whisper_chunks.WHISPER_WORKERS, elapsed_sec=elapsed)
+        else:
+            segments_gen, _info = model.transcribe(
+                audio=clean_wav,
+                vad_filter=True,
+                vad_parameters=dict(min_silence_duration_ms=260),
+                **decode_kw,
+            )
+            # segments_gen là generator: Whisper giải mã dần khi được đọc tới
+            raw_segments = _until_cancelled(segments_gen, cancel_event)
+
+        segs = regroup_segments_by_words(raw_segments, max_chars=36, max_dur=2.8)
         write_srt(segs, srt_path)  # keep an SRT for debugging/soft-sub
         return segs
     # --- KẾT THÚC SỬA LỖI ---
@@ -265,9 +346,9 @@ def safe_quote(path: str) -> str:
 
 
 # ---- FFprobe helpers ----
-def _ffprobe_select(path: str, stream_type: str) -> bool:
+async def _ffprobe_select(path: str, stream_type: str) -> bool:
     try:
-        r = subprocess.run(
+        r = await run_process(
             [
                 get_ffprobe_bin(), "-v", "error",
                 "-select_streams", f"{stream_type}:0",
@@ -275,24 +356,24 @@ def _ffprobe_select(path: str, stream_type: str) -> bool:
                 "-of", "default=nw=1:nk=1",
                 path,
             ],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False,
+            timeout=FFPROBE_TIMEOUT,
         )
         return r.stdout.strip() != ""
     except Exception:
         return False
 
-def has_video(path: str) -> bool:
-    return _ffprobe_select(path, "v")
+async def has_video(path: str) -> bool:
+    return await _ffprobe_select(path, "v")
 
-def has_audio(path: str) -> bool:
-    return _ffprobe_select(path, "a")
+async def has_audio(path: str) -> bool:
+    return await _ffprobe_select(path, "a")
 
-def ffprobe_duration(path: str) -> float:
+async def ffprobe_duration(path: str) -> float:
     try:
-        r = subprocess.run(
+        r = await run_process(
             [get_ffprobe_bin(), "-v", "error", "-show_entries", "format=duration",
              "-of", "default=nw=1:nk=1", path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False
+            timeout=FFPROBE_TIMEOUT,
         )
         return float(r.stdout.strip())
     except Exception:
@@ -316,7 +397,7 @@ def _has_mp4_magic(path: str) -> bool:
     except Exception:
         return False
 
-def try_rewrap_mp4(input_path: str, output_path: str) -> bool:
+async def try_rewrap_mp4(input_path: str, output_path: str) -> bool:
     cmd = [
         get_ffmpeg_bin(), "-y", "-loglevel", "error",
         "-analyzeduration", "200M", "-probesize", "200M",
@@ -326,12 +407,12 @@ def try_rewrap_mp4(input_path: str, output_path: str) -> bool:
         "-movflags", "+faststart",
         output_path
     ]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    proc = await run_process(cmd, capture_stdout=False)
     return proc.returncode == 0
 
 
-def synthesize_black_video_with_audio(audio_src: str, out_path: str, width=1080, height=1080, fps=30):
-    dur = ffprobe_duration(audio_src)
+async def synthesize_black_video_with_audio(audio_src: str, out_path: str, width=1080, height=1080, fps=30):
+    dur = await ffprobe_duration(audio_src)
     cmd = [get_ffmpeg_bin(), "-y", "-loglevel", "error", "-stats", "-f", "lavfi"]
     if dur > 0:
         cmd += ["-t", f"{dur}"]
@@ -343,10 +424,10 @@ def synthesize_black_video_with_audio(audio_src: str, out_path: str, width=1080,
         "-c:a", "aac", "-b:a", "192k",
         "-shortest", out_path
     ]
-    run_ffmpeg(cmd)
+    await run_ffmpeg(cmd)
 
-def synthesize_silence_for_video(video_src: str, out_path: str, sr=48000):
-    dur = ffprobe_duration(video_src)
+async def synthesize_silence_for_video(video_src: str, out_path: str, sr=48000):
+    dur = await ffprobe_duration(video_src)
     cmd = [get_ffmpeg_bin(), "-y", "-loglevel", "error", "-stats", "-i", video_src, "-f", "lavfi"]
     if dur > 0:
         cmd += ["-t", f"{dur}"]
@@ -358,52 +439,136 @@ def synthesize_silence_for_video(video_src: str, out_path: str, sr=48000):
         "-c:a", "aac", "-b:a", "192k",
         out_path
     ]
-    run_ffmpeg(cmd)
+    await run_ffmpeg(cmd)
 
 
-def run_ffmpeg(cmd: list) -> None:
+async def run_ffmpeg(cmd: list, timeout: Optional[float] = None) -> None:
     if cmd and Path(cmd[0]).name.lower() in ("ffmpeg", "ffmpeg.exe"):
         cmd[0] = get_ffmpeg_bin()
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
+    proc = await run_process(cmd, timeout=timeout, capture_stdout=False)
+    print(f"[ffmpeg] {proc.summary()}")
+    if not proc.ok:
+        reason = "timed out" if proc.timed_out else f"code {proc.returncode}"
         raise RuntimeError(
-            f"FFmpeg failed (code {proc.returncode}).\nBIN: {cmd[0]}\nCMD: {' '.join(cmd)}\n\nSTDERR:\n{proc.stderr}"
+            f"FFmpeg failed ({reason}).\nBIN: {cmd[0]}\nCMD: {' '.join(cmd)}\n\nSTDERR:\n{proc.stderr}"
         )
 
 # Load your service account JSON
 sheet_id = "1hcFoYNhmJdizx5s2id8gl_iPz_74fp5cZYz0I1bAJH8"
 SERVICE_ACCOUNT_FILE = "C:\\Users\\tt\\Downloads\\ati-demo-472613-ab3aec4504a0.json"
 
-def append_dropbox_link_to_sheet(sheet_id: str, dropbox_link: str, column_name: str = "Dropbox link"):
+# =============================
+# DROPBOX LINK -> GOOGLE SHEET
+# =============================
+# Client gspread_asyncio dùng chung (app.state.gc) + event loop chính, được gán trong
+# lifespan của main.py. Các hàm trong file này chạy trong threadpool nên gọi sang loop
+# chính bằng run_coroutine_threadsafe thay vì tự xác thực lại mỗi lần upload.
+_SHARED_GC: Optional[AsyncioGspreadClient] = None
+_MAIN_LOOP: Optional[asyncio.AbstractEventLoop] = None
+# (sheet_id, column_name, "async"|"sync") -> {"ws", "col", "next_row"}: vị trí cột + hàng trống kế tiếp
+_DROPBOX_SHEET_CACHE: Dict[Tuple[str, str, str], Dict] = {}
+_DROPBOX_SHEET_LOCK = threading.Lock()
+_FALLBACK_GC = None
+
+
+def _invalidate_dropbox_sheet_cache(spreadsheet_id: str, title: str) -> None:
     """
-    Append Dropbox link to a Google Sheet row matching the video name.
+    Write listener: app vừa ghi vào tab (export/upsert, archive xóa hàng...) -> hàng trống
+    đã cache có thể sai, lần upload sau dò lại. Không lấy _DROPBOX_SHEET_LOCK: listener chạy
+    trên loop chính, trong khi thread giữ lock có thể đang chờ chính loop đó.
     """
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=scopes)
-    gc = gspread.authorize(creds)
- # Open sheet
-    sh = gc.open_by_key(sheet_id)
-    worksheet = sh.sheet1  # or specify worksheet name
-
-    # Ensure header row exists
-    headers = worksheet.row_values(1)
-    if not headers:
-        worksheet.update_cell(1, 1, column_name)
-        headers = [column_name]
-
-    # Find or create Dropbox column
-    if column_name not in headers:
-        worksheet.update_cell(1, len(headers) + 1, column_name)
-        col_index = len(headers) + 1
-    else:
-        col_index = headers.index(column_name) + 1
+    for key, entry in list(_DROPBOX_SHEET_CACHE.items()):
+        if key[0] == spreadsheet_id and getattr(entry["ws"], "title", title) == title:
+            _DROPBOX_SHEET_CACHE.pop(key, None)
+
 
-    # Find next empty row
-    next_row = len(worksheet.col_values(col_index)) + 1
+add_write_listener(_invalidate_dropbox_sheet_cache)
 
-    # Append Dropbox link
-    worksheet.update_cell(next_row, col_index, dropbox_link)
-    print(f"✅ Added Dropbox link to sheet at row {next_row}, column '{column_name}'.")
+
+def bind_sheet_client(gc: Optional[AsyncioGspreadClient], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Gắn client dùng chung (gọi một lần trong lifespan)."""
+    global _SHARED_GC, _MAIN_LOOP
+    _SHARED_GC, _MAIN_LOOP = gc, loop
+
+
+async def _append_dropbox_link_async(gc: AsyncioGspreadClient, sheet_id: str, dropbox_link: str, column_name: str):
+    key = (sheet_id, column_name, "async")
+    entry = _DROPBOX_SHEET_CACHE.get(key)
+    if entry is None:
+        # Lần đầu: tìm/tạo cột + hàng trống kế tiếp (2 lần đọc), sau đó chỉ còn 1 lần ghi/upload
+        sh = await gc.open_by_key(sheet_id)
+        ws = await sh.get_sheet1()
+        headers = await ws.row_values(1)
+        if column_name in headers:
+            col_index = headers.index(column_name) + 1
+        else:
+            col_index = len(headers) + 1
+            await ws.update_cell(1, col_index, column_name)
+        next_row = len(await ws.col_values(col_index)) + 1
+        entry = {"ws": ws, "col": col_index, "next_row": max(next_row, 2)}
+        _DROPBOX_SHEET_CACHE[key] = entry
+
+    row = entry["next_row"]
+    entry["next_row"] = row + 1
+    try:
+        await entry["ws"].update_cell(row, entry["col"], dropbox_link)
+    except Exception:
+        # Vị trí cache có thể đã sai (sheet bị sửa tay) -> lần sau dò lại
+        _DROPBOX_SHEET_CACHE.pop(key, None)
+        raise
+    print(f"✅ Added Dropbox link to sheet at row {row}, column '{column_name}'.")
+
+
+def _append_dropbox_link_sync(sheet_id: str, dropbox_link: str, column_name: str):
+    """Fallback khi không có client dùng chung (chạy script riêng lẻ): xác thực một lần, cache vị trí."""
+    global _FALLBACK_GC
+    if _FALLBACK_GC is None:
+        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+        creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=scopes)
+        _FALLBACK_GC = gspread.authorize(creds)
+    key = (sheet_id, column_name, "sync")
+    entry = _DROPBOX_SHEET_CACHE.get(key)
+    if entry is None:
+        sh = call_with_quota(_FALLBACK_GC.open_by_key, sheet_id)
+        ws = sh.sheet1
+        headers = call_with_quota(ws.row_values, 1)
+        if column_name in headers:
+            col_index = headers.index(column_name) + 1
+        else:
+            col_index = len(headers) + 1
+            call_with_quota(ws.update_cell, 1, col_index, column_name)
+        next_row = len(call_with_quota(ws.col_values, col_index)) + 1
+        entry = {"ws": ws, "col": col_index, "next_row": max(next_row, 2)}
+        _DROPBOX_SHEET_CACHE[key] = entry
+
+    row = entry["next_row"]
+    entry["next_row"] = row + 1
+    try:
+        call_with_quota(entry["ws"].update_cell, row, entry["col"], dropbox_link)
+    except Exception:
+        _DROPBOX_SHEET_CACHE.pop(key, None)
+        raise
+    print(f"✅ Added Dropbox link to sheet at row {row}, column '{column_name}'.")
+
+
+def append_dropbox_link_to_sheet(sheet_id: str, dropbox_link: str, column_name: str = "Dropbox link"):
+    """
+    Append Dropbox link to the next empty row of `column_name` (sheet1).
+    Dùng client async dùng chung nếu có; vị trí cột/hàng được cache nên mỗi upload chỉ tốn 1 lần ghi.
+    """
+    with _DROPBOX_SHEET_LOCK:
+        loop = _MAIN_LOOP
+        on_main_loop = False
+        try:
+            on_main_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            pass
+        if _SHARED_GC is not None and loop is not None and loop.is_running() and not on_main_loop:
+            future = asyncio.run_coroutine_threadsafe(
+                _append_dropbox_link_async(_SHARED_GC, sheet_id, dropbox_link, column_name), loop
+            )
+            return future.result(timeout=120)
+        return _append_dropbox_link_sync(sheet_id, dropbox_link, column_name)
 
 # Hardcode your Dropbox access token
 # Thay dropbox token của bạn vào đây
@@ -428,7 +593,99 @@ def upload_to_dropbox(local_file_path: str, dropbox_path: str = DROPBOX_UPLOAD_P
 
 ### Add subtitle and BGM ###
 
-def auto_subtitle_and_bgm(
+async def _transcribe_cached(
+    source_path: str,
+    video_path: str,
+    srt_path: str,
+    language: Optional[str],
+    cancel_event: Optional[threading.Event],
+) -> List[Tuple[int, float, float, str]]:
+    """Phụ đề Whisper cache theo file nguồn + ngôn ngữ: preview và bản cuối chỉ transcribe một lần."""
+    key = render_cache.cache_key(
+        "cues",
+        source=await run_in_threadpool(render_cache.fingerprint, source_path),
+        language=language or "vi",
+        model=os.getenv("WHISPER_MODEL") or "",
+    )
+    cues = render_cache.get_cues(key)
+    if cues:
+        print("[auto_subtitle] Dùng lại phụ đề đã transcribe (cache).")
+        write_srt(cues, srt_path)
+        return cues
+    cues = await run_in_threadpool(
+        transcribe_to_srt, video_path, srt_path, language=language, cancel_event=cancel_event
+    )
+    render_cache.put_cues(key, cues)
+    return cues
+
+async def _render_profiles(
+    cmd: List[str],
+    filter_parts: List[str],
+    audio_label: Optional[str],
+    profiles: Sequence[OutputProfile],
+    *,
+    cues: List[Tuple[int, float, float, str]],
+    ass_style: Dict,
+    src_size: Tuple[int, int],
+    tmp: str,
+    output_path: str,
+    flip_video: bool,
+    burn_in: bool,
+    srt_index: int,
+    crf: int,
+    preset: str,
+    preview: bool,
+) -> Dict[str, str]:
+    """
+    Một lệnh ffmpeg cho N profile: [0:v] (hflip) -> split=N -> scale/crop|pad + phụ đề riêng,
+    audio đã mix -> asplit=N; mỗi profile một output/encode. Trả {profile.key: path}.
+    """
+    n = len(profiles)
+    parts = list(filter_parts)
+    branches = [f"[vs{i}]" for i in range(n)]
+    parts.append(f"[0:v:0]{'hflip,' if flip_video else ''}split={n}{''.join(branches)}")
+    audio_labels: List[Optional[str]] = [audio_label] * n
+    if audio_label and n > 1:
+        audio_labels = [f"[as{i}]" for i in range(n)]
+        parts.append(f"{audio_label}asplit={n}{''.join(audio_labels)}")
+
+    out_base = Path(output_path)
+    suffix = ".mp4" if burn_in else ".mkv"
+    outputs: Dict[str, str] = {}
+    out_args: List[str] = []
+    for i, profile in enumerate(profiles):
+        w, h = profile.frame_size(PREVIEW_HEIGHT if preview else None)
+        chain = [profile.video_filter(w, h)]
+        if burn_in:
+            ass_i = str(Path(tmp) / f"subs_{profile.slug}.ass")
+            write_ass(cues, ass_i, **{**ass_style, **profile.subtitle_layout(*src_size)})
+            chain.append(f"subtitles='{safe_quote(ass_i)}'")
+        parts.append(f"{branches[i]}{','.join(chain)}[v{i}]")
+
+        out_i = str(out_base.with_name(f"{out_base.stem}_{profile.slug}{suffix}"))
+        out_args += ["-map", f"[v{i}]"]
+        out_args += ["-map", audio_labels[i]] if audio_labels[i] else ["-an"]
+        if not burn_in:
+            out_args += ["-map", f"{srt_index}:0", "-c:s", "srt"]
+        if preview:
+            out_args += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", str(PREVIEW_CRF),
+                         "-maxrate", PREVIEW_MAXRATE, "-bufsize", PREVIEW_MAXRATE]
+        else:
+            out_args += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf)]
+        out_args += ["-pix_fmt", "yuv420p"]
+        if audio_labels[i]:
+            out_args += ["-c:a", "aac", "-b:a", "96k" if preview else "192k"]
+        out_args += ["-shortest", out_i]
+        outputs[profile.key] = out_i
+
+    await run_ffmpeg(cmd + ["-filter_complex", ";".join(parts)] + out_args)
+    for out_i in outputs.values():
+        if not Path(out_i).exists() or Path(out_i).stat().st_size == 0:
+            raise RuntimeError(f"FFmpeg command finished but output file is missing or empty: {out_i}")
+    print(f"[auto_subtitle] Đã render {n} profile trong một lần decode: {', '.join(outputs)}")
+    return outputs
+
+async def auto_subtitle_and_bgm(
     video_path: str,
     output_path: str,
     bgm_path: Optional[str] = None,
@@ -444,14 +701,27 @@ def auto_subtitle_and_bgm(
     duck_release_ms: int = 250,
     remove_original_audio: bool = False,
     flip_video: bool = False,
-    do_upload: bool = True
-) -> str:
-    """Generate subtitles and optionally mix or replace background music."""
+    do_upload: bool = True,
+    chunked: Optional[bool] = None,
+    preview: bool = False,
+    profiles: Optional[Sequence[OutputProfile]] = None,
+) -> Union[str, Dict[str, str]]:
+    """
+    Generate subtitles and optionally mix or replace background music.
+    `chunked`: encode video theo đoạn song song (None = theo MFA_CHUNKED_RENDER).
+    `preview`: bản xem trước PREVIEW_HEIGHT p, preset ultrafast (cùng filter graph với bản cuối).
+    `profiles`: render nhiều khung hình (9:16, 1:1, ...) từ một lần decode; khi đó trả
+    dict {profile.key: path} (tên file = stem của output_path + _<profile>) và không upload.
+    """
     ensure_ffmpeg_on_path()
+    # Cờ hủy của job (DELETE /process/{job_id}) để Whisper trong threadpool dừng giữa chừng
+    cancel_event = current_cancel_event()
 
     video_path = str(Path(video_path).resolve())
     output_path = str(Path(output_path).resolve())
     os.makedirs(Path(output_path).parent, exist_ok=True)
+    # File nguồn trước khi sửa/tổng hợp (khóa cache phụ đề)
+    source_path = video_path
 
     with tempfile.TemporaryDirectory() as tmp:
         # --- Validate / repair ---
@@ -461,24 +731,24 @@ def auto_subtitle_and_bgm(
             raise RuntimeError("Downloaded file is empty or missing.")
         if _looks_like_html(video_path):
             raise RuntimeError("Downloaded file appears to be HTML (not media).")
-        v_has_video = has_video(video_path)
-        v_has_audio = has_audio(video_path)
+        v_has_video = await has_video(video_path)
+        v_has_audio = await has_audio(video_path)
         if not (v_has_video or v_has_audio):
             repaired = str(Path(tmp) / "rewrap.mp4")
-            if try_rewrap_mp4(video_path, repaired):
+            if await try_rewrap_mp4(video_path, repaired):
                 video_path = repaired
-                v_has_video = has_video(video_path)
-                v_has_audio = has_audio(video_path)
+                v_has_video = await has_video(video_path)
+                v_has_audio = await has_audio(video_path)
         if not (v_has_video or v_has_audio):
             raise RuntimeError("Input has no detectable streams.")
         if not v_has_video and v_has_audio:
             synth_path = str(Path(tmp) / "av_input.mp4")
-            synthesize_black_video_with_audio(video_path, synth_path)
+            await synthesize_black_video_with_audio(video_path, synth_path)
             video_path = synth_path
             v_has_video = v_has_audio = True
         elif v_has_video and not v_has_audio and not bgm_path:
             synth_path = str(Path(tmp) / "va_input.mp4")
-            synthesize_silence_for_video(video_path, synth_path)
+            await synthesize_silence_for_video(video_path, synth_path)
             video_path = synth_path
             v_has_video = v_has_audio = True
 
@@ -508,29 +778,29 @@ def auto_subtitle_and_bgm(
 
             except Exception as e_parse:
                 print(f"LỖI parse segments_json: {e_parse}. Sẽ chạy transcription lại (Fallback).")
-                cues = transcribe_to_srt(video_path, srt_path, language=language)
+                cues = await _transcribe_cached(source_path, video_path, srt_path, language, cancel_event)
         
         else:
             # Logic cũ: Chạy transcription nếu không có segments_json
             print("[auto_subtitle] Không có segments_json, chạy transcription mới...")
-            cues = transcribe_to_srt(video_path, srt_path, language=language)
+            cues = await _transcribe_cached(source_path, video_path, srt_path, language, cancel_event)
         # --- KẾT THÚC SỬA ĐỔI ---
 
         # --- Build ASS subtitles (for hardsub) ---
         # (Khối này giữ nguyên, nó sẽ dùng 'cues' (đã sửa hoặc thô) từ bước trên)
-        vw, vh = ffprobe_size(video_path)
+        vw, vh = await ffprobe_size(video_path)
         dyn_font = max(34, min(65, int(round(vh * 0.060))))
         dyn_margin_v = max(80, int(round(vh * 0.09)))
         dyn_margin_h = max(40, int(round(vw * 0.05)))
         ass_path = str(Path(tmp) / "subs.ass")
-        write_ass(
-            cues, ass_path,
+        ass_style = dict(
             fontsize=dyn_font, margin_v=dyn_margin_v, margin_h=dyn_margin_h,
             primary="&H00FFFFFF&", # Màu trắng (như bạn đã sửa)
             outlinecol="&H00000000&",
             backcol="&H50000000&",
             outline=3
         )
+        write_ass(cues, ass_path, **ass_style)
 
         # === PHẦN SỬA LỖI BẮT ĐẦU TỪ ĐÂY ===
         
@@ -538,15 +808,23 @@ def auto_subtitle_and_bgm(
         cmd = [get_ffmpeg_bin(), "-y", "-loglevel", "error", "-stats", "-i", video_path]
 
         used_bgm = False
-        vid_dur = ffprobe_duration(video_path)
+        vid_dur = await ffprobe_duration(video_path)
         bgm_is_looped = False # Khởi tạo biến
 
+        # Track của thư viện BGM đã là 48 kHz stereo và có sẵn độ dài -> bỏ ffprobe/aformat/aresample
+        bgm_head = "[1:a]aformat=channel_layouts=stereo,aresample=48000"
+        bgm_track: Optional[Dict] = None
         if bgm_path:
             bgm_path = str(Path(bgm_path).resolve())
-            try:
-                bgm_dur = ffprobe_duration(bgm_path)
-            except Exception:
-                bgm_dur = 0.0
+            bgm_track = bgm_library.track_for_path(bgm_path)
+            if bgm_track:
+                bgm_dur = float(bgm_track.get("duration_sec") or 0.0)
+                bgm_head = "[1:a]anull"
+            else:
+                try:
+                    bgm_dur = await ffprobe_duration(bgm_path)
+                except Exception:
+                    bgm_dur = 0.0
 
             if bgm_dur and vid_dur and (bgm_dur + 0.5) < vid_dur:
                 cmd += ["-stream_loop", "-1", "-i", bgm_path]
@@ -563,15 +841,40 @@ def auto_subtitle_and_bgm(
         filter_complex_parts = []
         out_audio_label: Optional[str] = None
         
+        # Loudness đo một lần cho mỗi nguồn (cache; track thư viện đã có sẵn) -> gain tuyến tính.
+        # Chưa đo được thì giữ các hệ số cố định cũ.
+        voice_vol = "1.5"
+        if v_has_audio and not remove_original_audio:
+            voice_measured = await loudness.analyze(get_ffmpeg_bin(), video_path)
+            voice_gain = linear_gain_db(voice_measured, MIX_TARGET_LUFS, MIX_TRUE_PEAK)
+            if voice_gain is not None:
+                voice_vol = f"{voice_gain}dB"
+                # Ngưỡng ducking (biên độ tuyến tính trên sidechain = voice sau gain) theo mức
+                # voice thật thay vì hằng số; giới hạn trong khoảng sidechaincompress chấp nhận
+                voice_level = voice_measured["input_i"] + voice_gain
+                duck_threshold = min(1.0, max(0.000976563, 10 ** ((voice_level - DUCK_THRESHOLD_BELOW_DB) / 20)))
+        # makeup của sidechaincompress: hệ số cũ (8, ~+18 dB) chỉ dùng với gain cố định;
+        # khi gain BGM đã tính từ loudness thì không bù thêm, để mức dưới voice đúng như tính
+        duck_makeup = 8
+        bgm_solo_vol = bgm_under_vol = f"{initial_bgm_gain}"
+        if used_bgm:
+            bgm_measured = (bgm_track or {}).get("loudness") or await loudness.analyze(get_ffmpeg_bin(), bgm_path)
+            bgm_gain = linear_gain_db(bgm_measured, MIX_TARGET_LUFS, MIX_TRUE_PEAK)
+            if bgm_gain is not None:
+                # Chỉ có nhạc: đưa về mức mục tiêu; dưới giọng nói: thấp hơn voice theo initial_bgm_gain
+                bgm_solo_vol = f"{bgm_gain}dB"
+                bgm_under_vol = f"{bgm_gain + 20 * math.log10(max(initial_bgm_gain, 1e-3)):.2f}dB"
+                duck_makeup = 1
+
         # Audio logic (Giữ nguyên, chỉ sửa `volume=1` thành `volume=1.5`)
         if remove_original_audio:
             if used_bgm:
-                bgm_chain = "[1:a]aformat=channel_layouts=stereo,aresample=48000"
+                bgm_chain = bgm_head
                 if vid_dur and bgm_is_looped:
                     bgm_chain += f",atrim=0:{vid_dur:.3f},asetpts=N/SR/TB"
                 fade_out_start = max(0.0, (vid_dur - 0.8)) if vid_dur else 0.0
                 bgm_chain += (
-                    f",volume={initial_bgm_gain},"
+                    f",volume={bgm_solo_vol},"
                     f"afade=t=in:st=0:d=0.8"
                 )
                 if vid_dur:
@@ -584,44 +887,78 @@ def auto_subtitle_and_bgm(
         else:
             if used_bgm and v_has_audio:
                 # [SỬA] Tăng âm lượng voice ở đây
-                voice_chain = "[0:a]aformat=channel_layouts=stereo,aresample=48000,volume=1.5[voice]"
-                bgm_chain = "[1:a]aformat=channel_layouts=stereo,aresample=48000"
+                voice_chain = f"[0:a]aformat=channel_layouts=stereo,aresample=48000,volume={voice_vol}[voice]"
+                bgm_chain = bgm_head
                 if vid_dur and bgm_is_looped:
                     bgm_chain += f",atrim=0:{vid_dur:.3f},asetpts=N/SR/TB"
-                bgm_chain += f",volume={initial_bgm_gain}[bgmv]"
+                bgm_chain += f",volume={bgm_under_vol}[bgmv]"
                 duck = (
                     "[bgmv][voice]sidechaincompress="
-                    f"threshold={duck_threshold}:ratio={duck_ratio}:attack={duck_attack_ms}:"
-                    f"release={duck_release_ms}:makeup=8[ducked]"
+                    f"threshold={duck_threshold:.6f}:ratio={duck_ratio}:attack={duck_attack_ms}:"
+                    f"release={duck_release_ms}:makeup={duck_makeup}[ducked]"
                 )
                 mix = "[voice][ducked]amix=inputs=2:duration=first:weights=1 1,volume=2[aout]"
                 filter_complex_parts.append(";".join([voice_chain, bgm_chain, duck, mix]))
                 out_audio_label = "[aout]"
             elif used_bgm and not v_has_audio:
-                bgm_chain = "[1:a]aformat=channel_layouts=stereo,aresample=48000"
+                bgm_chain = bgm_head
                 if vid_dur and bgm_is_looped:
                     bgm_chain += f",atrim=0:{vid_dur:.3f},asetpts=N/SR/TB"
-                bgm_chain += f",volume={initial_bgm_gain}[aout]"
+                bgm_chain += f",volume={bgm_solo_vol}[aout]"
                 filter_complex_parts.append(bgm_chain)
                 out_audio_label = "[aout]"
             elif not used_bgm and v_has_audio:
                 # [SỬA] Tăng âm lượng voice ở đây (khi không có BGM)
-                voice_chain = "[0:a]aformat=channel_layouts=stereo,aresample=48000,volume=1.5[aout]"
+                voice_chain = f"[0:a]aformat=channel_layouts=stereo,aresample=48000,volume={voice_vol}[aout]"
                 filter_complex_parts.append(voice_chain)
                 out_audio_label = "[aout]"
             else:
                 out_audio_label = None
 
+        if profiles:
+            return await _render_profiles(
+                cmd, filter_complex_parts, out_audio_label, profiles,
+                cues=cues, ass_style=ass_style, src_size=(vw, vh), tmp=tmp,
+                output_path=output_path, flip_video=flip_video, burn_in=burn_in,
+                srt_index=2 if used_bgm else 1, crf=crf, preset=preset, preview=preview,
+            )
+
         # Video filter logic
         video_filters = []
         if flip_video:
             video_filters.append("hflip")
         if burn_in:
             video_filters.append(f"subtitles='{safe_quote(ass_path)}'")
+        if preview:
+            # Thu nhỏ sau cùng: phụ đề vẫn được vẽ ở độ phân giải gốc, vị trí giống bản cuối
+            video_filters.append(f"scale=-2:'min({PREVIEW_HEIGHT},ih)'")
         
         video_filter_string = ",".join(video_filters)
         video_input_label = "0:v:0"
         video_output_label = "[vout]"
+
+        # Chế độ chunked: hình được encode song song theo đoạn (cắt tại keyframe, mỗi đoạn
+        # có file ASS riêng đã trừ offset), rồi nối lại và đưa vào như một input đã encode sẵn.
+        chunked_video: Optional[str] = None
+        if video_filter_string and not preview and chunked_enabled(vid_dur, chunked):
+            spans = plan_spans(vid_dur, await keyframe_times(get_ffprobe_bin(), video_path))
+
+            def vf_for_chunk(i: int, start: float, end: float) -> str:
+                parts = ["hflip"] if flip_video else []
+                if burn_in:
+                    chunk_ass = str(Path(tmp) / f"subs_{i:04d}.ass")
+                    write_ass(offset_cues(cues, start, end), chunk_ass, **ass_style)
+                    parts.append(f"subtitles='{safe_quote(chunk_ass)}'")
+                return ",".join(parts)
+
+            chunked_video = await render_video_chunks(
+                get_ffmpeg_bin(), video_path, spans, tmp, vf_for_chunk, crf, preset
+            )
+            # Input kế tiếp: sau video gốc, BGM (nếu có) và SRT (softsub)
+            chunk_input_index = 1 + int(used_bgm) + int(not burn_in)
+            cmd += ["-i", chunked_video]
+            video_input_label = f"{chunk_input_index}:v:0"
+            video_filter_string = ""
         
         if video_filter_string:
             filter_complex_parts.append(f"[{video_input_label}]{video_filter_string}{video_output_label}")
@@ -650,15 +987,21 @@ def auto_subtitle_and_bgm(
             cmd += ["-map", f"{srt_index}:0"]
 
         # --- [D] XÂY DỰNG CODECS VÀ OUTPUT ---
-        if burn_in or flip_video:
+        if chunked_video:
+            cmd += ["-c:v", "copy"]
+        elif preview:
+            cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", str(PREVIEW_CRF),
+                    "-maxrate", PREVIEW_MAXRATE, "-bufsize", PREVIEW_MAXRATE, "-pix_fmt", "yuv420p"]
+        elif burn_in or flip_video:
             cmd += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf)]
         else:
-             if not output_path.lower().endswith(".mkv"):
-                 output_path = str(Path(output_path).with_suffix(".mkv"))
              cmd += ["-c:v", "copy"]
+        if not burn_in and not output_path.lower().endswith(".mkv"):
+            # Softsub (-c:s srt) cần container mkv
+            output_path = str(Path(output_path).with_suffix(".mkv"))
 
         if out_audio_label:
-            cmd += ["-c:a", "aac", "-b:a", "192k"]
+            cmd += ["-c:a", "aac", "-b:a", "96k" if preview else "192k"]
         
         # [SỬA] Thêm codec subtitle (nếu là softsub)
         if not burn_in:
@@ -668,7 +1011,7 @@ def auto_subtitle_and_bgm(
         
         # === KẾT THÚC PHẦN SỬA LỖI ===
 
-        run_ffmpeg(cmd)
+        await run_ffmpeg(cmd)
         
         if not Path(output_path).exists() or Path(output_path).stat().st_size == 0:
              raise RuntimeError("FFmpeg command finished but output file is missing or empty.")
@@ -676,16 +1019,16 @@ def auto_subtitle_and_bgm(
         # --- Upload logic (Giữ nguyên) ---
         if do_upload:
             try:
-                dropbox_url = upload_to_dropbox(output_path)
+                dropbox_url = await run_in_threadpool(upload_to_dropbox, output_path)
                 print(f"Uploaded to Dropbox: {dropbox_url}")
-                append_dropbox_link_to_sheet(sheet_id, dropbox_url)
+                await run_in_threadpool(append_dropbox_link_to_sheet, sheet_id, dropbox_url)
             except Exception as e_upload:
                 print(f"LỖI (media.py upload): {e_upload}")
 
         return output_path
 # --- Hàm lật video (Giữ nguyên) ---
 
-def flip_video_horizontal(
+async def flip_video_horizontal(
     input_path: str,
     output_path: str,
     crf: int = 23,
@@ -709,13 +1052,13 @@ def flip_video_horizontal(
         str(output_path)
     ]
     
-    run_ffmpeg(cmd)
+    await run_ffmpeg(cmd)
     if do_upload:
         try:
-            dropbox_url = upload_to_dropbox(output_path)
+            dropbox_url = await run_in_threadpool(upload_to_dropbox, output_path)
             print(f"Uploaded to Dropbox: {dropbox_url}")
             # --- APPEND LINK TO GOOGLE SHEET ---
-            append_dropbox_link_to_sheet(sheet_id, dropbox_url)
+            await run_in_threadpool(append_dropbox_link_to_sheet, sheet_id, dropbox_url)
         except Exception as e_upload:
             print(f"LỖI (media.py upload flip): {e_upload}")
 
@@ -728,20 +1071,48 @@ def flip_video_horizontal(
 # --- HÀM MỚI: REMIX VIDEO ---
 # (Thêm hàm này vào cuối file)
 
-def remix_video_by_scenes(
+async def remix_video_by_scenes(
     input_path: str,
     output_path: str,
     scenes_to_keep: List[SceneSegment],
     crf: int = 22,
-    preset: str = "fast"
+    preset: str = "fast",
+    chunked: Optional[bool] = None,
+    stream_copy: bool = False,
 ) -> str:
     """
     Tự động cắt và nối lại video dựa trên danh sách các SceneSegment.
     Sử dụng FFmpeg filter_complex 'concat' để nối cả video và audio.
+    `chunked`: mỗi cảnh encode bằng một tiến trình riêng (None = theo MFA_CHUNKED_RENDER).
+    `stream_copy`: nếu mọi ranh giới cảnh nằm gần keyframe thì cắt bằng `-c copy`, không encode
+    (dùng khi bước sau không đụng tới hình, ví dụ softsub không flip).
     """
     if not scenes_to_keep:
         raise ValueError("Danh sách cảnh (scenes_to_keep) không được rỗng.")
 
+    if stream_copy:
+        spans = snap_spans(
+            [(s.start_sec, s.end_sec) for s in scenes_to_keep],
+            await keyframe_times(get_ffprobe_bin(), str(input_path)),
+            await ffprobe_duration(str(input_path)),
+            REMIX_SNAP_TOLERANCE,
+        )
+        if not spans:
+            print("[remix] Ranh giới cảnh không gần keyframe, encode lại.")
+        else:
+            try:
+                with tempfile.TemporaryDirectory() as tmp:
+                    await copy_spans(get_ffmpeg_bin(), str(input_path), spans, tmp, str(output_path))
+                if Path(output_path).exists() and Path(output_path).stat().st_size > 0:
+                    print(f"[remix] Stream copy {len(spans)} cảnh (đã snap vào keyframe).")
+                    return str(output_path)
+            except RuntimeError as e:
+                print(f"[remix] Stream copy lỗi, encode lại: {e}")
+
+    total = sum(max(0.0, s.end_sec - s.start_sec) for s in scenes_to_keep)
+    if chunked_enabled(total, chunked):
+        return await _remix_video_chunked(input_path, output_path, scenes_to_keep, crf, preset)
+
     filter_parts = []
     stream_labels = []
     
@@ -782,9 +1153,47 @@ def remix_video_by_scenes(
         str(output_path)
     ]
     
-    run_ffmpeg(cmd)
+    await run_ffmpeg(cmd)
     
     if not Path(output_path).exists() or Path(output_path).stat().st_size == 0:
        raise RuntimeError("FFmpeg remix command finished but output file is missing or empty.")
 
-    return str(output_path)
\ No newline at end of file
+    return str(output_path)
+
+
+async def _remix_video_chunked(
+    input_path: str,
+    output_path: str,
+    scenes_to_keep: List[SceneSegment],
+    crf: int,
+    preset: str,
+) -> str:
+    """Remix theo đoạn: mỗi cảnh là một chunk video encode song song, audio cắt/nối một lần."""
+    spans = [(s.start_sec, s.end_sec) for s in scenes_to_keep]
+    with tempfile.TemporaryDirectory() as tmp:
+        joined = await render_video_chunks(
+            get_ffmpeg_bin(), str(input_path), spans, tmp, lambda i, start, end: "", crf, preset
+        )
+        audio_parts = [
+            f"[0:a]atrim={start}:{end},asetpts=PTS-STARTPTS[a{i}]" for i, (start, end) in enumerate(spans)
+        ]
+        labels = "".join(f"[a{i}]" for i in range(len(spans)))
+        audio_parts.append(f"{labels}concat=n={len(spans)}:v=0:a=1[outa]")
+        cmd = [
+            get_ffmpeg_bin(), "-y",
+            "-i", str(input_path),
+            "-i", joined,
+            "-filter_complex", ";".join(audio_parts),
+            "-map", "1:v:0",
+            "-map", "[outa]",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-b:a", "192k",
+            "-shortest",
+            str(output_path)
+        ]
+        await run_ffmpeg(cmd)
+
+    if not Path(output_path).exists() or Path(output_path).stat().st_size == 0:
+        raise RuntimeError("FFmpeg remix command finished but output file is missing or empty.")
+    return str(output_path)
@@ -1,15 +1,177 @@
-from fastapi import APIRouter
+import os
+import json
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from app.services.crawl import smart_fields
-from app.services.nlp import analyze_competitor
+from app.services.crawl import smart_fields, smart_fields_async
+from app.services.nlp import GEMINI_BATCH_SIZE, analyze_competitor, analyze_competitors_async
 
 router = APIRouter()
 
+# Lịch sự với từng domain: tối đa N request đồng thời + khoảng cách tối thiểu giữa 2 lần bắt đầu
+ANALYZE_PER_DOMAIN_LIMIT = int(os.getenv("ANALYZE_PER_DOMAIN_LIMIT", "2"))
+ANALYZE_DOMAIN_DELAY = float(os.getenv("ANALYZE_DOMAIN_DELAY", "0.5"))
+ANALYZE_CRAWL_CONCURRENCY = int(os.getenv("ANALYZE_CRAWL_CONCURRENCY", "8"))
+# Chờ tối đa bao lâu để gom đủ một lô trước khi gọi Gemini
+ANALYZE_BATCH_LINGER = float(os.getenv("ANALYZE_BATCH_LINGER", "1.5"))
+ANALYZE_BATCH_MAX_URLS = int(os.getenv("ANALYZE_BATCH_MAX_URLS", "200"))
+
 class AnalyzeRequest(BaseModel):
     url: HttpUrl
 
+class AnalyzeBatchRequest(BaseModel):
+    urls: List[HttpUrl]
+
 @router.post("/url")
 def analyze_url(payload: AnalyzeRequest):
     fields = smart_fields(str(payload.url))
     insights = analyze_competitor(fields)
     return {"source": str(payload.url), "fields": fields, "insights": insights}
+
+
+def _dedupe_urls(urls: List[str]) -> Tuple[List[str], int]:
+    """Bỏ URL trùng (không phân biệt hoa/thường ở scheme/host, bỏ #fragment), giữ thứ tự."""
+    seen, out = set(), []
+    for u in urls:
+        parts = urlsplit(u.strip())
+        key = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+        if key not in seen:
+            seen.add(key)
+            out.append(u.strip())
+    return out, len(urls) - len(out)
+
+
+class _DomainGate:
+    """Semaphore + giãn cách theo domain (mỗi request /batch có gate riêng)."""
+
+    def __init__(self, limit: int, delay: float):
+        self.limit = limit
+        self.delay = delay
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    def semaphore(self, domain: str) -> asyncio.Semaphore:
+        return self._sems.setdefault(domain, asyncio.Semaphore(self.limit))
+
+    async def wait_turn(self, domain: str):
+        now = time.monotonic()
+        start = max(now, self._next_start.get(domain, 0.0))
+        self._next_start[domain] = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+async def _crawl_all(urls: List[str], ready: asyncio.Queue):
+    gate = _DomainGate(ANALYZE_PER_DOMAIN_LIMIT, ANALYZE_DOMAIN_DELAY)
+    overall = asyncio.Semaphore(ANALYZE_CRAWL_CONCURRENCY)
+
+    async def one(url: str):
+        domain = urlsplit(url).netloc.lower()
+        try:
+            async with gate.semaphore(domain):
+                await gate.wait_turn(domain)
+                async with overall:
+                    fields = await smart_fields_async(url)
+            await ready.put((url, fields, None))
+        except Exception as e:
+            await ready.put((url, None, str(e)))
+
+    await asyncio.gather(*(one(u) for u in urls))
+    await ready.put(None)
+
+
+async def _analyze_batches(ready: asyncio.Queue, results: asyncio.Queue):
+    """Gom các trang đã crawl xong thành lô (tối đa GEMINI_BATCH_SIZE hoặc chờ LINGER giây)."""
+    pending: List[asyncio.Task] = []
+
+    async def analyze(batch: List[Tuple[str, Dict]]):
+        insights = await analyze_competitors_async([f for _, f in batch])
+        for (url, fields), ins in zip(batch, insights):
+            await results.put({"source": url, "fields": fields, "insights": ins})
+
+    try:
+        await _collect(ready, results, pending, analyze)
+    finally:
+        for t in pending:
+            t.cancel()
+    await results.put(None)
+
+
+async def _collect(ready, results, pending, analyze):
+    done = False
+    while not done:
+        batch: List[Tuple[str, Dict]] = []
+        deadline: Optional[float] = None
+        while len(batch) < max(1, GEMINI_BATCH_SIZE):
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(ready.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                done = True
+                break
+            url, fields, error = item
+            if error is not None:
+                await results.put({"source": url, "error": error})
+                continue
+            batch.append((url, fields))
+            if deadline is None:
+                deadline = time.monotonic() + ANALYZE_BATCH_LINGER
+        if batch:
+            pending.append(asyncio.create_task(analyze(batch)))
+    await asyncio.gather(*pending)
+
+
+@router.post("/batch")
+async def analyze_batch(payload: AnalyzeBatchRequest):
+    """
+    Phân tích nhiều URL đối thủ cùng lúc, trả NDJSON (mỗi dòng một URL, theo thứ tự hoàn thành):
+    {"source", "fields", "insights"} hoặc {"source", "error"}; dòng cuối là {"summary": {...}}.
+    Quá ANALYZE_BATCH_MAX_URLS URL (sau khi bỏ trùng) -> 422, không cắt bớt âm thầm.
+    """
+    urls, duplicates = _dedupe_urls([str(u) for u in payload.urls])
+    if len(urls) > ANALYZE_BATCH_MAX_URLS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many URLs: {len(urls)} unique (max {ANALYZE_BATCH_MAX_URLS} per request).",
+        )
+
+    async def stream():
+        ready: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue()
+        workers = [
+            asyncio.create_task(_crawl_all(urls, ready)),
+            asyncio.create_task(_analyze_batches(ready, results)),
+        ]
+        ok = failed = 0
+        started = time.monotonic()
+        try:
+            while True:
+                item = await results.get()
+                if item is None:
+                    break
+                if "error" in item:
+                    failed += 1
+                else:
+                    ok += 1
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            summary = {
+                "total": len(urls),
+                "ok": ok,
+                "failed": failed,
+                "duplicates": duplicates,
+                "elapsed_sec": round(time.monotonic() - started, 2),
+            }
+            yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+        finally:
+            # Client ngắt kết nối giữa chừng -> dừng crawl/phân tích còn lại
+            for w in workers:
+                w.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
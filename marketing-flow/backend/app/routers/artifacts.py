@@ -0,0 +1,27 @@
+# app/routers/artifacts.py
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.artifacts import get_bytes
+
+router = APIRouter()
+
+
+@router.get("/{artifact_id}")
+async def read_artifact(artifact_id: str):
+    """
+    Trả về JSON đầy đủ (transcript, highlights...) của một artifact
+    mà Google Sheet chỉ lưu tham chiếu.
+    """
+    try:
+        raw = await run_in_threadpool(get_bytes, artifact_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Artifact '{artifact_id}' not found.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # Nội dung bất biến (khóa theo hash) -> cho phép cache lâu
+    return Response(
+        content=raw,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
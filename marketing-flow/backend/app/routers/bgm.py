@@ -0,0 +1,59 @@
+# app/routers/bgm.py
+import shutil
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.media import get_ffmpeg_bin, get_ffprobe_bin
+from app.routers.video import _to_public_url
+from app.services import bgm_library
+
+router = APIRouter()
+
+
+def _public(track: Dict) -> Dict:
+    # Không lộ đường dẫn trên server, chỉ trả link /media
+    out = {k: v for k, v in track.items() if k != "path"}
+    out["url"] = _to_public_url(track["path"])
+    return out
+
+
+@router.post("")
+async def upload_bgm(file: UploadFile = File(...), name: Optional[str] = Form(None)):
+    """
+    Thêm nhạc nền vào thư viện. Trùng nội dung với bài đã có -> trả lại track cũ
+    (duplicate=true), không xử lý lại. Job dùng track qua `bgm_id`.
+    """
+    bgm_library.BGM_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = bgm_library.BGM_DIR / f".upload_{uuid4().hex}{Path(file.filename or '').suffix}"
+    try:
+        try:
+            with tmp_path.open("wb") as f:
+                await run_in_threadpool(shutil.copyfileobj, file.file, f)
+        finally:
+            await file.close()
+        track = await bgm_library.add_track(
+            get_ffmpeg_bin(), get_ffprobe_bin(), str(tmp_path), name or Path(file.filename or "bgm").stem
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Không xử lý được file nhạc: {e}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return _public(track)
+
+
+@router.get("")
+async def list_bgm():
+    tracks = await run_in_threadpool(bgm_library.list_tracks)
+    return {"tracks": [_public(t) for t in tracks]}
+
+
+@router.get("/{bgm_id}")
+def get_bgm(bgm_id: str):
+    track = bgm_library.get_track(bgm_id)
+    if not track:
+        raise HTTPException(status_code=404, detail=f"BGM '{bgm_id}' not found.")
+    return _public(track)
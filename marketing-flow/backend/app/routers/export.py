@@ -1,10 +1,12 @@
 # app/routers/export.py
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel
 from gspread_asyncio import AsyncioGspreadClient
 
 # Import các hàm gốc từ service
-from app.services.sheets import export_rows, update_sheet_cell, read_sheet_data
+from app.services.sheets import export_rows, update_sheet_cell
+from app.services.sheet_mirror import mirror
 # Import dependency mới
 from app.dependencies import get_sheet_client
 
@@ -57,17 +59,34 @@ async def update_cell(
 @router.get("/sheet/read")
 async def read_sheet(
     sheet_name: str = Query(..., alias="sheet_name"),
+    max_staleness: Optional[float] = Query(None, ge=0, description="Độ cũ tối đa (giây) của bản sao SQLite; 0 = đọc trực tiếp"),
     gc: AsyncioGspreadClient = Depends(get_sheet_client) # <-- Sửa: Tiêm client
 ):
     """
     Đọc và trả về tất cả dữ liệu từ Google Sheet (dựa theo tên).
+    Dữ liệu được phục vụ từ bản sao SQLite nếu đủ mới.
     """
     try:
-        # Sửa: Dùng await và truyền 'gc'
-        data = await read_sheet_data(gc, SPREADSHEET_ID, sheet_name) 
+        data = await mirror.read(gc, SPREADSHEET_ID, sheet_name, max_staleness=max_staleness)
         return {"ok": True, "data": data}
     except Exception as e:
         # Trả về lỗi 404 nếu không tìm thấy sheet
         if "not found" in str(e).lower():
             raise HTTPException(status_code=404, detail=f"Sheet '{sheet_name}' not found in spreadsheet.")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/sheet/read-many")
+async def read_many_sheets(
+    sheet_names: List[str] = Query(..., alias="sheet_names", description="Lặp lại tham số cho mỗi tab"),
+    max_staleness: Optional[float] = Query(None, ge=0, description="Độ cũ tối đa (giây) của bản sao SQLite; 0 = đọc trực tiếp"),
+    gc: AsyncioGspreadClient = Depends(get_sheet_client)
+):
+    """
+    Đọc nhiều tab cùng lúc (một lần values.batchGet cho các tab chưa có trong bản sao).
+    Trả về {"data": {tab: rows}, "missing": [tab không tồn tại]}.
+    """
+    try:
+        data, missing = await mirror.read_many(gc, SPREADSHEET_ID, sheet_names, max_staleness=max_staleness)
+        return {"ok": True, "data": data, "missing": missing}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
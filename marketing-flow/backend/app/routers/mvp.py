@@ -1,14 +1,17 @@
 # app/routers/mvp.py
 import os
 import json
+import asyncio
+from typing import Dict, List, Tuple
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, HttpUrl
 import google.generativeai as genai
 from google.generativeai import types
 from gspread_asyncio import AsyncioGspreadClient
 
-from app.services.crawl import smart_fields
-from app.services.nlp import analyze_competitor
+from app.services.crawl import smart_fields_async
+from app.services.nlp import GEMINI_BUCKET, analyze_competitors_async
+from app.services.rate_limit import INTERACTIVE, current_priority
 from app.services.sheets import export_rows
 from app.dependencies import get_sheet_client # <-- Sửa 1: Import dependency
 
@@ -57,47 +60,57 @@ def _fallback_draft(keyword: str, platform: str) -> str:
     )
 
 
+async def _crawl_and_analyze(url: str) -> Tuple[Dict, Dict]:
+    """Nhánh 1: URL → crawl + insights (cả hai đều async, không chặn event loop)."""
+    fields = await smart_fields_async(url)
+    insights = (await analyze_competitors_async([fields]))[0]
+    return fields, insights
+
+
+async def _generate_draft(keyword: str, platform: str) -> str:
+    """Nhánh 2: Draft (Gemini or fallback) – không phụ thuộc kết quả crawl."""
+    if os.getenv("MFA_LLM_OFF") == "1" or gemini_model is None:
+        return _fallback_draft(keyword, platform)
+
+    template = (
+        "Generate  1 video caption tailored for me with these requirements:\n"
+            "1. Focus on storytelling, emotional hook, and shareability. Include a clear CTA.\n"
+            "2. Keep it short, aesthetic, and trendy. Use bullet points for value and include 5-10 relevant hashtags.\n"
+            "3. Conversational, punchy, and authentic (text-first vibe). Focus on sparking a discussion or debate.\n"
+            
+        if platform == "page"
+        else "SEO blog outline with H2/H3, meta title (<=60 chars), meta description (<=155 chars)"
+    )
+    prompt = (
+        f"Keyword: {keyword}\n"
+        f"Template: {template}\n"
+        f"Write in Vietnamese. Keep it practical and high-converting."
+    )
+    try:
+        # Dùng chung quota Gemini với phần phân tích insights
+        await GEMINI_BUCKET.acquire(current_priority(INTERACTIVE))
+        resp = await gemini_model.generate_content_async(
+            contents=prompt,
+            generation_config=types.GenerationConfig(
+                temperature=0.3,
+            ),
+        )
+        return resp.text
+    except Exception as e:
+        return _fallback_draft(keyword, platform) + f"\n\n(Note: Fallback due to error: {e})"
+
+
 @router.post("/run")
 # Sửa 4: Chuyển sang 'async def' và tiêm 'gc'
 async def mvp_run(
     req: MVPReq,
     gc: AsyncioGspreadClient = Depends(get_sheet_client)
 ):
-    # 1) URL → crawl + insights
-    fields = smart_fields(str(req.url))
-    insights = analyze_competitor(fields)  # Hàm này đã đúng
-
-
-    # 3) Draft (Gemini or fallback)
-    if os.getenv("MFA_LLM_OFF") == "1" or gemini_model is None:
-        draft = _fallback_draft(req.keyword, req.platform)
-    else:
-        template = (
-            "Generate  1 video caption tailored for me with these requirements:\n"
-                "1. Focus on storytelling, emotional hook, and shareability. Include a clear CTA.\n"
-                "2. Keep it short, aesthetic, and trendy. Use bullet points for value and include 5-10 relevant hashtags.\n"
-                "3. Conversational, punchy, and authentic (text-first vibe). Focus on sparking a discussion or debate.\n"
-                
-            if req.platform == "page"
-            else "SEO blog outline with H2/H3, meta title (<=60 chars), meta description (<=155 chars)"
-        )
-        prompt = (
-            f"Keyword: {req.keyword}\n"
-            f"Template: {template}\n"
-            f"Write in Vietnamese. Keep it practical and high-converting."
-        )
-        try:
-            # Sửa 5: Gọi 'gemini_model.generate_content_async'
-            # (Dùng _async để không block server)
-            resp = await gemini_model.generate_content_async(
-                contents=prompt,
-                generation_config=types.GenerationConfig(
-                    temperature=0.3,
-                ),
-            )
-            draft = resp.text
-        except Exception as e:
-            draft = _fallback_draft(req.keyword, req.platform) + f"\n\n(Note: Fallback due to error: {e})"
+    # 1-3) Crawl + insights chạy song song với tạo draft; độ trễ = nhánh chậm hơn
+    (fields, insights), draft = await asyncio.gather(
+        _crawl_and_analyze(str(req.url)),
+        _generate_draft(req.keyword, req.platform),
+    )
 
     # 4) Build result
     result = {
@@ -108,7 +121,7 @@ async def mvp_run(
         "draft": draft,
     }
 
-    # 5) Auto-export to Google Sheet
+    # 5) Auto-export to Google Sheet (sau khi cả hai nhánh xong)
     try:
         title_str = result.get("fields", {}).get("title", "")
         strengths_str = "\n".join(result.get("insights", {}).get("strengths", []))
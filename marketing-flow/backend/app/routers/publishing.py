@@ -0,0 +1,142 @@
+# app/routers/publishing.py
+from typing import Dict, List, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from gspread_asyncio import AsyncioGspreadClient
+
+from app.dependencies import get_sheet_client
+from app.services.sheet_mirror import READY_COLUMNS, find_header_row, mirror, row_status
+
+router = APIRouter()
+
+SPREADSHEET_ID = "1hcFoYNhmJdizx5s2id8gl_iPz_74fp5cZYz0I1bAJH8"
+SHEET_TITLE = "MVP_Content_Plan"
+
+# status của API -> status lưu trong bản sao (Tab 3: 'ready' vẫn nằm trong danh sách chờ)
+STATUS_GROUPS: Dict[str, Sequence[str]] = {
+    "pending": ("pending", "ready"),
+    "published": ("published",),
+    "error": ("error",),
+}
+# key trong item -> các tên cột chấp nhận (lấy cột đầu tiên có trong header, như row_status)
+CHECK_COLUMNS = {"facebook": ("facebook",), "ig": ("ig",), "ready": READY_COLUMNS, "error": ("error",)}
+LINK_COLUMNS = {"link_fb": ("link facebook",), "link_ig": ("link instagram",)}
+
+
+def _columns(header: List[str]) -> Dict[str, Dict]:
+    """Vị trí (1-based, dùng cho /export/sheet/update-cell) và nhãn của các cột Tab 3 cần."""
+    header_map = {str(h).strip().lower(): i for i, h in enumerate(header)}
+    cols = {}
+    for key, names in {"title": ("keyword",), **CHECK_COLUMNS, **LINK_COLUMNS}.items():
+        idx = next((header_map[n] for n in names if n in header_map), -1)
+        cols[key] = {"col": idx + 1 if idx >= 0 else None, "label": header[idx] if idx >= 0 else names[0]}
+    return cols
+
+
+def _item(row_number: int, row: Sequence[object], cols: Dict[str, Dict], status: str) -> Dict:
+    def val(key: str) -> str:
+        col = cols[key]["col"]
+        if not col or col > len(row):
+            return ""
+        return str(row[col - 1]).strip()
+
+    item = {"row": row_number, "status": status, "title": val("title")}
+    for key in CHECK_COLUMNS:
+        item[key] = val(key).upper() == "TRUE"
+    for key in LINK_COLUMNS:
+        item[key] = val(key)
+    return item
+
+
+def _classify_in_memory(values: List[List[str]]):
+    """Fallback khi tab không được mirror: phân loại trực tiếp trên dữ liệu đã đọc."""
+    header_idx = find_header_row(values)
+    if header_idx < 0:
+        return [], []
+    header = values[header_idx]
+    header_map = {str(h).strip().lower(): i for i, h in enumerate(header)}
+    title_idx = header_map.get("keyword", -1)
+    rows = []
+    for i, row in enumerate(values[header_idx + 1:], start=header_idx + 2):
+        if title_idx < 0 or title_idx >= len(row) or not str(row[title_idx]).strip():
+            continue
+        rows.append({"row_number": i, "data": row, "status": row_status(header_map, row)})
+    return header, rows
+
+
+async def _read_queue_source(gc: AsyncioGspreadClient) -> Optional[List[List[str]]]:
+    """
+    None nếu bản sao đủ mới (chỉ kiểm tra metadata, _queue_page truy vấn SQL theo trang);
+    ngược lại đọc trực tiếp và cập nhật bản sao.
+    """
+    if mirror.is_mirrored(SPREADSHEET_ID, SHEET_TITLE) and await run_in_threadpool(mirror.is_fresh, SHEET_TITLE):
+        return None
+    try:
+        return await mirror.read(gc, SPREADSHEET_ID, SHEET_TITLE)
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=f"Sheet '{SHEET_TITLE}' not found in spreadsheet.")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _queue_page(values: Optional[List[List[str]]], status: str, cursor: Optional[int], page: int, limit: int) -> Dict:
+    statuses = STATUS_GROUPS[status]
+    after_row = cursor or 0
+    offset = 0 if cursor is not None else (page - 1) * limit
+
+    if mirror.is_mirrored(SPREADSHEET_ID, SHEET_TITLE):
+        _, header = await run_in_threadpool(mirror.header, SHEET_TITLE)
+        rows = await run_in_threadpool(
+            mirror.page_rows, SHEET_TITLE, statuses,
+            after_row=after_row, offset=offset, limit=limit + 1,
+        )
+        raw_counts = await run_in_threadpool(mirror.status_counts, SHEET_TITLE)
+    else:
+        header, all_rows = _classify_in_memory(values or [])
+        raw_counts: Dict[str, int] = {}
+        for r in all_rows:
+            raw_counts[r["status"]] = raw_counts.get(r["status"], 0) + 1
+        matching = [r for r in all_rows if r["status"] in statuses and r["row_number"] > after_row]
+        rows = matching[offset:offset + limit + 1]
+
+    if not header:
+        return {"status": status, "items": [], "next_cursor": None, "counts": {}, "columns": {}}
+
+    cols = _columns(header)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    counts = {k: sum(raw_counts.get(s, 0) for s in group) for k, group in STATUS_GROUPS.items()}
+    return {
+        "status": status,
+        "items": [_item(r["row_number"], r["data"], cols, r["status"]) for r in rows],
+        "next_cursor": rows[-1]["row_number"] if has_more and rows else None,
+        "counts": counts,
+        "columns": cols,
+    }
+
+
+@router.get("/queue")
+async def publishing_queue(
+    status: str = Query("pending", pattern="^(pending|published|error)$"),
+    cursor: Optional[int] = Query(None, ge=0, description="row_number của item cuối trang trước"),
+    page: int = Query(1, ge=1, description="Chỉ dùng khi không có cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    gc: AsyncioGspreadClient = Depends(get_sheet_client),
+):
+    """
+    Danh sách đăng tải của `MVP_Content_Plan` đã được phân loại sẵn (pending/published/error),
+    đọc từ bản sao SQLite và phân trang theo cursor (row_number).
+    """
+    values = await _read_queue_source(gc)
+    return await _queue_page(values, status, cursor, page, limit)
+
+
+@router.get("/queues")
+async def publishing_queues(
+    limit: int = Query(50, ge=1, le=200),
+    gc: AsyncioGspreadClient = Depends(get_sheet_client),
+):
+    """Trang đầu của cả 3 danh sách trong MỘT request (một lần đọc bản sao) – dùng khi mở/làm mới Tab 3."""
+    values = await _read_queue_source(gc)
+    return {status: await _queue_page(values, status, None, 1, limit) for status in STATUS_GROUPS}
@@ -6,7 +6,6 @@ import time
 import uuid
 import string
 import pathlib
-import subprocess
 import urllib.parse
 import shutil
 import re
@@ -19,7 +18,8 @@ from fastapi import Depends
 from gspread_asyncio import AsyncioGspreadClient
 from app.dependencies import get_sheet_client
 # [SỬA] Import đúng hàm
-from app.services.sheets import export_rows 
+from app.services.sheets import upsert_rows
+from app.services.sheet_mirror import mirror, normalize_url
 # ----------------------------------------
 
 # --- THIRD-PARTY ---
@@ -35,7 +35,9 @@ from fastapi.concurrency import run_in_threadpool
 
 # --- IMPORTS TỪ PROJECT ---
 from app.media import transcribe_to_srt
+from app.services.process_runner import run_process
 from app.services import nlp
+from app.services import artifacts
 
 # --- PATHS / CONFIG ---
 MEDIA_ROOT = pathlib.Path(os.getenv("MEDIA_ROOT", "media")).resolve()
@@ -324,16 +326,14 @@ def _resolve_ffmpeg_path() -> str:
         return which
     raise HTTPException(500, "FFmpeg not found on PATH and FFMPEG_BIN is not a valid path.")
 
-def _ffmpeg_preflight() -> str:
+async def _ffmpeg_preflight() -> str:
     exe = _resolve_ffmpeg_path()
-    try:
-        out = subprocess.run([exe, "-version"], check=True,
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        return out.stdout.splitlines()[0]
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(500, f"FFmpeg exists but failed: {e.stdout[:300]}")
+    out = await run_process([exe, "-version"], timeout=30)
+    if not out.ok:
+        raise HTTPException(500, f"FFmpeg exists but failed: {out.stderr[:300]}")
+    return out.stdout.splitlines()[0]
 
-def _extract_audio_ffmpeg(video_path: str, out_ext: str = ".mp3", abr: str = "192k") -> str:
+async def _extract_audio_ffmpeg(video_path: str, out_ext: str = ".mp3", abr: str = "192k") -> str:
     exe = _resolve_ffmpeg_path()
     AUDIO_DIR.mkdir(parents=True, exist_ok=True)
     stem = os.path.splitext(os.path.basename(video_path))[0]
@@ -347,14 +347,12 @@ def _extract_audio_ffmpeg(video_path: str, out_ext: str = ".mp3", abr: str = "19
         raise HTTPException(400, f"Unsupported audio extension: {out_ext}. Use .mp3 or .wav")
     cmd += [str(audio_file)]
     try:
-        cmd = [str(c) for c in cmd]
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return str(audio_file)
+        out = await run_process(cmd, capture_stdout=False)
     except FileNotFoundError:
         raise HTTPException(500, f"CreateProcess failed (WinError 2). Tried exe: {exe!r}")
-    except subprocess.CalledProcessError as e:
-        err = e.stderr.decode(errors="ignore") if isinstance(e.stderr, (bytes, bytearray)) else str(e.stderr)
-        raise HTTPException(500, f"ffmpeg audio extract failed: {err[:300]}")
+    if not out.ok:
+        raise HTTPException(500, f"ffmpeg audio extract failed: {out.stderr[:300]}")
+    return str(audio_file)
 
 def _detect_scenes_hsv(path: str, hist_bins: int = 32, diff_thr: float = 0.45, min_gap_frames: int = 10):
     # (Hàm này không thay đổi, giữ nguyên)
@@ -585,10 +583,8 @@ async def viral_analyze(
     dl = await run_in_threadpool(download_video, url=url)
     video_path = dl.saved_path
     
-    await run_in_threadpool(_ffmpeg_preflight)
-    audio_path = await run_in_threadpool(
-        _extract_audio_ffmpeg, video_path, out_ext=audio_ext
-    )
+    await _ffmpeg_preflight()
+    audio_path = await _extract_audio_ffmpeg(video_path, out_ext=audio_ext)
     audio_format = os.path.splitext(audio_path)[1].lstrip(".").lower()
 
     normalized_url_str = _normalize_tiktok_url(str(url))
@@ -693,7 +689,21 @@ async def viral_analyze(
                 "all_segments": stats_all
             }
         }
-        final_json_string = json.dumps(final_json_data, ensure_ascii=False)
+
+        # 4.2. Lưu transcript + highlights vào artifact store (nén, khóa theo hash);
+        #      ô sheet giữ JSON cũ (cho n8n) kèm artifact_id/url tới bản đầy đủ.
+        try:
+            artifact_payload = {
+                "all_segments": final_json_data["all_segments"],
+                "ai_highlights": [s.model_dump() for s in final_ai_highlights],
+                "stats": {"all_segments": stats_all, "ai_highlights": stats_ai},
+            }
+            artifact_id = await run_in_threadpool(artifacts.put_json, artifact_payload)
+            final_json_string = artifacts.sheet_reference(artifact_id, final_json_data)
+            print(f"[viral_analyze] Đã lưu artifact {artifact_id}.")
+        except Exception as e_art:
+            print(f"LỖI (artifact store): {e_art}. Ghi JSON trực tiếp vào sheet.")
+            final_json_string = json.dumps(final_json_data, ensure_ascii=False)
             
         try:
             TARGET_SHEET_TITLE = target_sheet 
@@ -710,16 +720,22 @@ async def viral_analyze(
                 ""
             ]
             
-            print(f"[viral_analyze] Đang append 1 hàng mới vào sheet: {TARGET_SHEET_TITLE}...")
-            await export_rows(
+            # Upsert theo 'Link Video gốc': URL đã phân tích -> cập nhật hàng cũ tại chỗ
+            # (giữ nguyên checkbox + link remix), URL mới -> append.
+            print(f"[viral_analyze] Đang upsert hàng vào sheet: {TARGET_SHEET_TITLE}...")
+            upsert_result = await upsert_rows(
                 gc=gc,
                 spreadsheet_id=SPREADSHEET_ID,
                 title=TARGET_SHEET_TITLE,
-                rows=[new_row_data], 
+                rows=[new_row_data],
                 header_row=HEADER,
-                checkbox_columns=[CHECKBOX_COLUMN_NAME]
+                key_column="Link Video gốc",
+                checkbox_columns=[CHECKBOX_COLUMN_NAME],
+                preserve_columns=[CHECKBOX_COLUMN_NAME, "Remix Video Link"],
+                normalize_key=lambda v: normalize_url(str(v or "")),
+                locate=lambda key: mirror.locate_url(SPREADSHEET_ID, TARGET_SHEET_TITLE, key),
             )
-            print(f"[viral_analyze] Append hàng mới vào sheet thành công.")
+            print(f"[viral_analyze] Upsert thành công (updated={upsert_result['updated']}, added={upsert_result['added']}).")
 
         except Exception as e_sheet:
             print(f"LỖI (Google Sheet Export): {e_sheet}")
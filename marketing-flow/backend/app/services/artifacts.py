@@ -0,0 +1,120 @@
+# app/services/artifacts.py
+"""
+Kho artifact cục bộ: lưu JSON lớn (transcript, highlights...) dưới dạng nén,
+khóa theo hash nội dung. Ô Google Sheet giữ JSON cũ kèm tham chiếu (ID/URL) tới bản đầy đủ.
+
+Layout: MEDIA_ROOT/artifacts/<id[:2]>/<id>.json.zst   (hoặc .json.gz nếu thiếu zstandard)
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard as zstd  # pip install zstandard
+    HAVE_ZSTD = True
+except Exception:
+    HAVE_ZSTD = False
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", str(Path(MEDIA_ROOT) / "artifacts")))
+ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+ZSTD_LEVEL = int(os.getenv("ARTIFACT_ZSTD_LEVEL", "10"))
+# Gốc URL công khai của backend (vd. https://api.example.com); rỗng -> URL tương đối
+ARTIFACT_PUBLIC_BASE_URL = os.getenv("ARTIFACT_PUBLIC_BASE_URL", "").rstrip("/")
+# Google Sheets giới hạn 50.000 ký tự mỗi ô
+SHEET_CELL_MAX_CHARS = 50000
+
+
+def _canonical_bytes(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _path_for(artifact_id: str, ext: str) -> Path:
+    return ARTIFACT_DIR / artifact_id[:2] / f"{artifact_id}{ext}"
+
+
+def _existing_path(artifact_id: str) -> Optional[Path]:
+    for ext in (".json.zst", ".json.gz"):
+        p = _path_for(artifact_id, ext)
+        if p.exists():
+            return p
+    return None
+
+
+def put_json(data: Any) -> str:
+    """Lưu data (JSON-serializable) và trả về artifact_id (sha256 rút gọn của nội dung)."""
+    raw = _canonical_bytes(data)
+    artifact_id = hashlib.sha256(raw).hexdigest()[:32]
+    if _existing_path(artifact_id):
+        return artifact_id  # cùng nội dung -> dùng lại
+
+    if HAVE_ZSTD:
+        path = _path_for(artifact_id, ".json.zst")
+        blob = zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        path = _path_for(artifact_id, ".json.gz")
+        blob = gzip.compress(raw, compresslevel=9)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(blob)
+    os.replace(tmp, path)
+    return artifact_id
+
+
+def get_bytes(artifact_id: str) -> bytes:
+    """Trả về JSON (bytes, đã giải nén) của artifact. Raise FileNotFoundError nếu không có."""
+    if not ARTIFACT_ID_RE.match(artifact_id or ""):
+        raise FileNotFoundError(f"Invalid artifact id: {artifact_id!r}")
+    path = _existing_path(artifact_id)
+    if not path:
+        raise FileNotFoundError(f"Artifact not found: {artifact_id}")
+    blob = path.read_bytes()
+    if path.name.endswith(".zst"):
+        if not HAVE_ZSTD:
+            raise RuntimeError("Artifact được nén zstd nhưng chưa cài 'zstandard'.")
+        return zstd.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def get_json(artifact_id: str) -> Any:
+    return json.loads(get_bytes(artifact_id).decode("utf-8"))
+
+
+def artifact_url(artifact_id: str) -> str:
+    """URL của artifact; tuyệt đối nếu đặt ARTIFACT_PUBLIC_BASE_URL (để n8n/ngoài backend gọi được)."""
+    return f"{ARTIFACT_PUBLIC_BASE_URL}/artifacts/{artifact_id}"
+
+
+def sheet_reference(artifact_id: str, data: Dict[str, Any]) -> str:
+    """
+    Giá trị ghi vào ô sheet: JSON cũ (all_segments đầy đủ, stats...) kèm artifact_id/url.
+    Các workflow n8n đọc ô này (JSON.parse rồi ghép all_segments[].text) nên giữ nguyên
+    danh sách đoạn. Chỉ khi vượt giới hạn ô của Sheets mới bỏ bớt đoạn cuối và gắn
+    'truncated': true; bản đầy đủ luôn nằm trong artifact.
+    """
+    ref: Dict[str, Any] = {**data, "artifact_id": artifact_id, "url": artifact_url(artifact_id)}
+    text = json.dumps(ref, ensure_ascii=False)
+    segments = list(ref.get("all_segments") or [])
+    if len(text) <= SHEET_CELL_MAX_CHARS or not segments:
+        return text
+
+    # Bỏ các trường phụ của từng đoạn trước (n8n chỉ dùng text), rồi mới bớt số đoạn
+    ref["truncated"] = True
+    ref["all_segments"] = segments = [{"text": s.get("text", "")} for s in segments]
+    lo, hi = 0, len(segments)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        ref["all_segments"] = segments[:mid]
+        if len(json.dumps(ref, ensure_ascii=False)) <= SHEET_CELL_MAX_CHARS:
+            lo = mid
+        else:
+            hi = mid - 1
+    ref["all_segments"] = segments[:lo]
+    print(f"[artifacts] Ô sheet của {artifact_id} vượt {SHEET_CELL_MAX_CHARS} ký tự: "
+          f"giữ {lo}/{len(segments)} đoạn, bản đầy đủ ở {ref['url']}")
+    return json.dumps(ref, ensure_ascii=False)
@@ -0,0 +1,105 @@
+# app/services/audio_cleanup.py
+"""
+Chọn mức làm sạch audio trước Whisper theo ước lượng SNR nhanh.
+
+`afftdn` là khâu tốn nhất của chuỗi tiền xử lý nhưng vô ích với giọng thu sạch
+(phần lớn video TikTok). Ước lượng: decode SNR_SAMPLE_SEC giây đầu (mono 16 kHz s16le),
+tính RMS theo khung 20 ms bằng NumPy; nền nhiễu = phân vị 10%, mức giọng = phân vị 90%,
+SNR = hiệu hai mức (dB). Từ đó chọn profile:
+
+- none : không lọc (SNR >= SNR_CLEAN_DB)
+- light: chỉ highpass/lowpass (SNR >= SNR_LIGHT_DB)
+- full : highpass/lowpass + afftdn, nf lấy theo nền nhiễu đo được
+
+Không có NumPy hoặc đo lỗi -> "full" (như trước đây).
+Xem benchmarks/bench_audio_cleanup.py để đo độ chính xác/tốc độ trên tập có nhãn.
+"""
+import os
+import time
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.services.process_runner import run_process_blocking
+
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except Exception:
+    HAVE_NUMPY = False
+
+SNR_SAMPLE_SEC = float(os.getenv("SNR_SAMPLE_SEC", "20"))
+SNR_CLEAN_DB = float(os.getenv("SNR_CLEAN_DB", "30"))
+SNR_LIGHT_DB = float(os.getenv("SNR_LIGHT_DB", "18"))
+
+PROFILE_NONE = "none"
+PROFILE_LIGHT = "light"
+PROFILE_FULL = "full"
+
+_SAMPLE_RATE = 16000
+_FRAME = 320  # 20 ms
+_FLOOR_DB = -100.0
+_BANDPASS = ["highpass=f=180", "lowpass=f=6500"]
+
+
+def snr_from_pcm(pcm) -> Optional[Dict]:
+    """Ước lượng từ mẫu PCM int16 mono; None nếu quá ngắn."""
+    n = len(pcm) // _FRAME
+    if n < 10:
+        return None
+    frames = pcm[: n * _FRAME].astype(np.float32).reshape(n, _FRAME) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    db = np.maximum(20.0 * np.log10(np.maximum(rms, 1e-10)), _FLOOR_DB)
+    noise = float(np.percentile(db, 10))
+    speech = float(np.percentile(db, 90))
+    return {
+        "snr_db": round(speech - noise, 1),
+        "noise_floor_db": round(noise, 1),
+        "speech_db": round(speech, 1),
+        "sample_sec": round(n * _FRAME / _SAMPLE_RATE, 2),
+    }
+
+
+def estimate(ffmpeg_bin: str, path: str, cancel_event: Optional[threading.Event] = None) -> Optional[Dict]:
+    """Decode SNR_SAMPLE_SEC giây đầu và ước lượng SNR (kèm thời gian đo)."""
+    if not HAVE_NUMPY:
+        return None
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = Path(tmp) / "sample.pcm"
+        try:
+            run_process_blocking(
+                [ffmpeg_bin, "-y", "-loglevel", "error", "-t", f"{SNR_SAMPLE_SEC:.1f}", "-i", path,
+                 "-vn", "-ac", "1", "-ar", str(_SAMPLE_RATE), "-f", "s16le", str(raw)],
+                cancel_event=cancel_event, capture_stdout=False, timeout=60, check=True,
+            )
+            result = snr_from_pcm(np.fromfile(raw, dtype="<i2"))
+        except Exception as e:
+            print(f"[audio_cleanup] Không ước lượng được SNR: {e}")
+            return None
+    if result is not None:
+        result["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def choose_profile(est: Optional[Dict]) -> str:
+    if not est:
+        return PROFILE_FULL
+    if est["snr_db"] >= SNR_CLEAN_DB:
+        return PROFILE_NONE
+    if est["snr_db"] >= SNR_LIGHT_DB:
+        return PROFILE_LIGHT
+    return PROFILE_FULL
+
+
+def cleanup_filters(profile: str, est: Optional[Dict] = None, gain_db: float = 0.0) -> List[str]:
+    """Bộ lọc cho profile; afftdn nf = nền nhiễu sau gain (giới hạn -80..-20 dB của afftdn)."""
+    if profile == PROFILE_NONE:
+        return []
+    if profile == PROFILE_LIGHT:
+        return list(_BANDPASS)
+    nf = -20.0
+    if est:
+        nf = min(-20.0, max(-80.0, est["noise_floor_db"] + gain_db))
+    return _BANDPASS + [f"afftdn=nf={nf:.0f}"]
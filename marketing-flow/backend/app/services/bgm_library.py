@@ -0,0 +1,127 @@
+# app/services/bgm_library.py
+"""
+Thư viện nhạc nền (BGM) phía server, khóa theo hash nội dung.
+
+Mỗi track được chuẩn hóa MỘT lần lúc upload (48 kHz, stereo, FLAC) và đo sẵn
+độ dài + loudness (loudnorm pass 1), nên job chỉ cần gửi `bgm_id`: không upload lại
+file, không ffprobe và không aformat/aresample BGM trong từng lần render.
+
+Layout: MEDIA_ROOT/bgm/<id>.flac + <id>.json (metadata)
+"""
+import os
+import re
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services import loudness
+from app.services.process_runner import run_process
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+BGM_DIR = Path(os.getenv("BGM_DIR", str(Path(MEDIA_ROOT) / "bgm")))
+BGM_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+BGM_SAMPLE_RATE = 48000
+
+
+def file_id(path: str) -> str:
+    """sha256 (rút gọn) của toàn bộ file gốc -> cùng bài upload lại sẽ trùng ID."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()[:32]
+
+
+def _audio_path(bgm_id: str) -> Path:
+    return BGM_DIR / f"{bgm_id}.flac"
+
+
+def _meta_path(bgm_id: str) -> Path:
+    return BGM_DIR / f"{bgm_id}.json"
+
+
+def get_track(bgm_id: str) -> Optional[Dict]:
+    """Metadata của track (kèm "path"), None nếu ID sai định dạng hoặc không tồn tại."""
+    if not bgm_id or not BGM_ID_RE.match(bgm_id):
+        return None
+    meta, audio = _meta_path(bgm_id), _audio_path(bgm_id)
+    if not (meta.exists() and audio.exists()):
+        return None
+    try:
+        data = json.loads(meta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    data["path"] = str(audio.resolve())
+    return data
+
+
+def track_for_path(path: str) -> Optional[Dict]:
+    """Track của thư viện ứng với đường dẫn file (None nếu file không thuộc thư viện)."""
+    p = Path(path).resolve()
+    if p.parent != BGM_DIR.resolve() or p.suffix != ".flac":
+        return None
+    return get_track(p.stem)
+
+
+def list_tracks() -> List[Dict]:
+    if not BGM_DIR.exists():
+        return []
+    tracks = [get_track(p.stem) for p in BGM_DIR.glob("*.json")]
+    return sorted((t for t in tracks if t), key=lambda t: t.get("created_at", 0), reverse=True)
+
+
+async def _measure(ffmpeg_bin: str, ffprobe_bin: str, path: str) -> Dict:
+    probe = await run_process(
+        [ffprobe_bin, "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        timeout=60, check=True,
+    )
+    duration = float(probe.stdout.strip() or 0.0)
+    return {"duration_sec": round(duration, 3), "loudness": await loudness.measure(ffmpeg_bin, path)}
+
+
+async def add_track(ffmpeg_bin: str, ffprobe_bin: str, src_path: str, name: str) -> Dict:
+    """
+    Thêm file vào thư viện: trùng nội dung -> trả track có sẵn ("duplicate": True);
+    ngược lại chuẩn hóa 48 kHz stereo FLAC, đo độ dài + loudness và lưu metadata.
+    """
+    bgm_id = await run_in_threadpool(file_id, src_path)
+    existing = get_track(bgm_id)
+    if existing:
+        return {**existing, "duplicate": True}
+
+    BGM_DIR.mkdir(parents=True, exist_ok=True)
+    audio = _audio_path(bgm_id)
+    tmp_audio = audio.with_name(f"{bgm_id}.tmp.flac")
+    try:
+        await run_process(
+            [ffmpeg_bin, "-y", "-loglevel", "error", "-i", src_path, "-vn", "-map", "0:a:0",
+             "-af", "aformat=channel_layouts=stereo", "-ar", str(BGM_SAMPLE_RATE),
+             "-c:a", "flac", str(tmp_audio)],
+            capture_stdout=False, check=True,
+        )
+        measured = await _measure(ffmpeg_bin, ffprobe_bin, str(tmp_audio))
+        os.replace(tmp_audio, audio)
+    finally:
+        if tmp_audio.exists():
+            tmp_audio.unlink()
+
+    meta = {
+        "id": bgm_id,
+        "name": name,
+        "sample_rate": BGM_SAMPLE_RATE,
+        "channels": 2,
+        "size_bytes": audio.stat().st_size,
+        "created_at": time.time(),
+        **measured,
+    }
+    tmp_meta = _meta_path(bgm_id).with_suffix(".json.tmp")
+    tmp_meta.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_meta, _meta_path(bgm_id))
+    print(f"[bgm_library] Đã thêm '{name}' ({bgm_id}), {measured['duration_sec']}s, "
+          f"I={measured['loudness'].get('input_i')} LUFS")
+    return {**meta, "path": str(audio.resolve()), "duplicate": False}
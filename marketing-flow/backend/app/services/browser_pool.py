@@ -0,0 +1,346 @@
+# app/services/browser_pool.py
+"""
+Pool trình duyệt Playwright (Chromium) sống lâu cho các lần crawl cần render JS.
+
+- Một Chromium duy nhất chạy trên event loop riêng (thread "browser-pool"), nên dùng được
+  cả từ code đồng bộ (threadpool) lẫn từ coroutine của FastAPI.
+- Mỗi template (desktop / mobile) có sẵn BROWSER_POOL_SIZE context "ấm"; context được
+  tạo lại sau BROWSER_CONTEXT_MAX_PAGES trang để tránh rò rỉ bộ nhớ/cookie.
+- Chặn request ảnh/font/media ngay trong context (chỉ cần HTML + JS).
+- Thay vì luôn chờ cố định 3s, trang được coi là "sẵn sàng" khi một trong các điều kiện
+  xảy ra trước: selector riêng của domain xuất hiện / network idle / tổng độ dài text các
+  thẻ <p> ngừng thay đổi; tối đa RENDER_READY_MAX_MS. Thời gian thực tế được ghi theo domain.
+"""
+import os
+import time
+import asyncio
+import threading
+from urllib.parse import urlparse
+from typing import Dict, Optional, Tuple
+
+try:
+    from playwright.async_api import async_playwright   # install only if you need render
+    HAVE_PLAYWRIGHT = True
+except Exception:
+    HAVE_PLAYWRIGHT = False
+
+# =============================
+# CONFIG
+# =============================
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_CONTEXT_MAX_PAGES = int(os.getenv("BROWSER_CONTEXT_MAX_PAGES", "50"))
+BROWSER_ACQUIRE_TIMEOUT_SEC = float(os.getenv("BROWSER_ACQUIRE_TIMEOUT", "60"))
+BLOCKED_RESOURCE_TYPES = {
+    t.strip() for t in os.getenv("BROWSER_BLOCK_RESOURCES", "image,font,media").split(",") if t.strip()
+}
+
+DESKTOP_UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36")
+MOBILE_UA = ("Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 "
+             "(KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36")
+
+CONTEXT_TEMPLATES: Dict[str, Dict] = {
+    "desktop": {
+        "user_agent": DESKTOP_UA,
+        "locale": "vi-VN",
+        "viewport": {"width": 1366, "height": 900},
+    },
+    "mobile": {
+        "user_agent": MOBILE_UA,
+        "locale": "vi-VN",
+        "viewport": {"width": 412, "height": 915},
+        "is_mobile": True,
+        "has_touch": True,
+    },
+}
+
+
+# Readiness: giới hạn trên (bằng mức chờ cố định cũ) + chu kỳ kiểm tra text ổn định
+RENDER_READY_MAX_MS = int(os.getenv("RENDER_READY_MAX_MS", "3000"))
+RENDER_STABLE_POLL_MS = 250
+RENDER_STABLE_POLLS = 2
+
+# Selector báo hiệu nội dung chính đã render (khớp theo hậu tố domain)
+READY_SELECTORS: Dict[str, str] = {
+    "tiktok.com": '[data-e2e="user-post-item"], [data-e2e="browse-video-desc"], [data-e2e="challenge-item"]',
+    "facebook.com": '[role="article"], meta[property="og:title"]',
+}
+
+_P_TEXT_LENGTH_JS = (
+    "() => Array.from(document.querySelectorAll('p'))"
+    ".reduce((n, p) => n + (p.innerText || '').length, 0)"
+)
+
+
+def _domain(url: str) -> str:
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _ready_selector(domain: str) -> Optional[str]:
+    for suffix, selector in READY_SELECTORS.items():
+        if domain == suffix or domain.endswith("." + suffix):
+            return selector
+    return None
+
+
+async def _wait_network_idle(page, budget_ms: int) -> str:
+    await page.wait_for_load_state("networkidle", timeout=budget_ms)
+    return "networkidle"
+
+
+async def _wait_selector(page, selector: str, budget_ms: int) -> str:
+    await page.wait_for_selector(selector, state="attached", timeout=budget_ms)
+    return "selector"
+
+
+async def _wait_text_stable(page) -> str:
+    last, stable = -1, 0
+    while True:
+        length = await page.evaluate(_P_TEXT_LENGTH_JS)
+        if length > 0 and length == last:
+            stable += 1
+            if stable >= RENDER_STABLE_POLLS:
+                return "text_stable"
+        else:
+            stable = 0
+        last = length
+        await asyncio.sleep(RENDER_STABLE_POLL_MS / 1000)
+
+
+async def wait_until_ready(page, url: str, budget_ms: int = RENDER_READY_MAX_MS) -> str:
+    """
+    Chờ đến khi điều kiện sẵn sàng đầu tiên xảy ra (hoặc hết budget_ms).
+    Trả về lý do: 'selector' | 'networkidle' | 'text_stable' | 'timeout'.
+    """
+    waiters = [
+        asyncio.ensure_future(_wait_network_idle(page, budget_ms)),
+        asyncio.ensure_future(_wait_text_stable(page)),
+    ]
+    selector = _ready_selector(_domain(url))
+    if selector:
+        waiters.append(asyncio.ensure_future(_wait_selector(page, selector, budget_ms)))
+
+    reason = "timeout"
+    deadline = time.monotonic() + budget_ms / 1000
+    pending = set(waiters)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            # Waiter lỗi (timeout của Playwright, trang đóng...) -> chờ các điều kiện còn lại
+            finished = [t for t in done if not t.cancelled() and t.exception() is None]
+            if finished:
+                reason = finished[0].result()
+                break
+    finally:
+        for t in waiters:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+    return reason
+
+
+class _PooledContext:
+    __slots__ = ("context", "template", "generation", "pages")
+
+    def __init__(self, context, template: str, generation: int):
+        self.context = context
+        self.template = template
+        self.generation = generation
+        self.pages = 0
+
+
+async def _block_heavy_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_pages_per_context: int = BROWSER_CONTEXT_MAX_PAGES,
+    ):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages_per_context)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._playwright = None
+        self._browser = None
+        self._generation = 0
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self.stats = {"launches": 0, "pages": 0, "recycled": 0, "errors": 0}
+        # domain -> {"count", "total_ms", "max_ms", "reasons": {reason: n}}
+        self.readiness: Dict[str, Dict] = {}
+
+    # ---------- Loop riêng ----------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+        return self._loop
+
+    # ---------- Browser / contexts (chạy trên loop riêng) ----------
+    async def _new_context(self, template: str) -> _PooledContext:
+        context = await self._browser.new_context(**CONTEXT_TEMPLATES[template])
+        if BLOCKED_RESOURCE_TYPES:
+            await context.route("**/*", _block_heavy_resources)
+        return _PooledContext(context, template, self._generation)
+
+    async def _ensure_browser(self):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._generation += 1
+            self.stats["launches"] += 1
+            queues: Dict[str, asyncio.Queue] = {}
+            for template in CONTEXT_TEMPLATES:
+                q: asyncio.Queue = asyncio.Queue()
+                for _ in range(self.size):
+                    q.put_nowait(await self._new_context(template))
+                queues[template] = q
+            self._queues = queues
+            print(f"[browser_pool] Chromium sẵn sàng ({self.size} context/template, "
+                  f"chặn: {', '.join(sorted(BLOCKED_RESOURCE_TYPES)) or 'không'})")
+
+    async def _release(self, entry: _PooledContext):
+        if entry.generation != self._generation:
+            # Browser đã được khởi động lại: context cũ bỏ luôn
+            return
+        if entry.pages >= self.max_pages:
+            try:
+                await entry.context.close()
+            except Exception:
+                pass
+            try:
+                entry = await self._new_context(entry.template)
+                self.stats["recycled"] += 1
+            except Exception as e:
+                print(f"[browser_pool] Không tạo lại được context: {e}")
+                self._browser = None  # lần sau khởi động lại browser
+                return
+        self._queues[entry.template].put_nowait(entry)
+
+    async def _render(self, url: str, mobile: bool, timeout_ms: int) -> Tuple[str, str]:
+        await self._ensure_browser()
+        template = "mobile" if mobile else "desktop"
+        try:
+            entry = await asyncio.wait_for(self._queues[template].get(), BROWSER_ACQUIRE_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Browser pool busy: no free context.")
+        page = None
+        try:
+            page = await entry.context.new_page()
+            await page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+            started = time.monotonic()
+            reason = await wait_until_ready(page, url)
+            self._record_readiness(_domain(url), (time.monotonic() - started) * 1000, reason)
+            title = await page.title() or ""
+            html = await page.content()
+            return title, html
+        except Exception:
+            self.stats["errors"] += 1
+            if self._browser is not None and not self._browser.is_connected():
+                self._browser = None
+            raise
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            entry.pages += 1
+            self.stats["pages"] += 1
+            await self._release(entry)
+
+    def _record_readiness(self, domain: str, elapsed_ms: float, reason: str):
+        rec = self.readiness.setdefault(domain, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "reasons": {}})
+        rec["count"] += 1
+        rec["total_ms"] += elapsed_ms
+        rec["max_ms"] = max(rec["max_ms"], elapsed_ms)
+        rec["reasons"][reason] = rec["reasons"].get(reason, 0) + 1
+
+    async def _shutdown(self):
+        for q in self._queues.values():
+            while not q.empty():
+                try:
+                    await q.get_nowait().context.close()
+                except Exception:
+                    pass
+        self._queues = {}
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    # ---------- Public API ----------
+    def render(self, url: str, mobile: bool = False, timeout: float = 45.0) -> Tuple[str, str]:
+        """Render (đồng bộ, gọi từ threadpool). Trả về (title, html)."""
+        if not HAVE_PLAYWRIGHT:
+            raise RuntimeError("Playwright not installed")
+        fut = asyncio.run_coroutine_threadsafe(
+            self._render(url, mobile, int(timeout * 1000)), self._ensure_loop()
+        )
+        return fut.result(timeout=timeout + BROWSER_ACQUIRE_TIMEOUT_SEC + 30)
+
+    async def render_async(self, url: str, mobile: bool = False, timeout: float = 45.0) -> Tuple[str, str]:
+        """Render từ coroutine (không chặn event loop của FastAPI)."""
+        if not HAVE_PLAYWRIGHT:
+            raise RuntimeError("Playwright not installed")
+        fut = asyncio.run_coroutine_threadsafe(
+            self._render(url, mobile, int(timeout * 1000)), self._ensure_loop()
+        )
+        return await asyncio.wrap_future(fut)
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "running": self._browser is not None,
+            "free_contexts": {t: q.qsize() for t, q in self._queues.items()},
+            "readiness": {
+                d: {
+                    "count": r["count"],
+                    "avg_ms": round(r["total_ms"] / r["count"], 1),
+                    "max_ms": round(r["max_ms"], 1),
+                    "reasons": dict(r["reasons"]),
+                }
+                for d, r in self.readiness.items()
+            },
+        }
+
+    def close(self):
+        """Đóng browser + dừng loop riêng (gọi khi tắt server)."""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=30)
+        except Exception as e:
+            print(f"[browser_pool] Lỗi khi đóng: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop = None
+        self._launch_lock = None
+
+
+# Pool dùng chung cho toàn bộ app
+browser_pool = BrowserPool()
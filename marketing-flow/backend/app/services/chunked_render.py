@@ -0,0 +1,197 @@
+# app/services/chunked_render.py
+"""
+Render song song theo đoạn cho video dài (MFA_CHUNKED_RENDER=1).
+
+Một tiến trình libx264 không tận dụng hết nhiều core, nên timeline được cắt tại
+keyframe (hoặc ranh giới cảnh khi remix), mỗi đoạn được encode bởi một ffmpeg riêng
+(tối đa CHUNK_WORKERS tiến trình cùng lúc), rồi nối lại bằng concat demuxer `-c copy`.
+Các đoạn chỉ chứa hình; audio được mux một lần ở lệnh cuối của người gọi.
+
+Chỉ mục keyframe cũng dùng cho remix stream-copy: ranh giới cảnh nằm gần keyframe
+(trong REMIX_SNAP_TOLERANCE giây) thì được "snap" vào đó và cắt bằng `-c copy`.
+"""
+import os
+import asyncio
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.services.process_runner import run_process
+
+CHUNKED_RENDER = os.getenv("MFA_CHUNKED_RENDER", "0") == "1"
+# Video ngắn hơn ngưỡng này encode một lần như cũ (chi phí tách/nối không đáng)
+CHUNKED_RENDER_MIN_SEC = float(os.getenv("CHUNKED_RENDER_MIN_SEC", "120"))
+CHUNK_TARGET_SEC = float(os.getenv("CHUNK_TARGET_SEC", "30"))
+CHUNK_WORKERS = max(1, int(os.getenv("CHUNK_WORKERS", str(max(1, (os.cpu_count() or 4) // 4)))))
+# Chia đều core cho các tiến trình x264 chạy song song
+CHUNK_THREADS = max(1, (os.cpu_count() or 4) // CHUNK_WORKERS)
+
+Cue = Tuple[int, float, float, str]
+Span = Tuple[float, float]
+
+# (path, mtime, size) -> danh sách thời điểm keyframe
+_KEYFRAME_INDEX: Dict[Tuple[str, float, int], List[float]] = {}
+
+
+def chunked_enabled(duration: float, override: Optional[bool] = None) -> bool:
+    enabled = CHUNKED_RENDER if override is None else override
+    return enabled and duration >= CHUNKED_RENDER_MIN_SEC
+
+
+async def keyframe_times(ffprobe_bin: str, path: str) -> List[float]:
+    """Thời điểm (giây) các keyframe của luồng video đầu tiên, đọc từ packet flags (không decode)."""
+    st = os.stat(path)
+    key = (str(Path(path).resolve()), st.st_mtime, st.st_size)
+    if key in _KEYFRAME_INDEX:
+        return _KEYFRAME_INDEX[key]
+    r = await run_process(
+        [ffprobe_bin, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        timeout=300,
+    )
+    times: List[float] = []
+    for line in r.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts))
+            except ValueError:
+                continue
+    times.sort()
+    _KEYFRAME_INDEX[key] = times
+    return times
+
+
+def plan_spans(duration: float, keyframes: Sequence[float], target: float = CHUNK_TARGET_SEC) -> List[Span]:
+    """Cắt tại keyframe đầu tiên sau mỗi ~`target` giây; đoạn cuối không ngắn hơn target/2."""
+    cuts = [0.0]
+    points = keyframes or [i * target for i in range(1, int(duration // target) + 1)]
+    for t in points:
+        if t - cuts[-1] >= target and duration - t >= target / 2:
+            cuts.append(t)
+    return list(zip(cuts, cuts[1:] + [duration]))
+
+
+def _nearest(points: Sequence[float], t: float, tolerance: float) -> Optional[float]:
+    i = bisect_left(points, t)
+    best = min(points[max(0, i - 1):i + 1], key=lambda p: abs(p - t), default=None)
+    if best is None or abs(best - t) > tolerance:
+        return None
+    return best
+
+
+def snap_spans(spans: Sequence[Span], keyframes: Sequence[float], duration: float,
+               tolerance: float) -> Optional[List[Span]]:
+    """
+    Dời mỗi ranh giới [start, end) về keyframe gần nhất trong `tolerance` giây (end có thể là
+    cuối file). Trả None nếu có ranh giới không snap được (phải encode lại).
+    """
+    out: List[Span] = []
+    for start, end in spans:
+        s = _nearest(keyframes, start, tolerance)
+        if end >= duration - tolerance:
+            e = duration
+        else:
+            e = _nearest(keyframes, end, tolerance)
+        if s is None or e is None or e <= s:
+            return None
+        out.append((s, e))
+    return out
+
+
+def offset_cues(cues: Sequence[Cue], start: float, end: float) -> List[Cue]:
+    """Phụ đề của đoạn [start, end), thời gian tính lại từ đầu đoạn."""
+    out: List[Cue] = []
+    for idx, s, e, text in cues:
+        if e <= start or s >= end:
+            continue
+        out.append((idx, max(s, start) - start, min(e, end) - start, text))
+    return out
+
+
+def _concat_line(path: Path) -> str:
+    return "file '" + path.resolve().as_posix().replace("'", "'\\''") + "'"
+
+
+async def render_video_chunks(
+    ffmpeg_bin: str,
+    src: str,
+    spans: Sequence[Span],
+    workdir: str,
+    vf_for_chunk: Callable[[int, float, float], str],
+    crf: int,
+    preset: str,
+) -> str:
+    """
+    Encode từng đoạn (chỉ video) song song rồi nối bằng concat demuxer.
+    `vf_for_chunk(i, start, end)` trả chuỗi -vf cho đoạn i ("" nếu không lọc).
+    Trả về đường dẫn file video đã nối (không có audio).
+    """
+    out_dir = Path(workdir) / "chunks"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sem = asyncio.Semaphore(CHUNK_WORKERS)
+
+    async def one(i: int, start: float, end: float) -> Path:
+        out = out_dir / f"chunk_{i:04d}.mp4"
+        cmd = [ffmpeg_bin, "-y", "-loglevel", "error",
+               "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", src,
+               "-an", "-sn"]
+        vf = vf_for_chunk(i, start, end)
+        if vf:
+            cmd += ["-vf", vf]
+        cmd += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+                "-pix_fmt", "yuv420p", "-threads", str(CHUNK_THREADS), str(out)]
+        async with sem:
+            await run_process(cmd, capture_stdout=False, check=True)
+        return out
+
+    tasks = [asyncio.create_task(one(i, s, e)) for i, (s, e) in enumerate(spans)]
+    try:
+        chunks = await asyncio.gather(*tasks)
+    except BaseException:
+        # Một đoạn lỗi/bị hủy -> dừng các đoạn còn lại
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    list_file = out_dir / "concat.txt"
+    list_file.write_text("\n".join(_concat_line(c) for c in chunks) + "\n", encoding="utf-8")
+    joined = str(out_dir / "joined.mp4")
+    await run_process(
+        [ffmpeg_bin, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+         "-i", str(list_file), "-c", "copy", joined],
+        capture_stdout=False, check=True,
+    )
+    print(f"[chunked_render] {len(chunks)} đoạn, {CHUNK_WORKERS} tiến trình x {CHUNK_THREADS} thread")
+    return joined
+
+
+async def copy_spans(ffmpeg_bin: str, src: str, spans: Sequence[Span], workdir: str, output: str) -> str:
+    """Cắt các đoạn (đã snap vào keyframe) bằng stream copy rồi nối lại, không encode."""
+    out_dir = Path(workdir) / "copy"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sem = asyncio.Semaphore(CHUNK_WORKERS)
+
+    async def one(i: int, start: float, end: float) -> Path:
+        out = out_dir / f"seg_{i:04d}.mp4"
+        async with sem:
+            await run_process(
+                [ffmpeg_bin, "-y", "-loglevel", "error",
+                 # +1ms: không làm tròn xuống trước keyframe (sẽ seek về GOP trước đó)
+                 "-ss", f"{start + 0.001:.3f}", "-i", src, "-t", f"{end - start:.3f}",
+                 "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+                 "-avoid_negative_ts", "make_zero", str(out)],
+                capture_stdout=False, check=True,
+            )
+        return out
+
+    segments = await asyncio.gather(*(one(i, s, e) for i, (s, e) in enumerate(spans)))
+    list_file = out_dir / "concat.txt"
+    list_file.write_text("\n".join(_concat_line(p) for p in segments) + "\n", encoding="utf-8")
+    await run_process(
+        [ffmpeg_bin, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+         "-i", str(list_file), "-c", "copy", "-movflags", "+faststart", output],
+        capture_stdout=False, check=True,
+    )
+    return output
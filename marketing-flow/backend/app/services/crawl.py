@@ -1,6 +1,10 @@
-import os, requests
-from bs4 import BeautifulSoup
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.services.html_extract import extract_fields, extract_head
 from urllib.parse import urlparse, quote
+from typing import Optional
 
 # ---------- Headers ----------
 DESKTOP_UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -14,57 +18,50 @@ DEFAULT_HEADERS = {
 }
 MOBILE_HEADERS = {**DEFAULT_HEADERS, "User-Agent": MOBILE_UA}
 
+# oEmbed của một video gần như không đổi -> cache theo URL video
+OEMBED_CACHE_MAX_AGE = float(os.getenv("OEMBED_CACHE_MAX_AGE", str(24 * 3600)))
+
 # ---------- Generic fetch & parse ----------
+# Mọi request đi qua http_fetch (client httpx dùng chung + cache ETag/Last-Modified)
+from app.services import http_fetch
+
 def fetch_html(url: str, timeout: int = 25) -> str:
-    r = requests.get(url, headers=DEFAULT_HEADERS, timeout=timeout, allow_redirects=True)
+    r = http_fetch.fetch(url, headers=DEFAULT_HEADERS, timeout=timeout)
+    r.raise_for_status()
+    return r.text
+
+async def fetch_html_async(url: str, timeout: int = 25) -> str:
+    r = await http_fetch.fetch_async(url, headers=DEFAULT_HEADERS, timeout=timeout)
     r.raise_for_status()
     return r.text
 
 def extract_content_fields(html: str) -> dict:
-    soup = BeautifulSoup(html, "html.parser")
-    title = soup.title.get_text(strip=True) if soup.title else ""
-    metas = {}
-    for m in soup.find_all("meta"):
-        name = (m.get("name") or m.get("property") or m.get("http-equiv") or "").lower()
-        content = m.get("content")
-        if name and content:
-            metas[name] = content
-    # basic text
-    paragraphs = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
-    text = " ".join(paragraphs)[:12000]
-    # headings (nice for heuristics)
-    h1s = [h.get_text(" ", strip=True) for h in soup.find_all("h1")]
-    h2s = [h.get_text(" ", strip=True) for h in soup.find_all("h2")]
-    return {"title": title, "metas": metas, "h1": h1s, "h2": h2s, "text": text}
+    # Một lần duyệt: title, metas, h1/h2, text <p> (dừng khi đủ 12.000 ký tự)
+    return extract_fields(html)
 
 # ---------- Optional headless renderer for JS-heavy pages ----------
-try:
-    from playwright.sync_api import sync_playwright   # install only if you need render
-    HAVE_PLAYWRIGHT = True
-except Exception:
-    HAVE_PLAYWRIGHT = False
+# Dùng pool Chromium sống lâu (browser_pool.py) thay vì khởi động browser mới mỗi URL
+from app.services.browser_pool import HAVE_PLAYWRIGHT, browser_pool
 
-def render_page_fields(url: str, mobile: bool = False) -> dict:
-    if not HAVE_PLAYWRIGHT:
-        raise RuntimeError("Playwright not installed")
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent=MOBILE_UA if mobile else DESKTOP_UA,
-            locale="vi-VN",
-        )
-        page = context.new_page()
-        page.goto(url, wait_until="domcontentloaded", timeout=45000)
-        page.wait_for_timeout(3000)  # allow JS to paint
-        title = page.title() or ""
-        html = page.content()
-        browser.close()
+def _rendered_fields(title: str, html: str) -> dict:
     fields = extract_content_fields(html)
     if not fields.get("title"):
         fields["title"] = title or "Rendered page"
     fields["metas"] = {**fields.get("metas", {}), "source": "rendered"}
     return fields
 
+def render_page_fields(url: str, mobile: bool = False) -> dict:
+    if not HAVE_PLAYWRIGHT:
+        raise RuntimeError("Playwright not installed")
+    title, html = browser_pool.render(url, mobile=mobile)
+    return _rendered_fields(title, html)
+
+async def render_page_fields_async(url: str, mobile: bool = False) -> dict:
+    if not HAVE_PLAYWRIGHT:
+        raise RuntimeError("Playwright not installed")
+    title, html = await browser_pool.render_async(url, mobile=mobile)
+    return _rendered_fields(title, html)
+
 # ---------- TikTok helpers ----------
 def _is_tiktok(url: str) -> bool:
     return "tiktok.com" in urlparse(url).netloc.lower()
@@ -72,11 +69,10 @@ def _is_tiktok(url: str) -> bool:
 def _is_tiktok_video(url: str) -> bool:
     return _is_tiktok(url) and "/video/" in urlparse(url).path
 
-def _tiktok_oembed_fields(url: str) -> dict:
-    api = f"https://www.tiktok.com/oembed?url={quote(url, safe=':/?&=')}"
-    r = requests.get(api, headers=DEFAULT_HEADERS, timeout=20)
-    r.raise_for_status()
-    data = r.json()
+def _tiktok_oembed_api(url: str) -> str:
+    return f"https://www.tiktok.com/oembed?url={quote(url, safe=':/?&=')}"
+
+def _tiktok_oembed_parse(data: dict) -> dict:
     caption = data.get("title") or ""
     metas = {
         "author_name": data.get("author_name", ""),
@@ -87,6 +83,18 @@ def _tiktok_oembed_fields(url: str) -> dict:
     }
     return {"title": caption or "TikTok Video", "metas": metas, "h1": [], "h2": [], "text": caption}
 
+def _tiktok_oembed_fields(url: str) -> dict:
+    r = http_fetch.fetch(_tiktok_oembed_api(url), headers=DEFAULT_HEADERS, timeout=20,
+                         max_age=OEMBED_CACHE_MAX_AGE)
+    r.raise_for_status()
+    return _tiktok_oembed_parse(r.json())
+
+async def _tiktok_oembed_fields_async(url: str) -> dict:
+    r = await http_fetch.fetch_async(_tiktok_oembed_api(url), headers=DEFAULT_HEADERS, timeout=20,
+                                     max_age=OEMBED_CACHE_MAX_AGE)
+    r.raise_for_status()
+    return _tiktok_oembed_parse(r.json())
+
 # (Optional) TikTok headless if needed (profiles/hashtags)
 def tiktok_rendered_fields(url: str) -> dict:
     return render_page_fields(url, mobile=True)
@@ -102,34 +110,125 @@ def _fb_mobile_variants(url: str) -> list[str]:
     return [f"https://m.facebook.com{path}", f"https://mbasic.facebook.com{path}"]
 
 def _facebook_extract_fields(html: str) -> dict:
-    soup = BeautifulSoup(html, "html.parser")
-    og_title = soup.find("meta", property="og:title")
-    og_desc = soup.find("meta", property="og:description")
-    title = (og_title["content"].strip() if og_title and og_title.get("content")
-             else (soup.title.get_text(strip=True) if soup.title else "Facebook"))
-    desc = og_desc["content"].strip() if og_desc and og_desc.get("content") else ""
+    # OG tags nằm trong <head> -> dừng parse khi gặp <body>
+    head = extract_head(html)
+    og_title = (head.metas.get("og:title") or "").strip()
+    desc = (head.metas.get("og:description") or "").strip()
+    title = og_title or (head.title if head.title is not None else "Facebook")
     return {"title": title, "metas": {"provider": "Facebook"}, "h1": [], "h2": [], "text": desc}
 
+def _facebook_candidate_fields(candidate: str, r) -> Optional[dict]:
+    if r.status_code == 200:
+        f = _facebook_extract_fields(r.text)
+        f["metas"]["fetched_url"] = candidate
+        if f.get("title") or f.get("text"):
+            return f
+    return None
+
+def _facebook_fallback_fields(html: str) -> dict:
+    f = extract_content_fields(html)
+    f["metas"]["note"] = "Might be a login wall. If empty, the page is not public."
+    return f
+
+def _facebook_error_fields(e: Exception) -> dict:
+    return {"title": "Facebook (restricted?)", "metas": {"provider": "Facebook", "error": str(e)}, "h1": [], "h2": [], "text": ""}
+
+# Hedged fetch: m.facebook.com chạy ngay, mbasic sau FB_HEDGE_DELAY giây, bản desktop sau
+# 2 * FB_HEDGE_DELAY (hoặc ngay khi các bản mobile đều thất bại). Lấy kết quả mobile đầu tiên
+# có OG title/description, hủy phần còn lại; desktop chỉ là fallback cuối.
+FB_HEDGE_DELAY = float(os.getenv("FB_HEDGE_DELAY", "0.75"))
+FB_FETCH_TIMEOUT = 25
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fb-hedge")
+
 def facebook_public_fields(url: str) -> dict:
-    for candidate in _fb_mobile_variants(url):
+    variants = _fb_mobile_variants(url)
+    mobile_failed = threading.Event()   # mọi bản mobile đã xong mà không dùng được
+    finished = threading.Event()        # đã có kết quả -> các job chưa chạy thì bỏ
+
+    def fetch_mobile(i: int, candidate: str) -> Optional[dict]:
+        if i and finished.wait(i * FB_HEDGE_DELAY):
+            return None
+        r = http_fetch.fetch(candidate, headers=MOBILE_HEADERS, timeout=FB_FETCH_TIMEOUT)
+        return _facebook_candidate_fields(candidate, r)
+
+    def fetch_desktop() -> Optional[dict]:
+        mobile_failed.wait(len(variants) * FB_HEDGE_DELAY)
+        if finished.is_set():
+            return None
+        return _facebook_fallback_fields(fetch_html(url))
+
+    futures = [_HEDGE_EXECUTOR.submit(fetch_mobile, i, c) for i, c in enumerate(variants)]
+    desktop = _HEDGE_EXECUTOR.submit(fetch_desktop)
+    try:
+        for fut in as_completed(futures):
+            try:
+                f = fut.result()
+            except Exception:
+                f = None
+            if f:
+                return f
+        mobile_failed.set()
+        try:
+            return desktop.result()
+        except Exception as e:
+            return _facebook_error_fields(e)
+    finally:
+        finished.set()
+        mobile_failed.set()
+
+async def facebook_public_fields_async(url: str) -> dict:
+    variants = _fb_mobile_variants(url)
+    mobile_failed = asyncio.Event()
+
+    async def fetch_mobile(i: int, candidate: str) -> Optional[dict]:
+        await asyncio.sleep(i * FB_HEDGE_DELAY)
+        r = await http_fetch.fetch_async(candidate, headers=MOBILE_HEADERS, timeout=FB_FETCH_TIMEOUT)
+        return _facebook_candidate_fields(candidate, r)
+
+    async def fetch_desktop() -> dict:
         try:
-            r = requests.get(candidate, headers=MOBILE_HEADERS, timeout=25, allow_redirects=True)
-            if r.status_code == 200:
-                f = _facebook_extract_fields(r.text)
-                f["metas"]["fetched_url"] = candidate
-                if f.get("title") or f.get("text"):
-                    return f
-        except Exception:
+            await asyncio.wait_for(mobile_failed.wait(), len(variants) * FB_HEDGE_DELAY)
+        except asyncio.TimeoutError:
             pass
+        return _facebook_fallback_fields(await fetch_html_async(url))
+
+    mobile_tasks = [asyncio.ensure_future(fetch_mobile(i, c)) for i, c in enumerate(variants)]
+    desktop_task = asyncio.ensure_future(fetch_desktop())
     try:
-        html = fetch_html(url)
-        f = extract_content_fields(html)
-        f["metas"]["note"] = "Might be a login wall. If empty, the page is not public."
-        return f
-    except Exception as e:
-        return {"title": "Facebook (restricted?)", "metas": {"provider": "Facebook", "error": str(e)}, "h1": [], "h2": [], "text": ""}
+        pending = set(mobile_tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None and t.result():
+                    return t.result()
+        mobile_failed.set()
+        try:
+            return await desktop_task
+        except Exception as e:
+            return _facebook_error_fields(e)
+    finally:
+        for t in mobile_tasks + [desktop_task]:
+            if not t.done():
+                t.cancel()
 
 # ---------- Smart entry for ALL URLs ----------
+def _tiktok_profile_fields() -> dict:
+    return {
+        "title": "TikTok profile/hashtag page",
+        "metas": {"provider": "TikTok",
+                 "note": "Use a video permalink (…/video/123…) or enable headless: MFA_TIKTOK_RENDER=1 + Playwright."},
+        "h1": [], "h2": [], "text": ""
+    }
+
+def _fetch_error_fields(e: Exception) -> dict:
+    return {"title": "Fetch error", "metas": {"error": str(e)}, "h1": [], "h2": [], "text": ""}
+
+def _should_render(fields: dict) -> bool:
+    if os.getenv("MFA_RENDER") == "1" and HAVE_PLAYWRIGHT:
+        text_len = len((fields.get("text") or "").strip())
+        return text_len < 200  # threshold: likely JS-only/lazy content
+    return False
+
 def smart_fields(url: str) -> dict:
     """
     - TikTok video → oEmbed (caption)
@@ -157,12 +256,7 @@ def smart_fields(url: str) -> dict:
                         return tiktok_rendered_fields(url)
                     except Exception:
                         pass
-                return {
-                    "title": "TikTok profile/hashtag page",
-                    "metas": {"provider": "TikTok",
-                             "note": "Use a video permalink (…/video/123…) or enable headless: MFA_TIKTOK_RENDER=1 + Playwright."},
-                    "h1": [], "h2": [], "text": ""
-                }
+                return _tiktok_profile_fields()
 
         # Facebook
         if _is_facebook(url):
@@ -173,15 +267,56 @@ def smart_fields(url: str) -> dict:
         fields = extract_content_fields(html)
 
         # If almost no text and rendering is allowed, try headless once
-        if os.getenv("MFA_RENDER") == "1" and HAVE_PLAYWRIGHT:
-            text_len = len((fields.get("text") or "").strip())
-            if text_len < 200:  # threshold: likely JS-only/lazy content
+        if _should_render(fields):
+            try:
+                fields = render_page_fields(url, mobile=False)
+            except Exception:
+                pass
+
+        return fields
+
+    except Exception as e:
+        return _fetch_error_fields(e)
+
+async def smart_fields_async(url: str) -> dict:
+    """Bản async của smart_fields (cùng thứ tự fallback), không chặn event loop."""
+    try:
+        # TikTok
+        if _is_tiktok(url):
+            if _is_tiktok_video(url):
                 try:
-                    fields = render_page_fields(url, mobile=False)
+                    return await _tiktok_oembed_fields_async(url)
                 except Exception:
-                    pass
+                    if os.getenv("MFA_TIKTOK_RENDER") == "1" and HAVE_PLAYWRIGHT:
+                        try:
+                            return await render_page_fields_async(url, mobile=True)
+                        except Exception:
+                            pass
+                    html = await fetch_html_async(url)
+                    return extract_content_fields(html)
+            else:
+                if os.getenv("MFA_TIKTOK_RENDER") == "1" and HAVE_PLAYWRIGHT:
+                    try:
+                        return await render_page_fields_async(url, mobile=True)
+                    except Exception:
+                        pass
+                return _tiktok_profile_fields()
+
+        # Facebook
+        if _is_facebook(url):
+            return await facebook_public_fields_async(url)
+
+        # Generic website
+        html = await fetch_html_async(url)
+        fields = extract_content_fields(html)
+
+        if _should_render(fields):
+            try:
+                fields = await render_page_fields_async(url, mobile=False)
+            except Exception:
+                pass
 
         return fields
 
     except Exception as e:
-        return {"title": "Fetch error", "metas": {"error": str(e)}, "h1": [], "h2": [], "text": ""}
+        return _fetch_error_fields(e)
@@ -0,0 +1,164 @@
+# app/services/html_extract.py
+"""
+Trích xuất field từ HTML trong MỘT lần duyệt (tokenizer html.parser của stdlib),
+thay cho việc dựng cây BeautifulSoup rồi find_all nhiều lần.
+
+- Thu title, meta, h1/h2 và text các thẻ <p> cùng lúc.
+- Dừng sớm khi text <p> đã đủ `text_budget` ký tự (text vốn bị cắt ở 12.000 ký tự),
+  hoặc ngay khi vào <body> nếu chỉ cần phần <head> (OG tags của Facebook).
+- HTML được feed theo lát FEED_CHUNK nên html.parser có thể cắt một đoạn text làm nhiều
+  lần handle_data: text thô được gom lại đến sự kiện thẻ kế tiếp rồi mới strip, để mỗi
+  text node khớp với một NavigableString của bs4 (`get_text(" ", strip=True)`).
+"""
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+TEXT_BUDGET = 12000
+FEED_CHUNK = 8 * 1024
+
+# Nội dung các thẻ này không phải text hiển thị (giống get_text của bs4)
+_SKIP_TEXT_TAGS = {"script", "style", "template", "noscript"}
+_COLLECT_TAGS = {"p", "h1", "h2"}
+
+
+class _FieldsParser(HTMLParser):
+    def __init__(self, text_budget: int, head_only: bool):
+        super().__init__(convert_charrefs=True)
+        self.text_budget = text_budget
+        self.head_only = head_only
+        self.done = False
+
+        self.title: Optional[str] = None
+        self.metas: Dict[str, str] = {}
+        self.paragraphs: List[str] = []
+        self.h1: List[str] = []
+        self.h2: List[str] = []
+
+        self._text_len = 0
+        self._in_title = False
+        self._title_parts: List[str] = []
+        self._pending: List[str] = []
+        self._skip_depth = 0
+        # Thẻ đang thu text (p/h1/h2) -> các mảnh text
+        self._open: Dict[str, List[str]] = {}
+
+    # ---------- tokenizer callbacks ----------
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if self.done:
+            return
+        if tag == "meta":
+            self._meta(attrs)
+            return
+        if tag == "body" and self.head_only:
+            self.done = True
+            return
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag in _SKIP_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag in _COLLECT_TAGS:
+            if tag == "p" and "p" in self._open:
+                # <p> mới ngầm đóng <p> trước (theo HTML spec)
+                self._close("p")
+            self._open.setdefault(tag, [])
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+        if tag == "meta" and not self.done:
+            self._meta(attrs)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if self.done:
+            return
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()
+        elif tag in _SKIP_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._open:
+            self._close(tag)
+        elif tag == "head" and self.head_only:
+            self.done = True
+
+    def handle_data(self, data):
+        if not self.done:
+            self._pending.append(data)
+
+    def handle_comment(self, data):
+        # Comment là node riêng trong bs4 -> tách text hai bên
+        self._flush()
+
+    # ---------- helpers ----------
+    def _flush(self):
+        """Xử lý text node đã gom đủ (gọi ở mỗi sự kiện thẻ, trước khi đổi trạng thái)."""
+        if not self._pending:
+            return
+        data = "".join(self._pending)
+        self._pending.clear()
+        if self.done or self._skip_depth:
+            return
+        if self._in_title:
+            self._title_parts.append(data)
+        if self._open:
+            piece = data.strip()
+            if piece:
+                for parts in self._open.values():
+                    parts.append(piece)
+
+    def _meta(self, attrs):
+        a = dict(attrs)
+        name = (a.get("name") or a.get("property") or a.get("http-equiv") or "").lower()
+        content = a.get("content")
+        if name and content:
+            self.metas[name] = content
+
+    def _close(self, tag: str):
+        text = " ".join(self._open.pop(tag))
+        if tag == "p":
+            self.paragraphs.append(text)
+            self._text_len += len(text) + 1
+            if self._text_len >= self.text_budget:
+                self.done = True
+        elif tag == "h1":
+            self.h1.append(text)
+        else:
+            self.h2.append(text)
+
+    def finish(self):
+        # Thẻ chưa đóng khi hết tài liệu vẫn được tính (như bs4)
+        self._flush()
+        for tag in list(self._open):
+            self._close(tag)
+        if self._in_title:
+            self.title = "".join(self._title_parts).strip()
+
+
+def parse_fields(html: str, text_budget: int = TEXT_BUDGET, head_only: bool = False) -> _FieldsParser:
+    parser = _FieldsParser(text_budget, head_only)
+    for i in range(0, len(html), FEED_CHUNK):
+        parser.feed(html[i:i + FEED_CHUNK])
+        if parser.done:
+            break
+    if not parser.done:
+        parser.close()
+    parser.finish()
+    return parser
+
+
+def extract_fields(html: str, text_budget: int = TEXT_BUDGET) -> dict:
+    """{"title", "metas", "h1", "h2", "text"} – cùng định dạng với crawl.extract_content_fields."""
+    p = parse_fields(html, text_budget)
+    return {
+        "title": p.title or "",
+        "metas": p.metas,
+        "h1": p.h1,
+        "h2": p.h2,
+        "text": " ".join(p.paragraphs)[:text_budget],
+    }
+
+
+def extract_head(html: str) -> _FieldsParser:
+    """Chỉ đọc <head> (title + meta), dừng khi gặp <body>."""
+    return parse_fields(html, head_only=True)
@@ -0,0 +1,240 @@
+# app/services/http_fetch.py
+"""
+Lớp fetch HTTP dùng chung cho crawl (thay cho requests.get rời rạc):
+
+- httpx.Client / httpx.AsyncClient dùng lại kết nối (keep-alive, HTTP/2 nếu có `h2`),
+  giới hạn số kết nối đồng thời cho mỗi host.
+- Cache trên đĩa cho GET 200: lần sau gửi request có điều kiện (If-None-Match /
+  If-Modified-Since); server trả 304 thì dùng lại nội dung đã lưu.
+- `max_age`: trong khoảng này dùng thẳng bản cache, không gọi mạng (ví dụ oEmbed theo URL video).
+- Cache giữ tối đa HTTP_CACHE_MAX_FILES mục ghi/xác thực lại gần nhất (dọn sau mỗi
+  _PRUNE_EVERY lần ghi, không phải mỗi lần).
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Dict, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import h2  # noqa: F401  (httpx cần gói h2 để bật HTTP/2)
+    HAVE_H2 = True
+except Exception:
+    HAVE_H2 = False
+
+# =============================
+# CONFIG
+# =============================
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+HTTP_CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", str(Path(MEDIA_ROOT) / "cache" / "http")))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "4"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_CACHE_ENABLED = os.getenv("MFA_HTTP_CACHE", "1") != "0"
+HTTP_CACHE_MAX_FILES = int(os.getenv("HTTP_CACHE_MAX_FILES", "5000"))
+_PRUNE_EVERY = 100
+
+_LIMITS = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=20)
+
+
+class FetchResult:
+    __slots__ = ("url", "status_code", "text", "headers", "from_cache")
+
+    def __init__(self, url: str, status_code: int, text: str, headers: Dict[str, str], from_cache: bool):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        self.from_cache = from_cache
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise httpx.HTTPStatusError(
+                f"HTTP {self.status_code} for {self.url}",
+                request=httpx.Request("GET", self.url),
+                response=httpx.Response(self.status_code),
+            )
+
+    def json(self):
+        return json.loads(self.text)
+
+
+# =============================
+# DISK CACHE
+# =============================
+def _cache_key(url: str, headers: Optional[Dict[str, str]]) -> str:
+    # Nội dung khác nhau theo User-Agent (desktop / mobile) -> đưa vào khóa
+    ua = (headers or {}).get("User-Agent", "")
+    return hashlib.sha256(f"{url}\n{ua}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return HTTP_CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def _cache_load(key: str) -> Optional[Dict]:
+    if not HTTP_CACHE_ENABLED:
+        return None
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+_stores_since_prune = 0
+
+
+def _cache_store(key: str, entry: Dict) -> None:
+    global _stores_since_prune
+    if not HTTP_CACHE_ENABLED:
+        return
+    path = _cache_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[http_fetch] Không ghi được cache: {e}")
+    _stores_since_prune += 1
+    if _stores_since_prune >= _PRUNE_EVERY:
+        _stores_since_prune = 0
+        prune()
+
+
+def _mtime(p: Path) -> float:
+    try:
+        return p.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def prune(max_files: int = HTTP_CACHE_MAX_FILES) -> None:
+    """Giữ tối đa `max_files` mục được ghi/xác thực lại (304) gần nhất."""
+    try:
+        files = sorted(HTTP_CACHE_DIR.glob("*/*.json"), key=_mtime, reverse=True)
+    except OSError:
+        return
+    for p in files[max_files:]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+def _conditional_headers(headers: Optional[Dict[str, str]], cached: Optional[Dict]) -> Dict[str, str]:
+    out = dict(headers or {})
+    if cached:
+        if cached.get("etag"):
+            out["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            out["If-Modified-Since"] = cached["last_modified"]
+    return out
+
+
+def _fresh(cached: Optional[Dict], max_age: Optional[float]) -> bool:
+    return bool(cached) and max_age is not None and time.time() - cached.get("stored_at", 0) < max_age
+
+
+def _from_cache(cached: Dict) -> FetchResult:
+    return FetchResult(cached["url"], 200, cached["text"], cached.get("headers", {}), True)
+
+
+def _handle_response(key: str, url: str, resp: httpx.Response, cached: Optional[Dict],
+                     max_age: Optional[float]) -> FetchResult:
+    if resp.status_code == 304 and cached:
+        cached["stored_at"] = time.time()
+        _cache_store(key, cached)
+        return _from_cache(cached)
+    result = FetchResult(str(resp.url), resp.status_code, resp.text,
+                         {"content-type": resp.headers.get("content-type", "")}, False)
+    etag = resp.headers.get("etag")
+    last_modified = resp.headers.get("last-modified")
+    # Chỉ lưu khi có validator (request có điều kiện được) hoặc người gọi muốn cache theo max_age
+    if resp.status_code == 200 and (etag or last_modified or max_age):
+        _cache_store(key, {
+            "url": result.url,
+            "text": result.text,
+            "headers": result.headers,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+        })
+    return result
+
+
+# =============================
+# CLIENTS
+# =============================
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+_host_sync_sems: Dict[str, threading.BoundedSemaphore] = {}
+
+_async_client: Optional[httpx.AsyncClient] = None
+_host_async_sems: Dict[str, asyncio.Semaphore] = {}
+
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def _get_sync_client() -> httpx.Client:
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            _sync_client = httpx.Client(http2=HAVE_H2, limits=_LIMITS, follow_redirects=True)
+        return _sync_client
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(http2=HAVE_H2, limits=_LIMITS, follow_redirects=True)
+    return _async_client
+
+
+def fetch(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 25,
+          max_age: Optional[float] = None) -> FetchResult:
+    """GET đồng bộ (dùng trong threadpool) qua client chung + cache có điều kiện."""
+    key = _cache_key(url, headers)
+    cached = _cache_load(key)
+    if _fresh(cached, max_age):
+        return _from_cache(cached)
+    with _sync_lock:
+        sem = _host_sync_sems.setdefault(_host(url), threading.BoundedSemaphore(HTTP_PER_HOST_LIMIT))
+    with sem:
+        resp = _get_sync_client().get(url, headers=_conditional_headers(headers, cached), timeout=timeout)
+    return _handle_response(key, url, resp, cached, max_age)
+
+
+async def fetch_async(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 25,
+                      max_age: Optional[float] = None) -> FetchResult:
+    """GET bất đồng bộ (trên event loop của FastAPI) qua client chung + cache có điều kiện."""
+    key = _cache_key(url, headers)
+    cached = await run_in_threadpool(_cache_load, key)
+    if _fresh(cached, max_age):
+        return _from_cache(cached)
+    sem = _host_async_sems.setdefault(_host(url), asyncio.Semaphore(HTTP_PER_HOST_LIMIT))
+    async with sem:
+        resp = await _get_async_client().get(url, headers=_conditional_headers(headers, cached), timeout=timeout)
+    return await run_in_threadpool(_handle_response, key, url, resp, cached, max_age)
+
+
+async def aclose():
+    """Đóng các client (gọi khi tắt server)."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
@@ -0,0 +1,120 @@
+# app/services/loudness.py
+"""
+Đo loudness (EBU R128) một lần cho mỗi file nguồn và dùng lại kết quả.
+
+`loudnorm` một pass (như trước đây trong preprocess_audio) vừa chậm (upsample 192 kHz,
+limiter động) vừa đoán sai ở đầu file. Ở đây mỗi nguồn chỉ được đo một lần
+(`loudnorm=print_format=json`, chỉ decode audio), kết quả lưu trong render_cache
+theo dấu vân tay file; các bước sau (tiền xử lý ASR, mix voice/BGM) chỉ cần
+áp gain tuyến tính `volume=XdB`, tức là chế độ linear của loudnorm pass 2
+mà không phải chạy lại bộ lọc.
+"""
+import os
+import re
+import json
+import math
+import threading
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services import render_cache
+from app.services.process_runner import run_process, run_process_blocking
+
+LOUDNESS_TIMEOUT = float(os.getenv("LOUDNESS_TIMEOUT", "300"))
+_MEASURE_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11:print_format=json"
+_LOUDNORM_JSON_RE = re.compile(r"\{[^{}]*\"input_i\"[^{}]*\}", re.S)
+# Dưới ngưỡng này coi như im lặng (file silence tổng hợp) -> không tính gain
+_SILENCE_LUFS = -70.0
+
+# fingerprint -> kết quả đo (đỡ đọc lại file cache trong cùng tiến trình)
+_MEMO: Dict[str, Dict] = {}
+
+
+def _measure_cmd(ffmpeg_bin: str, path: str) -> list:
+    # loudnorm in JSON ở mức info -> không dùng -loglevel error
+    return [ffmpeg_bin, "-hide_banner", "-nostats", "-i", path,
+            "-vn", "-sn", "-af", _MEASURE_FILTER, "-f", "null", "-"]
+
+
+def parse_loudnorm(stderr: str) -> Dict[str, float]:
+    """{"input_i", "input_tp", "input_lra", "input_thresh"} từ log của loudnorm (rỗng nếu không thấy)."""
+    found = _LOUDNORM_JSON_RE.findall(stderr)
+    if not found:
+        return {}
+    try:
+        return {k: float(v) for k, v in json.loads(found[-1]).items() if k.startswith("input_")}
+    except ValueError:
+        return {}
+
+
+async def measure(ffmpeg_bin: str, path: str) -> Dict[str, float]:
+    """Đo trực tiếp, không cache (thư viện BGM tự lưu kết quả trong metadata)."""
+    r = await run_process(_measure_cmd(ffmpeg_bin, path), capture_stdout=False,
+                          timeout=LOUDNESS_TIMEOUT, check=True)
+    return parse_loudnorm(r.stderr)
+
+
+def _key(fingerprint: str) -> str:
+    return render_cache.cache_key("loudness", source=fingerprint)
+
+
+def _lookup(fingerprint: str) -> Optional[Dict]:
+    if fingerprint in _MEMO:
+        return _MEMO[fingerprint]
+    cached = render_cache.get_json(_key(fingerprint))
+    if cached is not None:
+        _MEMO[fingerprint] = cached
+    return cached
+
+
+def _store(fingerprint: str, result: Dict) -> Dict:
+    _MEMO[fingerprint] = result
+    render_cache.put_json(_key(fingerprint), result)
+    return result
+
+
+async def analyze(ffmpeg_bin: str, path: str) -> Dict[str, float]:
+    """Loudness của `path` (đo một lần, cache theo nội dung file). Lỗi/không có audio -> {}."""
+    fp = await run_in_threadpool(render_cache.fingerprint, path)
+    cached = _lookup(fp)
+    if cached is not None:
+        return cached
+    try:
+        result = await measure(ffmpeg_bin, path)
+    except Exception as e:
+        print(f"[loudness] Không đo được {path}: {e}")
+        return {}
+    return _store(fp, result)
+
+
+def analyze_blocking(ffmpeg_bin: str, path: str,
+                     cancel_event: Optional[threading.Event] = None) -> Dict[str, float]:
+    """Như analyze(), cho code chạy trong worker thread (preprocess_audio)."""
+    fp = render_cache.fingerprint(path)
+    cached = _lookup(fp)
+    if cached is not None:
+        return cached
+    try:
+        r = run_process_blocking(_measure_cmd(ffmpeg_bin, path), cancel_event=cancel_event,
+                                 capture_stdout=False, timeout=LOUDNESS_TIMEOUT, check=True)
+    except Exception as e:
+        print(f"[loudness] Không đo được {path}: {e}")
+        return {}
+    return _store(fp, parse_loudnorm(r.stderr))
+
+
+def linear_gain_db(measured: Optional[Dict], target_i: float, target_tp: float) -> Optional[float]:
+    """
+    Gain (dB) đưa loudness tích hợp về `target_i` mà đỉnh thật không vượt `target_tp`.
+    None nếu chưa đo được / nguồn im lặng -> người gọi giữ gain mặc định.
+    """
+    if not measured:
+        return None
+    i, tp = measured.get("input_i"), measured.get("input_tp")
+    if i is None or not math.isfinite(i) or i < _SILENCE_LUFS:
+        return None
+    gain = target_i - i
+    if tp is not None and math.isfinite(tp):
+        gain = min(gain, target_tp - tp)
+    return round(gain, 2)
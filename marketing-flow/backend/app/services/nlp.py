@@ -6,6 +6,8 @@ import google.generativeai as genai
 from google.generativeai import types
 from pydantic import BaseModel
 
+from app.services.rate_limit import INTERACTIVE, TokenBucket, current_priority
+
 # --- Cấu hình Model ---
 MODEL = "gemini-2.5-flash"
 SYSTEM = (
@@ -28,6 +30,11 @@ gemini_model = genai.GenerativeModel(
     system_instruction=SYSTEM
 )
 
+# Quota Gemini theo phút, dùng chung cho mọi lời gọi generate_content
+GEMINI_BUCKET = TokenBucket("gemini", float(os.getenv("GEMINI_RPM", "10")))
+# Số trang gộp vào một lời gọi Gemini khi phân tích hàng loạt
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "5"))
+
 # ---- Structured output schema (reliable JSON) ----
 class SEO(BaseModel):
     title_suggestion: Optional[str] = None
@@ -40,6 +47,9 @@ class Insights(BaseModel):
     improvements: List[str]
     seo: SEO
 
+class InsightsBatch(BaseModel):
+    items: List[Insights]
+
 # ---- Lightweight heuristics (Giữ nguyên) ----
 STOPWORDS = {
     "the","a","an","and","or","of","to","in","on","for","is","are","be","with","as","by","at","that",
@@ -88,36 +98,103 @@ def _heuristic_insights(content: Dict) -> Dict:
 # --- HẾT HÀM HELPERS ---
 
 
-def analyze_competitor(content: Dict) -> Dict: 
-    
-    # --- ĐÃ SỬA LỖI ---
-    # Thay 'genai.API_KEY' bằng biến 'GEMINI_API_KEY' mà chúng ta đã lưu
-    if os.getenv("MFA_LLM_OFF") == "1" or not GEMINI_API_KEY:
-        return _heuristic_insights(content)
+def _llm_off() -> bool:
+    return os.getenv("MFA_LLM_OFF") == "1" or not GEMINI_API_KEY
 
-    user = f"""Title: {content.get('title','')}
+
+def _content_prompt(content: Dict, body_limit: int = 8000) -> str:
+    return f"""Title: {content.get('title','')}
 H1: {content.get('h1','')}
 H2: {content.get('h2','')}
 Meta: {content.get('metas',{})}
 
 Body:
-{content.get('text','')[:8000]}
+{content.get('text','')[:body_limit]}
 """
+
+
+def _insights_config(schema) -> types.GenerationConfig:
+    return types.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+        temperature=0.2,
+    )
+
+
+def _is_quota_error(e: Exception) -> bool:
+    msg = str(e)
+    return "429" in msg or "ResourceExhausted" in type(e).__name__ or "quota" in msg.lower()
+
+
+def _fallback(content: Dict, e: Exception) -> Dict:
+    data = _heuristic_insights(content)
+    data["_note"] = f"Fallback used due to error: {e}"
+    return data
+
+
+def analyze_competitor(content: Dict) -> Dict: 
+    
+    # --- ĐÃ SỬA LỖI ---
+    # Thay 'genai.API_KEY' bằng biến 'GEMINI_API_KEY' mà chúng ta đã lưu
+    if _llm_off():
+        return _heuristic_insights(content)
+
+    user = _content_prompt(content)
     try:
+        GEMINI_BUCKET.acquire_blocking(current_priority(INTERACTIVE))
         resp = gemini_model.generate_content(
             contents=user,
-            generation_config=types.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=Insights,
-                temperature=0.2,
-            ),
+            generation_config=_insights_config(Insights),
         )
         return json.loads(resp.text)
     
     except Exception as e:
-        data = _heuristic_insights(content)
-        data["_note"] = f"Fallback used due to error: {e}"
-        return data
+        if _is_quota_error(e):
+            GEMINI_BUCKET.penalize()
+        return _fallback(content, e)
+
+
+async def analyze_competitors_async(contents: List[Dict]) -> List[Dict]:
+    """
+    Phân tích nhiều trang bằng MỘT lời gọi Gemini (không chặn event loop).
+    Kết quả theo đúng thứ tự `contents`; Gemini trả thiếu/thừa phần tử thì
+    từng trang dùng heuristic kèm `_note`.
+    """
+    if not contents:
+        return []
+    if _llm_off():
+        return [_heuristic_insights(c) for c in contents]
+
+    # Giữ tổng độ dài prompt tương đương khi phân tích một trang
+    body_limit = max(2000, 8000 // len(contents))
+    if len(contents) == 1:
+        user, schema = _content_prompt(contents[0], body_limit), Insights
+    else:
+        pages = "\n\n".join(
+            f"### Page {i + 1}\n{_content_prompt(c, body_limit)}" for i, c in enumerate(contents)
+        )
+        user = (
+            f"Analyze each of the {len(contents)} pages below separately. "
+            f"Return {{\"items\": [...]}} with exactly {len(contents)} items, in page order.\n\n{pages}"
+        )
+        schema = InsightsBatch
+    try:
+        await GEMINI_BUCKET.acquire(current_priority(INTERACTIVE))
+        resp = await gemini_model.generate_content_async(
+            contents=user,
+            generation_config=_insights_config(schema),
+        )
+        data = json.loads(resp.text)
+        if schema is Insights:
+            return [data]
+        items = data.get("items") or []
+        if len(items) != len(contents):
+            raise ValueError(f"Gemini trả {len(items)}/{len(contents)} kết quả")
+        return items
+    except Exception as e:
+        if _is_quota_error(e):
+            GEMINI_BUCKET.penalize()
+        return [_fallback(c, e) for c in contents]
     
     # [THÊM VÀO CUỐI TỆP nlp.py]
 
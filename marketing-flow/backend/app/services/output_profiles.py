@@ -0,0 +1,104 @@
+# app/services/output_profiles.py
+"""
+Profile đầu ra cho /process-remix (output_profiles="9:16,1:1,4:5:pad,16:9").
+
+Mọi profile được render trong MỘT lệnh ffmpeg: video gốc decode (và lật) một lần rồi
+`split` thành N nhánh, mỗi nhánh scale + crop/pad về khung của profile và vẽ phụ đề
+bằng file ASS riêng (cỡ chữ/lề tính theo khung đó); audio `asplit` N lần; mỗi profile một encode.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+FIT_CROP = "crop"  # lấp đầy khung, cắt phần thừa
+FIT_PAD = "pad"    # giữ trọn hình, thêm viền đen
+
+# Tỉ lệ -> kích thước khung (px)
+ASPECT_SIZES: Dict[str, Tuple[int, int]] = {
+    "9:16": (1080, 1920),
+    "1:1": (1080, 1080),
+    "4:5": (1080, 1350),
+    "16:9": (1920, 1080),
+}
+# Video nguồn chủ yếu là dọc: cắt sang 16:9 sẽ mất gần hết hình nên mặc định pad
+_DEFAULT_FIT = {"16:9": FIT_PAD}
+
+
+class OutputProfile:
+    __slots__ = ("aspect", "fit", "width", "height")
+
+    def __init__(self, aspect: str, fit: Optional[str] = None):
+        if aspect not in ASPECT_SIZES:
+            raise ValueError(f"Tỉ lệ không hỗ trợ: {aspect} (chọn {', '.join(ASPECT_SIZES)})")
+        fit = fit or _DEFAULT_FIT.get(aspect, FIT_CROP)
+        if fit not in (FIT_CROP, FIT_PAD):
+            raise ValueError(f"Kiểu khung không hỗ trợ: {fit} (crop | pad)")
+        self.aspect = aspect
+        self.fit = fit
+        self.width, self.height = ASPECT_SIZES[aspect]
+
+    @property
+    def key(self) -> str:
+        return f"{self.aspect}:{self.fit}"
+
+    @property
+    def slug(self) -> str:
+        return f"{self.aspect.replace(':', 'x')}_{self.fit}"
+
+    def frame_size(self, max_height: Optional[int] = None) -> Tuple[int, int]:
+        """Kích thước khung, thu nhỏ theo `max_height` (bản preview); luôn chẵn cho yuv420p."""
+        w, h = self.width, self.height
+        if max_height and h > max_height:
+            w, h = w * max_height / h, max_height
+        return int(w) // 2 * 2, int(h) // 2 * 2
+
+    def video_filter(self, w: int, h: int) -> str:
+        if self.fit == FIT_PAD:
+            return (f"scale={w}:{h}:force_original_aspect_ratio=decrease:force_divisible_by=2,"
+                    f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1")
+        return f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},setsar=1"
+
+    def subtitle_layout(self, src_w: int, src_h: int) -> Dict:
+        """
+        Cỡ chữ/lề ASS theo khung đầy đủ của profile (PlayRes = khung nên libass tự co
+        khi render preview). Với pad, phụ đề nằm trong vùng hình chứ không rơi vào viền đen.
+        """
+        w, h = self.width, self.height
+        cw, ch = w, h
+        if self.fit == FIT_PAD and src_w and src_h:
+            scale = min(w / src_w, h / src_h)
+            cw, ch = src_w * scale, src_h * scale
+        bar_v, bar_h = (h - ch) / 2, (w - cw) / 2
+        return {
+            "fontsize": max(34, min(65, int(round(ch * 0.060)))),
+            "margin_v": int(bar_v) + max(80, int(round(ch * 0.09))),
+            "margin_h": int(bar_h) + max(40, int(round(cw * 0.05))),
+            "play_res": (w, h),
+        }
+
+
+def parse_profiles(spec: Optional[str]) -> List[OutputProfile]:
+    """
+    "9:16,1:1:pad" hoặc JSON ["9:16", "16:9:crop"] -> danh sách profile (bỏ trùng, giữ thứ tự).
+    Chuỗi rỗng -> [] (render một bản như cũ). Sai định dạng -> ValueError.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return []
+    if spec.startswith("["):
+        items = [str(x) for x in json.loads(spec)]
+    else:
+        items = spec.split(",")
+    profiles: List[OutputProfile] = []
+    seen = set()
+    for item in items:
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Profile không hợp lệ: {item}")
+        profile = OutputProfile(f"{parts[0]}:{parts[1]}", parts[2] if len(parts) == 3 else None)
+        if profile.key not in seen:
+            seen.add(profile.key)
+            profiles.append(profile)
+    return profiles
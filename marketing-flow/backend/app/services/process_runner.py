@@ -0,0 +1,399 @@
+# app/services/process_runner.py
+"""
+Chạy tiến trình con (ffmpeg/ffprobe) trực tiếp trên event loop bằng
+asyncio.create_subprocess_exec, thay cho subprocess.run trong threadpool:
+
+- stderr được đọc dần vào ring buffer giới hạn (PROCESS_STDERR_TAIL dòng cuối);
+  dòng tiến độ `-stats` (kết thúc bằng \\r) chỉ giữ bản mới nhất.
+- timeout hoặc task bị hủy -> kill cả process group của tiến trình con.
+- Mỗi lần gọi ghi lại thời gian chạy, CPU time và RSS tối đa (lấy mẫu /proc trên Linux),
+  xem qua /health/processes.
+- Event loop không hỗ trợ subprocess (SelectorEventLoop trên Windows, VD `uvicorn --reload`)
+  -> chạy bằng subprocess.Popen + thread đọc stderr trong threadpool, cùng hành vi timeout/hủy.
+"""
+import os
+import re
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+PROCESS_STDERR_TAIL = int(os.getenv("PROCESS_STDERR_TAIL", "200"))
+PROCESS_KILL_GRACE = float(os.getenv("PROCESS_KILL_GRACE", "3"))
+_SAMPLE_INTERVAL = 0.5
+_READ_CHUNK = 4096
+_LINE_SPLIT = re.compile(rb"[\r\n]")
+# Dòng tiến độ của ffmpeg -stats
+_PROGRESS_PREFIXES = ("frame=", "size=")
+
+try:
+    _CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLK_TCK = 100
+
+
+class ProcessResult:
+    __slots__ = ("cmd", "returncode", "stdout", "stderr_tail", "progress",
+                 "elapsed_sec", "cpu_sec", "max_rss_kb", "timed_out")
+
+    def __init__(self, cmd: List[str], returncode: Optional[int], stdout: str, stderr_tail: List[str],
+                 progress: Optional[str], elapsed_sec: float, cpu_sec: Optional[float],
+                 max_rss_kb: Optional[int], timed_out: bool):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr_tail = stderr_tail
+        self.progress = progress
+        self.elapsed_sec = elapsed_sec
+        self.cpu_sec = cpu_sec
+        self.max_rss_kb = max_rss_kb
+        self.timed_out = timed_out
+
+    @property
+    def stderr(self) -> str:
+        return "\n".join(self.stderr_tail)
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    def summary(self) -> Dict:
+        return {
+            "bin": os.path.basename(self.cmd[0]) if self.cmd else "",
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+            "cpu_sec": None if self.cpu_sec is None else round(self.cpu_sec, 3),
+            "max_rss_kb": self.max_rss_kb,
+        }
+
+
+class ProcessError(RuntimeError):
+    def __init__(self, result: ProcessResult, message: Optional[str] = None):
+        self.result = result
+        if message is None:
+            reason = "timed out" if result.timed_out else f"code {result.returncode}"
+            message = (
+                f"{os.path.basename(result.cmd[0])} failed ({reason}).\n"
+                f"CMD: {' '.join(result.cmd)}\n\nSTDERR:\n{result.stderr}"
+            )
+        super().__init__(message)
+
+
+# =============================
+# METRICS
+# =============================
+_RUNNING: Dict[int, Dict] = {}
+_RECENT: Deque[Dict] = deque(maxlen=50)
+_TOTALS = {"runs": 0, "failed": 0, "timed_out": 0, "cancelled": 0, "cpu_sec": 0.0}
+
+
+def _record(result: ProcessResult, cancelled: bool = False) -> None:
+    _TOTALS["runs"] += 1
+    if cancelled:
+        _TOTALS["cancelled"] += 1
+    elif result.timed_out:
+        _TOTALS["timed_out"] += 1
+    elif result.returncode != 0:
+        _TOTALS["failed"] += 1
+    if result.cpu_sec:
+        _TOTALS["cpu_sec"] += result.cpu_sec
+    entry = result.summary()
+    entry["cancelled"] = cancelled
+    entry["finished_at"] = time.time()
+    _RECENT.append(entry)
+
+
+def process_stats() -> Dict:
+    now = time.monotonic()
+    return {
+        "running": [
+            {"pid": info["pid"], "bin": info["bin"], "elapsed_sec": round(now - info["started"], 1)}
+            for info in _RUNNING.values()
+        ],
+        "totals": {**_TOTALS, "cpu_sec": round(_TOTALS["cpu_sec"], 1)},
+        "recent": list(_RECENT),
+    }
+
+
+# =============================
+# HELPERS
+# =============================
+def _spawn_kwargs() -> Dict:
+    # Tiến trình con làm leader của group riêng để kill được cả các tiến trình cháu
+    if os.name == "posix":
+        return {"start_new_session": True}
+    return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+
+def _signal_group(proc, sig: int) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _terminate(proc: asyncio.subprocess.Process) -> None:
+    """SIGTERM cho cả group (ffmpeg tự đóng file), quá PROCESS_KILL_GRACE giây thì SIGKILL."""
+    if proc.returncode is None:
+        _signal_group(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), PROCESS_KILL_GRACE)
+        except asyncio.TimeoutError:
+            pass
+    # Dọn cả tiến trình cháu còn sót lại sau khi leader đã thoát
+    _signal_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+    await proc.wait()
+
+
+def _proc_sample(pid: int) -> Optional[Tuple[float, int]]:
+    """(CPU time giây, VmHWM kB) của tiến trình đang chạy; None nếu không có /proc."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        # utime, stime, cutime, cstime (trường 14-17 của /proc/<pid>/stat)
+        cpu = sum(int(x) for x in fields[11:15]) / _CLK_TCK
+        rss = 0
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    rss = int(line.split()[1])
+                    break
+        return cpu, rss
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def _sample_usage(pid: int, usage: Dict) -> None:
+    while True:
+        sample = _proc_sample(pid)
+        if sample is not None:
+            usage["cpu_sec"], usage["max_rss_kb"] = sample
+        await asyncio.sleep(_SAMPLE_INTERVAL)
+
+
+def _add_line(raw: bytes, tail: Deque[str], state: Dict) -> None:
+    line = raw.decode("utf-8", "replace").strip()
+    if not line:
+        return
+    if line.startswith(_PROGRESS_PREFIXES):
+        state["progress"] = line
+    else:
+        tail.append(line)
+
+
+def _consume(buf: bytes, chunk: bytes, tail: Deque[str], state: Dict) -> bytes:
+    """Tách `buf + chunk` thành dòng, trả phần dở dang còn lại."""
+    parts = _LINE_SPLIT.split(buf + chunk)
+    buf = parts.pop()
+    if len(buf) > 64 * 1024:
+        parts.append(buf)
+        buf = b""
+    for raw in parts:
+        _add_line(raw, tail, state)
+    return buf
+
+
+async def _pump_stderr(stream: asyncio.StreamReader, tail: Deque[str], state: Dict) -> None:
+    buf = b""
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        if not chunk:
+            break
+        buf = _consume(buf, chunk, tail, state)
+    _add_line(buf, tail, state)
+
+
+# =============================
+# FALLBACK: Popen + thread (loop không hỗ trợ subprocess)
+# =============================
+def _pump_stderr_sync(stream, tail: Deque[str], state: Dict) -> None:
+    buf = b""
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        chunk = read(_READ_CHUNK)
+        if not chunk:
+            break
+        buf = _consume(buf, chunk, tail, state)
+    _add_line(buf, tail, state)
+
+
+def _terminate_sync(proc: subprocess.Popen) -> None:
+    if proc.returncode is None:
+        _signal_group(proc, signal.SIGTERM)
+        try:
+            proc.wait(PROCESS_KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            pass
+    _signal_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+    proc.wait()
+
+
+def _popen_blocking(cmd: List[str], timeout: Optional[float], capture_stdout: bool, tail: Deque[str],
+                    state: Dict, usage: Dict, cancel: threading.Event) -> Tuple[Optional[int], bytes, bool]:
+    """Chạy trong worker thread; `cancel` được bật -> kill cả group. Trả (returncode, stdout, timed_out)."""
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        **_spawn_kwargs(),
+    )
+    _RUNNING[proc.pid] = {"pid": proc.pid, "bin": os.path.basename(cmd[0]), "started": started}
+    out = {"stdout": b""}
+    readers = [threading.Thread(target=_pump_stderr_sync, args=(proc.stderr, tail, state), daemon=True)]
+    if capture_stdout:
+        readers.append(threading.Thread(target=lambda: out.update(stdout=proc.stdout.read()), daemon=True))
+    for t in readers:
+        t.start()
+    timed_out = False
+    try:
+        while True:
+            try:
+                proc.wait(_SAMPLE_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            sample = _proc_sample(proc.pid)
+            if sample is not None:
+                usage["cpu_sec"], usage["max_rss_kb"] = sample
+            if cancel.is_set():
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                timed_out = True
+                break
+        _terminate_sync(proc)
+        for t in readers:
+            t.join()
+    finally:
+        _RUNNING.pop(proc.pid, None)
+    return proc.returncode, out["stdout"], timed_out
+
+
+async def _run_in_thread(cmd: List[str], timeout: Optional[float], check: bool, capture_stdout: bool,
+                         stderr_tail: int, started: float) -> ProcessResult:
+    tail: Deque[str] = deque(maxlen=max(1, stderr_tail))
+    state: Dict = {"progress": None}
+    usage: Dict = {"cpu_sec": None, "max_rss_kb": None}
+    cancel = threading.Event()
+    fut = asyncio.get_running_loop().run_in_executor(
+        None, _popen_blocking, cmd, timeout, capture_stdout, tail, state, usage, cancel
+    )
+
+    def _result(returncode, stdout: bytes, timed_out: bool) -> ProcessResult:
+        return ProcessResult(
+            cmd, returncode, stdout.decode("utf-8", "replace"), list(tail), state["progress"],
+            time.monotonic() - started, usage["cpu_sec"], usage["max_rss_kb"], timed_out,
+        )
+
+    try:
+        returncode, stdout, timed_out = await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        cancel.set()
+        returncode, stdout, _ = await fut
+        _record(_result(returncode, stdout, False), cancelled=True)
+        raise
+    result = _result(returncode, stdout, timed_out)
+    _record(result)
+    if check and not result.ok:
+        raise ProcessError(result)
+    return result
+
+
+# =============================
+# PUBLIC API
+# =============================
+async def run_process(
+    cmd: Sequence,
+    timeout: Optional[float] = None,
+    check: bool = False,
+    capture_stdout: bool = True,
+    stderr_tail: int = PROCESS_STDERR_TAIL,
+) -> ProcessResult:
+    """
+    Chạy `cmd` không chặn event loop. stdout được đọc toàn bộ (ffprobe), stderr chỉ giữ
+    `stderr_tail` dòng cuối. `check=True` -> raise ProcessError khi lỗi/timeout.
+    Task bị hủy -> tiến trình con (cả group) bị kill rồi CancelledError được raise tiếp.
+    """
+    cmd = [str(c) for c in cmd]
+    started = time.monotonic()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            **_spawn_kwargs(),
+        )
+    except NotImplementedError:
+        # SelectorEventLoop trên Windows không chạy được subprocess
+        return await _run_in_thread(cmd, timeout, check, capture_stdout, stderr_tail, started)
+    _RUNNING[proc.pid] = {"pid": proc.pid, "bin": os.path.basename(cmd[0]), "started": started}
+
+    tail: Deque[str] = deque(maxlen=max(1, stderr_tail))
+    state: Dict = {"progress": None}
+    usage: Dict = {"cpu_sec": None, "max_rss_kb": None}
+    sampler = asyncio.create_task(_sample_usage(proc.pid, usage))
+    readers = [asyncio.create_task(_pump_stderr(proc.stderr, tail, state))]
+    if capture_stdout:
+        readers.append(asyncio.create_task(proc.stdout.read()))
+
+    def _result(timed_out: bool) -> ProcessResult:
+        stdout = b""
+        if capture_stdout and readers[1].done() and not readers[1].cancelled() and readers[1].exception() is None:
+            stdout = readers[1].result()
+        return ProcessResult(
+            cmd, proc.returncode, stdout.decode("utf-8", "replace"), list(tail), state["progress"],
+            time.monotonic() - started, usage["cpu_sec"], usage["max_rss_kb"], timed_out,
+        )
+
+    timed_out = False
+    try:
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _terminate(proc)
+        await asyncio.gather(*readers, return_exceptions=True)
+    except asyncio.CancelledError:
+        await _terminate(proc)
+        for r in readers:
+            r.cancel()
+        _record(_result(False), cancelled=True)
+        raise
+    finally:
+        sampler.cancel()
+        _RUNNING.pop(proc.pid, None)
+
+    result = _result(timed_out)
+    _record(result)
+    if check and not result.ok:
+        raise ProcessError(result)
+    return result
+
+
+def run_process_blocking(cmd: Sequence, cancel_event: Optional[threading.Event] = None,
+                         **kwargs) -> ProcessResult:
+    """
+    Cho code đang chạy trong worker thread (ví dụ bước tiền xử lý trước Whisper).
+    `cancel_event` được bật -> kill tiến trình con và raise CancelledError.
+    """
+    async def _main() -> ProcessResult:
+        task = asyncio.ensure_future(run_process(cmd, **kwargs))
+        while cancel_event is not None and not task.done():
+            if cancel_event.is_set():
+                task.cancel()
+                break
+            await asyncio.wait({task}, timeout=_SAMPLE_INTERVAL)
+        return await task
+
+    return asyncio.run(_main())
@@ -0,0 +1,132 @@
+# app/services/rate_limit.py
+"""
+Token bucket dùng chung cho các API có quota theo phút (Google Sheets, Gemini...).
+
+- Thread-safe: dùng được từ cả event loop (acquire) lẫn threadpool (acquire_blocking).
+- Ưu tiên: lời gọi INTERACTIVE được dùng toàn bộ bucket; lời gọi BACKGROUND
+  phải chừa lại một phần (reserve) cho các lời gọi tương tác.
+- snapshot() trả về số liệu headroom để expose qua endpoint health.
+"""
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Độ ưu tiên của lời gọi hiện tại (None = tự suy ra theo loại lời gọi)
+_PRIORITY: ContextVar[Optional[str]] = ContextVar("mfa_call_priority", default=None)
+
+
+@contextmanager
+def call_priority(priority: str):
+    """Đặt độ ưu tiên cho mọi lời gọi API bên trong khối `with` (kể cả trong task con)."""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def current_priority(default: str = INTERACTIVE) -> str:
+    return _PRIORITY.get() or default
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 32.0) -> float:
+    """Exponential backoff với full jitter: random(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        name: str,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        reserve_fraction: float = 0.2,
+    ):
+        self.name = name
+        self.per_minute = float(per_minute)
+        self.rate = self.per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.reserve = self.capacity * reserve_fraction
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # metrics
+        self.acquired = 0
+        self.throttled = 0
+        self.waited_sec = 0.0
+        self.rate_limited = 0  # số lần server trả về 429
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, priority: str) -> float:
+        """Lấy 1 token nếu được; nếu không trả về số giây cần chờ."""
+        floor = 0.0 if priority == INTERACTIVE else self.reserve
+        with self._lock:
+            self._refill()
+            if self._tokens - 1.0 >= floor:
+                self._tokens -= 1.0
+                self.acquired += 1
+                return 0.0
+            return max(0.01, (floor + 1.0 - self._tokens) / self.rate)
+
+    async def acquire(self, priority: Optional[str] = None) -> float:
+        prio = priority or current_priority()
+        waited = 0.0
+        while True:
+            wait = self._try_take(prio)
+            if wait <= 0:
+                break
+            waited += wait
+            await asyncio.sleep(wait)
+        self._record_wait(waited)
+        return waited
+
+    def acquire_blocking(self, priority: Optional[str] = None) -> float:
+        prio = priority or current_priority()
+        waited = 0.0
+        while True:
+            wait = self._try_take(prio)
+            if wait <= 0:
+                break
+            waited += wait
+            time.sleep(wait)
+        self._record_wait(waited)
+        return waited
+
+    def _record_wait(self, waited: float) -> None:
+        if waited > 0:
+            with self._lock:
+                self.throttled += 1
+                self.waited_sec += waited
+
+    def penalize(self) -> None:
+        """Server báo 429: xả bucket để các lời gọi sau tự chậm lại."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+            self.rate_limited += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            tokens = self._tokens
+            return {
+                "per_minute": self.per_minute,
+                "capacity": self.capacity,
+                "available": round(tokens, 2),
+                "headroom_pct": round(100.0 * max(tokens, 0.0) / self.capacity, 1),
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "waited_sec": round(self.waited_sec, 2),
+                "rate_limited_429": self.rate_limited,
+            }
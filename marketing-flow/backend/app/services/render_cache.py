@@ -0,0 +1,106 @@
+# app/services/render_cache.py
+"""
+Cache kết quả render trung gian / bản preview trên đĩa (media/cache/render).
+
+- Khóa = sha256 của các tham số render + dấu vân tay file nguồn, nên bản preview và
+  bản render cuối cùng dùng lại được phần việc giống nhau (video đã remix, phụ đề Whisper).
+- Dấu vân tay lấy mẫu đầu/giữa/cuối file + kích thước: không phải đọc hết video vài trăm MB.
+"""
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+RENDER_CACHE_DIR = Path(os.getenv("RENDER_CACHE_DIR", str(Path(MEDIA_ROOT) / "cache" / "render")))
+RENDER_CACHE_MAX_FILES = int(os.getenv("RENDER_CACHE_MAX_FILES", "200"))
+_SAMPLE = 1024 * 1024
+
+
+def fingerprint(path: str) -> str:
+    """sha256(kích thước + 1MB đầu + 1MB giữa + 1MB cuối)."""
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - _SAMPLE // 2), max(0, size - _SAMPLE)):
+            f.seek(offset)
+            h.update(f.read(_SAMPLE))
+    return h.hexdigest()
+
+
+def cache_key(kind: str, **params: Any) -> str:
+    raw = json.dumps({"kind": kind, **params}, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}_{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _path(key: str, suffix: str) -> Path:
+    return RENDER_CACHE_DIR / f"{key}{suffix}"
+
+
+def get(key: str, suffix: str) -> Optional[str]:
+    p = _path(key, suffix)
+    if p.exists() and p.stat().st_size > 0:
+        os.utime(p)  # đánh dấu mới dùng (prune theo mtime)
+        return str(p)
+    return None
+
+
+def put(key: str, src: str, suffix: str, move: bool = True) -> str:
+    """Đưa file vào cache (rename nếu cùng ổ đĩa), trả đường dẫn trong cache."""
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    dst = _path(key, suffix)
+    tmp = dst.with_name(dst.name + ".tmp")
+    if move:
+        shutil.move(src, tmp)
+    else:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    prune()
+    return str(dst)
+
+
+def get_json(key: str) -> Optional[Any]:
+    p = get(key, ".json")
+    if p is None:
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def put_json(key: str, data: Any) -> None:
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _path(key, ".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, _path(key, ".json"))
+
+
+def get_cues(key: str) -> Optional[List[Tuple[int, float, float, str]]]:
+    data = get_json(key)
+    return None if data is None else [tuple(c) for c in data]
+
+
+def put_cues(key: str, cues) -> None:
+    put_json(key, [list(c) for c in cues])
+
+
+def prune(max_files: int = RENDER_CACHE_MAX_FILES) -> None:
+    """Giữ tối đa `max_files` file dùng gần nhất."""
+    try:
+        files = sorted(
+            (p for p in RENDER_CACHE_DIR.iterdir() if p.is_file() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+    except OSError:
+        return
+    for p in files[max_files:]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,402 @@
+# app/services/sheet_maintenance.py
+"""
+Các tác vụ bảo trì Google Sheet (chạy tay hoặc theo lịch).
+
+- dedupe_tab: gộp các hàng trùng 'Link Video gốc' (do /video/viral-analyze trước đây
+  luôn append) thành một hàng, xóa các hàng thừa bằng một lần batch_update.
+- archive_tab: chuyển các hàng "nguội" (đã xong hoặc quá N ngày) của tab nóng sang
+  tab lưu trữ theo tháng ("<tab> Archive YYYY-MM"): chép bằng USER_ENTERED (giữ kiểu
+  checkbox/số/ngày/công thức) rồi xóa khỏi tab nóng.
+  Điều kiện theo tuổi chỉ áp dụng khi tab có cột ngày thật; tab không có cột ngày
+  chỉ archive các hàng "đã xong".
+  Chạy định kỳ trong lifespan khi MFA_SHEET_ARCHIVE=1.
+
+Chạy từ thư mục backend:
+    python -m app.services.sheet_maintenance dedupe "Source Phân tích Video"          # chỉ báo cáo
+    python -m app.services.sheet_maintenance dedupe "Source Phân tích Video" --apply  # ghi thật
+    python -m app.services.sheet_maintenance archive MVP_Content_Plan --days 30 --apply
+"""
+import os
+import time
+import random
+import argparse
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import gspread
+from gspread.utils import rowcol_to_a1
+from gspread_asyncio import AsyncioGspreadClient
+
+from app.services.rate_limit import BACKGROUND, call_priority
+from app.services.sheet_mirror import find_header_row, mirror, normalize_url, row_status
+from app.services.sheets import (
+    _UPSERT_LOCKS, _a1_sheet, _get_async_client_manager, _notify_write, read_sheet_typed,
+)
+
+SPREADSHEET_ID = "1hcFoYNhmJdizx5s2id8gl_iPz_74fp5cZYz0I1bAJH8"
+DEFAULT_KEY_COLUMN = "Link Video gốc"
+
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("SHEET_ARCHIVE_MAX_AGE_DAYS", "30"))
+ARCHIVE_INTERVAL_SEC = float(os.getenv("SHEET_ARCHIVE_INTERVAL_HOURS", "24")) * 3600
+# Cột ngày (nếu tab có). Không có thì KHÔNG archive theo tuổi: URL/keyword không định danh
+# được một hàng (/mvp/run ghi lại URL đối thủ cũ vào hàng mới), nên không suy ra tuổi từ đó.
+DATE_COLUMNS = ("created at", "ngày tạo", "date", "ngày")
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y")
+
+
+def _merge_rows(rows: Sequence[Sequence[str]], width: int) -> List[str]:
+    """
+    Gộp các hàng trùng theo từng cột: lấy giá trị mới nhất khác rỗng và khác 'FALSE'
+    (checkbox đã tick / link đã điền ở hàng cũ không bị mất); nếu không có thì lấy
+    giá trị khác rỗng mới nhất.
+    """
+    merged: List[str] = []
+    for c in range(width):
+        cells = [str(r[c]) if c < len(r) else "" for r in rows]
+        filled = [v for v in cells if v.strip()]
+        meaningful = [v for v in filled if v.strip().upper() != "FALSE"]
+        merged.append((meaningful or filled or [""])[-1])
+    return merged
+
+
+def plan_dedupe(values: List[List[str]], key_column: str = DEFAULT_KEY_COLUMN) -> Dict:
+    """
+    Tính kế hoạch dedupe trên dữ liệu đã đọc (không gọi API).
+    Trả về {'updates': {row_number: merged_row}, 'deletes': [row_number...], 'groups': n}.
+    """
+    header_idx = find_header_row(values)
+    if header_idx < 0:
+        return {"updates": {}, "deletes": [], "groups": 0}
+    header = [str(h).strip().lower() for h in values[header_idx]]
+    try:
+        key_idx = header.index(key_column.strip().lower())
+    except ValueError:
+        raise RuntimeError(f"Không tìm thấy cột key '{key_column}'.")
+
+    groups: Dict[str, List[int]] = {}
+    for i in range(header_idx + 1, len(values)):
+        row = values[i]
+        key = normalize_url(str(row[key_idx])) if key_idx < len(row) else ""
+        if key:
+            groups.setdefault(key, []).append(i)
+
+    width = max(len(r) for r in values)
+    updates: Dict[int, List[str]] = {}
+    deletes: List[int] = []
+    dup_groups = 0
+    for indexes in groups.values():
+        if len(indexes) < 2:
+            continue
+        dup_groups += 1
+        keep = indexes[0]  # giữ vị trí hàng đầu tiên, dữ liệu gộp từ cả nhóm
+        merged = _merge_rows([values[i] for i in indexes], width)
+        current = [str(values[keep][c]) if c < len(values[keep]) else "" for c in range(width)]
+        if merged != current:
+            updates[keep + 1] = merged
+        deletes.extend(i + 1 for i in indexes[1:])
+    return {"updates": updates, "deletes": sorted(deletes), "groups": dup_groups}
+
+
+async def dedupe_tab(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    title: str,
+    key_column: str = DEFAULT_KEY_COLUMN,
+    apply: bool = False,
+) -> Dict:
+    """
+    Gộp hàng trùng key trong một tab. apply=False: chỉ trả về báo cáo.
+    Đọc theo FORMULA và ghi lại bằng USER_ENTERED để checkbox/số/ngày giữ nguyên kiểu.
+    """
+    values = await read_sheet_typed(gc, spreadsheet_id, title)
+    plan = plan_dedupe(values, key_column)
+    report = {
+        "sheet": title,
+        "rows": len(values),
+        "duplicate_groups": plan["groups"],
+        "rows_merged": len(plan["updates"]),
+        "rows_deleted": len(plan["deletes"]),
+        "applied": False,
+    }
+    if not apply or not (plan["updates"] or plan["deletes"]):
+        return report
+
+    sh = await gc.open_by_key(spreadsheet_id)
+    try:
+        ws = await sh.worksheet(title)
+    except gspread.WorksheetNotFound:
+        raise RuntimeError(f"Sheet '{title}' not found in spreadsheet.")
+
+    # 1. Ghi các hàng đã gộp (trước khi xóa, khi số hàng chưa dịch chuyển)
+    if plan["updates"]:
+        data = [
+            {"range": f"{rowcol_to_a1(n, 1)}:{rowcol_to_a1(n, len(row))}", "values": [row]}
+            for n, row in plan["updates"].items()
+        ]
+        await ws.batch_update(data, value_input_option="USER_ENTERED")
+
+    # 2. Xóa các hàng thừa trong một lần batch_update (từ dưới lên để index không lệch)
+    if plan["deletes"]:
+        await sh.batch_update({
+            "requests": [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": ws.id,
+                            "dimension": "ROWS",
+                            "startIndex": n - 1,
+                            "endIndex": n,
+                        }
+                    }
+                }
+                for n in sorted(plan["deletes"], reverse=True)
+            ]
+        })
+
+    _notify_write(spreadsheet_id, title)
+    # Số hàng đã dịch chuyển -> đọc lại ngay để index (row_number/url/status) khớp với sheet
+    if mirror.is_mirrored(spreadsheet_id, title):
+        await mirror.read(gc, spreadsheet_id, title, max_staleness=0)
+    report["applied"] = True
+    print(f"✅ Dedupe '{title}': gộp {plan['groups']} nhóm, xóa {len(plan['deletes'])} hàng.")
+    return report
+
+
+# =============================
+# ARCHIVE
+# =============================
+def _cell(header_map: Dict[str, int], row: Sequence[object], name: str) -> str:
+    idx = header_map.get(name, -1)
+    return str(row[idx]).strip() if 0 <= idx < len(row) else ""
+
+
+def _content_plan_done(header_map: Dict[str, int], row: Sequence[object]) -> bool:
+    """MVP_Content_Plan: đã đăng (có link Facebook/Instagram)."""
+    return row_status(header_map, row) == "published"
+
+
+def _remix_done(header_map: Dict[str, int], row: Sequence[object]) -> bool:
+    """Source Chỉnh sửa Video: video remix đã được upload."""
+    return "http" in _cell(header_map, row, "remix video link")
+
+
+# Tab nóng -> điều kiện "đã xong" (ngoài điều kiện theo tuổi)
+ARCHIVE_RULES: Dict[str, Callable[[Dict[str, int], Sequence[object]], bool]] = {
+    "MVP_Content_Plan": _content_plan_done,
+    "Source Chỉnh sửa Video": _remix_done,
+}
+
+
+def archive_enabled() -> bool:
+    return os.getenv("MFA_SHEET_ARCHIVE", "0") == "1"
+
+
+def archive_title(title: str, when: Optional[datetime] = None) -> str:
+    return f"{title} Archive {(when or datetime.now()):%Y-%m}"
+
+
+def _parse_date(value: str) -> Optional[float]:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def plan_archive(
+    values: List[List[str]],
+    title: str,
+    max_age_days: float = ARCHIVE_MAX_AGE_DAYS,
+    now: Optional[float] = None,
+) -> Dict:
+    """
+    Chọn các hàng cần chuyển sang tab lưu trữ (không gọi API).
+    Trả về {'header': [...], 'rows': [row_number...], 'done': n, 'old': n}.
+    """
+    header_idx = find_header_row(values)
+    if header_idx < 0:
+        return {"header": [], "rows": [], "done": 0, "old": 0}
+    header = values[header_idx]
+    header_map = {str(h).strip().lower(): i for i, h in enumerate(header)}
+    date_col = next((c for c in DATE_COLUMNS if c in header_map), None)
+    is_done = ARCHIVE_RULES.get(title)
+    now = now or time.time()
+    max_age = max_age_days * 86400
+
+    selected, done_count, old_count = [], 0, 0
+    for i in range(header_idx + 1, len(values)):
+        row = values[i]
+        if not any(str(c).strip() for c in row):
+            continue
+        if is_done and is_done(header_map, row):
+            selected.append(i + 1)
+            done_count += 1
+            continue
+        created = _parse_date(_cell(header_map, row, date_col)) if date_col else None
+        if max_age > 0 and created is not None and now - created > max_age:
+            selected.append(i + 1)
+            old_count += 1
+    return {"header": header, "rows": selected, "done": done_count, "old": old_count}
+
+
+def _row_runs(row_numbers: Sequence[int]) -> List[List[int]]:
+    """Gom các row_number liên tiếp thành [start, end] (1-based, bao gồm end)."""
+    runs: List[List[int]] = []
+    for n in sorted(row_numbers):
+        if runs and n == runs[-1][1] + 1:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+    return runs
+
+
+async def archive_tab(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    title: str,
+    max_age_days: float = ARCHIVE_MAX_AGE_DAYS,
+    apply: bool = False,
+) -> Dict:
+    """
+    Chuyển hàng nguội của `title` sang tab lưu trữ theo tháng.
+    Tạo tab lưu trữ (nếu chưa có), append các hàng (giữ kiểu giá trị) rồi xóa chúng khỏi
+    tab nóng, sau đó đánh dấu dirty và làm mới bản sao SQLite.
+    """
+    # Dùng chung khóa với upsert_rows để không có hàng mới chen vào giữa lúc xóa
+    lock = _UPSERT_LOCKS.setdefault((spreadsheet_id, title), asyncio.Lock())
+    async with lock:
+        values = await read_sheet_typed(gc, spreadsheet_id, title)
+        plan = plan_archive(values, title, max_age_days)
+        target = archive_title(title)
+        report = {
+            "sheet": title,
+            "archive_sheet": target,
+            "rows": len(values),
+            "rows_done": plan["done"],
+            "rows_old": plan["old"],
+            "rows_archived": len(plan["rows"]),
+            "applied": False,
+        }
+        if not apply or not plan["rows"]:
+            return report
+
+        sh = await gc.open_by_key(spreadsheet_id)
+        worksheets = {ws.title: ws for ws in await sh.worksheets()}
+        if title not in worksheets:
+            raise RuntimeError(f"Sheet '{title}' not found in spreadsheet.")
+        source_id = worksheets[title].id
+
+        out_rows = [values[n - 1] for n in plan["rows"]]
+        if target not in worksheets:
+            used = {ws.id for ws in worksheets.values()}
+            target_id = random.randint(1, 2**31 - 1)
+            while target_id in used:
+                target_id = random.randint(1, 2**31 - 1)
+            await sh.batch_update({"requests": [{
+                "addSheet": {
+                    "properties": {
+                        "sheetId": target_id,
+                        "title": target,
+                        "gridProperties": {
+                            "frozenRowCount": 1,
+                            "columnCount": max(26, len(plan["header"])),
+                        },
+                    }
+                }
+            }]})
+            out_rows = [plan["header"]] + out_rows
+
+        # 1. Chép sang tab lưu trữ bằng USER_ENTERED để giữ kiểu (checkbox, số, ngày, công thức).
+        #    Chép trước rồi mới xóa: lỗi giữa chừng chỉ gây trùng ở tab lưu trữ, không mất hàng.
+        await sh.values_append(
+            f"{_a1_sheet(target)}!A1",
+            params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
+            body={"values": out_rows},
+        )
+        # 2. Xóa từ dưới lên, gom các hàng liên tiếp thành một request
+        await sh.batch_update({"requests": [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": source_id,
+                        "dimension": "ROWS",
+                        "startIndex": start - 1,
+                        "endIndex": end,
+                    }
+                }
+            }
+            for start, end in reversed(_row_runs(plan["rows"]))
+        ]})
+
+    _notify_write(spreadsheet_id, title)
+    _notify_write(spreadsheet_id, target)
+    # Số hàng đã dịch chuyển -> đọc lại ngay để index (row_number/url/status) khớp với sheet
+    if mirror.is_mirrored(spreadsheet_id, title):
+        await mirror.read(gc, spreadsheet_id, title, max_staleness=0)
+
+    report["applied"] = True
+    print(f"✅ Archive '{title}': chuyển {len(plan['rows'])} hàng sang '{target}'.")
+    return report
+
+
+async def run_archive_loop(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    tabs: Optional[Sequence[str]] = None,
+    interval: float = ARCHIVE_INTERVAL_SEC,
+):
+    """Vòng lặp nền archive các tab nóng (được khởi động trong lifespan của main.py)."""
+    tabs = list(tabs or ARCHIVE_RULES)
+    print(f"[sheet_archive] Archive {', '.join(tabs)} mỗi {interval / 3600:.1f}h "
+          f"(hàng đã xong hoặc > {ARCHIVE_MAX_AGE_DAYS:.0f} ngày)")
+    while True:
+        for title in tabs:
+            try:
+                with call_priority(BACKGROUND):
+                    await archive_tab(gc, spreadsheet_id, title, apply=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[sheet_archive] Lỗi archive '{title}': {e}")
+        await asyncio.sleep(interval)
+
+
+# =============================
+# CLI
+# =============================
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Bảo trì Google Sheet của marketing-flow")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_dedupe = sub.add_parser("dedupe", help="Gộp các hàng trùng 'Link Video gốc'")
+    p_dedupe.add_argument("tabs", nargs="+", help="Tên tab cần dedupe")
+    p_dedupe.add_argument("--key-column", default=DEFAULT_KEY_COLUMN)
+    p_dedupe.add_argument("--spreadsheet-id", default=SPREADSHEET_ID)
+    p_dedupe.add_argument("--apply", action="store_true", help="Ghi thay đổi (mặc định chỉ báo cáo)")
+
+    p_archive = sub.add_parser("archive", help="Chuyển hàng đã xong/quá cũ sang tab lưu trữ theo tháng")
+    p_archive.add_argument("tabs", nargs="*", help=f"Mặc định: {', '.join(ARCHIVE_RULES)}")
+    p_archive.add_argument("--days", type=float, default=ARCHIVE_MAX_AGE_DAYS)
+    p_archive.add_argument("--spreadsheet-id", default=SPREADSHEET_ID)
+    p_archive.add_argument("--apply", action="store_true", help="Ghi thay đổi (mặc định chỉ báo cáo)")
+
+    args = parser.parse_args(argv)
+    # CLI chạy ở tiến trình riêng nhưng dùng chung file SQLite với server: gắn bản sao vào
+    # spreadsheet này để mark_dirty/đọc lại sau khi ghi cập nhật DB mà server đang đọc
+    mirror.spreadsheet_id = args.spreadsheet_id
+    gc = await _get_async_client_manager().authorize()
+
+    if args.command == "dedupe":
+        for title in args.tabs:
+            report = await dedupe_tab(gc, args.spreadsheet_id, title, args.key_column, apply=args.apply)
+            print(report)
+    elif args.command == "archive":
+        for title in args.tabs or list(ARCHIVE_RULES):
+            report = await archive_tab(gc, args.spreadsheet_id, title, args.days, apply=args.apply)
+            print(report)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
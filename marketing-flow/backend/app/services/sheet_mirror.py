@@ -0,0 +1,486 @@
+# app/services/sheet_mirror.py
+"""
+Bản sao (replica) SQLite cục bộ của các tab Google Sheet hay dùng.
+
+- Một task nền đồng bộ định kỳ: kiểm tra modifiedTime/version của file trên Drive,
+  nếu không đổi thì bỏ qua; nếu đổi thì đọc lại từng tab và chỉ ghi đè những tab
+  có nội dung (hash) thay đổi.
+- Các API đọc được phục vụ từ bản sao nếu dữ liệu chưa cũ hơn `max_staleness` giây.
+- Ghi vẫn đi thẳng vào Google Sheets; sau mỗi lần ghi, tab tương ứng bị đánh dấu
+  "dirty" để lần đọc kế tiếp lấy dữ liệu trực tiếp và làm mới bản sao.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from gspread_asyncio import AsyncioGspreadClient
+
+from app.services.rate_limit import BACKGROUND, call_priority
+from app.services.sheets import _get_creds, add_write_listener, read_many_sheet_data, read_sheet_data
+
+# =============================
+# CONFIG
+# =============================
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+MIRROR_DB_PATH = os.getenv("SHEET_MIRROR_DB", str(Path(MEDIA_ROOT) / "cache" / "sheets.db"))
+MIRROR_INTERVAL_SEC = float(os.getenv("SHEET_MIRROR_INTERVAL", "20"))
+MIRROR_MAX_STALENESS_SEC = float(os.getenv("SHEET_MIRROR_MAX_STALENESS", "60"))
+
+DEFAULT_MIRROR_TABS = [
+    "MVP_Content_Plan",
+    "Source Phân tích Video",
+    "Source Chỉnh sửa Video",
+    "Engagement",
+]
+
+# Các cột được đánh index (so khớp không phân biệt hoa/thường)
+KEYWORD_COLUMNS = ("keyword",)
+URL_COLUMNS = ("link video gốc",)
+# Cột checkbox "sẵn sàng đăng" (MVP_Content_Plan dùng 'ready', tab cũ dùng 'check box')
+READY_COLUMNS = ("ready", "check box")
+HEADER_MARKERS = KEYWORD_COLUMNS + URL_COLUMNS + ("title",)
+
+
+def _mirror_tabs() -> List[str]:
+    raw = os.getenv("SHEET_MIRROR_TABS")
+    if not raw:
+        return list(DEFAULT_MIRROR_TABS)
+    return [t.strip() for t in raw.split(",") if t.strip()]
+
+
+# =============================
+# ROW HELPERS
+# =============================
+def find_header_row(values: Sequence[Sequence[object]]) -> int:
+    """Trả về index (0-based) của hàng tiêu đề, hoặc -1 nếu sheet trống."""
+    first_non_empty = -1
+    for i, row in enumerate(values):
+        if not row or not any(str(c).strip() for c in row):
+            continue
+        if first_non_empty == -1:
+            first_non_empty = i
+        cleaned = {str(c).strip().lower() for c in row}
+        if any(m in cleaned for m in HEADER_MARKERS):
+            return i
+    return first_non_empty
+
+
+def _col_index(header_map: Dict[str, int], names: Sequence[str]) -> int:
+    for n in names:
+        if n in header_map:
+            return header_map[n]
+    return -1
+
+
+def _cell(row: Sequence[object], idx: int) -> str:
+    if idx < 0 or idx >= len(row):
+        return ""
+    return str(row[idx]).strip()
+
+
+def _is_true(value: str) -> bool:
+    return value.upper() == "TRUE"
+
+
+def row_status(header_map: Dict[str, int], row: Sequence[object]) -> str:
+    """
+    Phân loại một hàng: 'error' / 'published' / 'ready' / 'pending'
+    (cùng quy tắc với Tab 3 của dashboard).
+    """
+    if _is_true(_cell(row, header_map.get("error", -1))):
+        return "error"
+    for link_col in ("link facebook", "link instagram"):
+        if "http" in _cell(row, header_map.get(link_col, -1)):
+            return "published"
+    if _is_true(_cell(row, _col_index(header_map, READY_COLUMNS))):
+        return "ready"
+    return "pending"
+
+
+def normalize_url(url: str) -> str:
+    """Chuẩn hóa URL để so khớp (bỏ query string, giống _normalize_tiktok_url_main)."""
+    return (url or "").strip().split("?")[0]
+
+
+# =============================
+# MIRROR
+# =============================
+class SheetMirror:
+    def __init__(self, db_path: str = MIRROR_DB_PATH, tabs: Optional[List[str]] = None):
+        self.db_path = db_path
+        self.tabs = tabs or _mirror_tabs()
+        self.spreadsheet_id: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_revision: Optional[str] = None
+        self._drive = None
+
+    # ---------- SQLite ----------
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tabs (
+                    title TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    revision TEXT,
+                    header_row INTEGER,
+                    synced_at REAL,
+                    dirty INTEGER DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS rows (
+                    tab TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    keyword TEXT,
+                    url TEXT,
+                    status TEXT,
+                    PRIMARY KEY (tab, row_number)
+                );
+                CREATE INDEX IF NOT EXISTS idx_rows_keyword ON rows(tab, keyword);
+                CREATE INDEX IF NOT EXISTS idx_rows_url ON rows(tab, url);
+                CREATE INDEX IF NOT EXISTS idx_rows_status ON rows(tab, status);
+            """)
+            # tabs.write_gen: số lần ghi của tab (tăng ở mark_dirty, kể cả từ tiến trình khác
+            # như CLI sheet_maintenance); lần đọc bắt đầu trước một lần ghi không được xóa dirty
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(tabs)")}
+            if "write_gen" not in cols:
+                conn.execute("ALTER TABLE tabs ADD COLUMN write_gen INTEGER DEFAULT 0")
+                conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def write_generation(self, title: str) -> int:
+        """Lấy trước khi đọc từ Sheets, truyền lại cho store_tab(read_gen=...)."""
+        with self._lock:
+            return self._write_gen(self._db(), title)
+
+    @staticmethod
+    def _write_gen(db: sqlite3.Connection, title: str) -> int:
+        row = db.execute("SELECT write_gen FROM tabs WHERE title = ?", (title,)).fetchone()
+        return (row[0] or 0) if row else 0
+
+    def store_tab(
+        self,
+        title: str,
+        values: List[List[str]],
+        revision: Optional[str] = None,
+        read_gen: Optional[int] = None,
+    ) -> bool:
+        """
+        Ghi đè tab vào bản sao. Trả về False nếu nội dung không đổi (chỉ cập nhật synced_at).
+        Có lần ghi mới sau `read_gen` (đọc bắt đầu trước khi ghi) -> vẫn lưu nhưng giữ dirty.
+        """
+        content_hash = hashlib.sha1(
+            json.dumps(values, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            dirty = int(read_gen is not None and self._write_gen(db, title) != read_gen)
+            cur = db.execute("SELECT content_hash FROM tabs WHERE title = ?", (title,)).fetchone()
+            if cur and cur[0] == content_hash:
+                db.execute(
+                    "UPDATE tabs SET synced_at = ?, revision = ?, dirty = ? WHERE title = ?",
+                    (now, revision, dirty, title),
+                )
+                db.commit()
+                return False
+
+            header_idx = find_header_row(values)
+            header_map: Dict[str, int] = {}
+            if header_idx >= 0:
+                header_map = {str(h).strip().lower(): i for i, h in enumerate(values[header_idx])}
+            kw_idx = _col_index(header_map, KEYWORD_COLUMNS)
+            url_idx = _col_index(header_map, URL_COLUMNS)
+
+            records = []
+            for i, row in enumerate(values):
+                keyword = url = status = None
+                if header_idx >= 0 and i > header_idx:
+                    keyword = _cell(row, kw_idx).lower() or None
+                    url = normalize_url(_cell(row, url_idx)) or None
+                    status = row_status(header_map, row)
+                records.append((title, i + 1, json.dumps(row, ensure_ascii=False), keyword, url, status))
+
+            db.execute("DELETE FROM rows WHERE tab = ?", (title,))
+            db.executemany(
+                "INSERT INTO rows (tab, row_number, data, keyword, url, status) VALUES (?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            db.execute(
+                "INSERT INTO tabs (title, content_hash, revision, header_row, synced_at, dirty) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(title) DO UPDATE SET "
+                "content_hash = excluded.content_hash, revision = excluded.revision, "
+                "header_row = excluded.header_row, synced_at = excluded.synced_at, dirty = excluded.dirty",
+                (title, content_hash, revision, header_idx, now, dirty),
+            )
+            db.commit()
+            return True
+
+    def _is_fresh(self, db: sqlite3.Connection, title: str, max_staleness: Optional[float]) -> bool:
+        limit = MIRROR_MAX_STALENESS_SEC if max_staleness is None else max_staleness
+        meta = db.execute(
+            "SELECT synced_at, dirty FROM tabs WHERE title = ?", (title,)
+        ).fetchone()
+        return bool(meta) and not meta[1] and (time.time() - (meta[0] or 0)) <= limit
+
+    def is_fresh(self, title: str, max_staleness: Optional[float] = None) -> bool:
+        """Bản sao của tab đủ mới để phục vụ (chỉ xem metadata trong `tabs`, không đọc hàng)."""
+        with self._lock:
+            return self._is_fresh(self._db(), title, max_staleness)
+
+    def load_tab(self, title: str, max_staleness: Optional[float] = None) -> Optional[List[List[str]]]:
+        """Đọc tab từ bản sao; None nếu chưa có, bị dirty hoặc quá cũ."""
+        with self._lock:
+            db = self._db()
+            if not self._is_fresh(db, title, max_staleness):
+                return None
+            rows = db.execute(
+                "SELECT data FROM rows WHERE tab = ? ORDER BY row_number", (title,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def find_rows(
+        self,
+        title: str,
+        *,
+        keyword: Optional[str] = None,
+        url: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> List[Dict]:
+        """Tra cứu theo các cột đã đánh index. Trả về [{'row_number', 'data'}]."""
+        clauses, params = ["tab = ?"], [title]
+        if keyword is not None:
+            clauses.append("keyword = ?")
+            params.append(keyword.strip().lower())
+        if url is not None:
+            clauses.append("url = ?")
+            params.append(normalize_url(url))
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        sql = f"SELECT row_number, data FROM rows WHERE {' AND '.join(clauses)} ORDER BY row_number"
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        return [{"row_number": r[0], "data": json.loads(r[1])} for r in rows]
+
+    def lookup_url(self, title: str, url: str, max_staleness: Optional[float] = None) -> Optional[List[int]]:
+        """
+        Các row_number có 'Link Video gốc' (đã chuẩn hóa) = url, theo index (tab, url).
+        None nếu bản sao không đủ mới để tin cậy (người gọi tự đọc trực tiếp).
+        """
+        with self._lock:
+            db = self._db()
+            if not self._is_fresh(db, title, max_staleness):
+                return None
+            rows = db.execute(
+                "SELECT row_number FROM rows WHERE tab = ? AND url = ? ORDER BY row_number",
+                (title, normalize_url(url)),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    async def locate_url(self, spreadsheet_id: str, title: str, url: str) -> Optional[List[int]]:
+        """Bản async của lookup_url (dùng làm `locate` cho sheets.upsert_rows)."""
+        if not self.is_mirrored(spreadsheet_id, title):
+            return None
+        return await run_in_threadpool(self.lookup_url, title, url)
+
+    def is_mirrored(self, spreadsheet_id: str, title: str) -> bool:
+        return spreadsheet_id == self.spreadsheet_id and title in self.tabs
+
+    def header(self, title: str) -> Tuple[int, List[str]]:
+        """(số hàng tiêu đề 1-based, giá trị hàng tiêu đề) của tab; (0, []) nếu chưa có."""
+        with self._lock:
+            db = self._db()
+            meta = db.execute("SELECT header_row FROM tabs WHERE title = ?", (title,)).fetchone()
+            if not meta or meta[0] is None or meta[0] < 0:
+                return 0, []
+            row = db.execute(
+                "SELECT data FROM rows WHERE tab = ? AND row_number = ?", (title, meta[0] + 1)
+            ).fetchone()
+        return meta[0] + 1, (json.loads(row[0]) if row else [])
+
+    def page_rows(
+        self,
+        title: str,
+        statuses: Sequence[str],
+        *,
+        after_row: int = 0,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> List[Dict]:
+        """Phân trang theo row_number (cursor) trên index (tab, status); bỏ qua hàng không có keyword."""
+        marks = ",".join("?" for _ in statuses)
+        sql = (
+            f"SELECT row_number, data, status FROM rows WHERE tab = ? AND status IN ({marks}) "
+            "AND keyword IS NOT NULL AND row_number > ? ORDER BY row_number LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._db().execute(sql, [title, *statuses, after_row, limit, offset]).fetchall()
+        return [{"row_number": r[0], "data": json.loads(r[1]), "status": r[2]} for r in rows]
+
+    def status_counts(self, title: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT status, COUNT(*) FROM rows WHERE tab = ? AND status IS NOT NULL "
+                "AND keyword IS NOT NULL GROUP BY status",
+                (title,),
+            ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def mark_dirty(self, spreadsheet_id: str, title: str) -> None:
+        if (self.spreadsheet_id and spreadsheet_id != self.spreadsheet_id) or title not in self.tabs:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO tabs (title, dirty, write_gen) VALUES (?, 1, 1) "
+                "ON CONFLICT(title) DO UPDATE SET dirty = 1, write_gen = COALESCE(write_gen, 0) + 1",
+                (title,),
+            )
+            db.commit()
+
+    def _has_dirty_tabs(self) -> bool:
+        with self._lock:
+            row = self._db().execute("SELECT COUNT(*) FROM tabs WHERE dirty = 1").fetchone()
+        return bool(row and row[0])
+
+    def _touch_all(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE tabs SET synced_at = ? WHERE dirty = 0", (time.time(),))
+            db.commit()
+
+    # ---------- Drive revision ----------
+    def _drive_revision(self) -> Optional[str]:
+        """modifiedTime + version của spreadsheet trên Drive (None nếu không lấy được)."""
+        try:
+            if self._drive is None:
+                from googleapiclient.discovery import build
+                self._drive = build("drive", "v3", credentials=_get_creds(), cache_discovery=False)
+            meta = self._drive.files().get(
+                fileId=self.spreadsheet_id, fields="modifiedTime,version"
+            ).execute()
+            return f"{meta.get('version')}@{meta.get('modifiedTime')}"
+        except Exception as e:
+            print(f"[sheet_mirror] Không lấy được revision từ Drive: {e}")
+            return None
+
+    # ---------- Sync ----------
+    async def sync_once(self, gc: AsyncioGspreadClient, force: bool = False) -> Dict[str, str]:
+        """Đồng bộ một lần. Trả về {tab: 'updated' | 'unchanged' | 'error: ...' | 'skipped'}."""
+        revision = await run_in_threadpool(self._drive_revision)
+        if (
+            not force
+            and revision is not None
+            and revision == self._last_revision
+            and not self._has_dirty_tabs()
+        ):
+            await run_in_threadpool(self._touch_all)
+            return {t: "skipped" for t in self.tabs}
+
+        result: Dict[str, str] = {}
+        for title in self.tabs:
+            try:
+                gen = self.write_generation(title)
+                values = await read_sheet_data(gc, self.spreadsheet_id, title)
+                changed = await run_in_threadpool(self.store_tab, title, values, revision, gen)
+                result[title] = "updated" if changed else "unchanged"
+            except Exception as e:
+                result[title] = f"error: {e}"
+        self._last_revision = revision
+        return result
+
+    async def run(self, gc: AsyncioGspreadClient, spreadsheet_id: str, interval: float = MIRROR_INTERVAL_SEC):
+        """Vòng lặp nền (được khởi động trong lifespan của main.py)."""
+        self.spreadsheet_id = spreadsheet_id
+        print(f"[sheet_mirror] Bắt đầu đồng bộ {len(self.tabs)} tab mỗi {interval:.0f}s -> {self.db_path}")
+        while True:
+            try:
+                # Đồng bộ nền nhường quota cho các lời gọi tương tác
+                with call_priority(BACKGROUND):
+                    result = await self.sync_once(gc)
+                updated = [t for t, r in result.items() if r == "updated"]
+                if updated:
+                    print(f"[sheet_mirror] Đã cập nhật: {', '.join(updated)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[sheet_mirror] Lỗi đồng bộ: {e}")
+            await asyncio.sleep(interval)
+
+    # ---------- Read API ----------
+    async def read(
+        self,
+        gc: AsyncioGspreadClient,
+        spreadsheet_id: str,
+        title: str,
+        max_staleness: Optional[float] = None,
+    ) -> List[List[str]]:
+        """
+        Đọc tab với độ cũ tối đa `max_staleness` giây.
+        Nếu bản sao không đủ mới -> đọc trực tiếp từ Sheets và cập nhật bản sao.
+        """
+        mirrored = spreadsheet_id == self.spreadsheet_id and title in self.tabs
+        if mirrored:
+            values = await run_in_threadpool(self.load_tab, title, max_staleness)
+            if values is not None:
+                return values
+        gen = self.write_generation(title)
+        values = await read_sheet_data(gc, spreadsheet_id, title)
+        if mirrored:
+            await run_in_threadpool(self.store_tab, title, values, self._last_revision, gen)
+        return values
+
+    async def read_many(
+        self,
+        gc: AsyncioGspreadClient,
+        spreadsheet_id: str,
+        titles: Sequence[str],
+        max_staleness: Optional[float] = None,
+    ) -> Tuple[Dict[str, List[List[str]]], List[str]]:
+        """
+        Như read() cho nhiều tab: tab nào bản sao còn mới thì lấy từ SQLite,
+        các tab còn lại đọc chung trong một lần values.batchGet.
+        """
+        result: Dict[str, List[List[str]]] = {}
+        to_fetch: List[str] = []
+        for title in dict.fromkeys(titles):
+            if self.is_mirrored(spreadsheet_id, title):
+                values = await run_in_threadpool(self.load_tab, title, max_staleness)
+                if values is not None:
+                    result[title] = values
+                    continue
+            to_fetch.append(title)
+
+        missing: List[str] = []
+        if to_fetch:
+            gens = {t: self.write_generation(t) for t in to_fetch}
+            fetched, missing = await read_many_sheet_data(gc, spreadsheet_id, to_fetch)
+            for title, values in fetched.items():
+                if self.is_mirrored(spreadsheet_id, title):
+                    await run_in_threadpool(
+                        self.store_tab, title, values, self._last_revision, gens[title]
+                    )
+                result[title] = values
+        # Giữ đúng thứ tự tab như yêu cầu
+        return {t: result[t] for t in dict.fromkeys(titles) if t in result}, missing
+
+
+# Bản sao dùng chung cho toàn bộ app (giống JOB_STATUS trong main.py)
+mirror = SheetMirror()
+add_write_listener(mirror.mark_dirty)
+
+
+def mirror_enabled() -> bool:
+    return os.getenv("MFA_SHEET_MIRROR", "1") != "0"
@@ -1,18 +1,30 @@
 import os
+import time
 import gspread
 import gspread_asyncio
+import requests
 from google.oauth2.service_account import Credentials
 from gspread import Cell
+from gspread.utils import fill_gaps, rowcol_to_a1
 # Thêm import cho type hint của client
 from gspread_asyncio import AsyncioGspreadClient
-from typing import List, Optional, Sequence
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 from itertools import islice
 import asyncio
+import functools
+
+from app.services.rate_limit import (
+    BACKGROUND, INTERACTIVE, TokenBucket, backoff_delay, current_priority,
+)
 
 # =============================
 # CONFIG
 # =============================
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    # Chỉ đọc metadata (modifiedTime/version) để đồng bộ bản sao SQLite
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
 
 
 # =============================
@@ -26,9 +38,114 @@ def _get_creds():
     return Credentials.from_service_account_file(creds_path, scopes=SCOPES)
 
 
+# =============================
+# QUOTA / RETRY
+# =============================
+# Quota mặc định của Sheets API: 60 request đọc + 60 request ghi / phút / user
+SHEETS_READ_BUCKET = TokenBucket("sheets_read", float(os.getenv("SHEETS_READ_QPM", "60")))
+SHEETS_WRITE_BUCKET = TokenBucket("sheets_write", float(os.getenv("SHEETS_WRITE_QPM", "60")))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_WRITE_METHOD_PREFIXES = (
+    "update", "append", "add_", "insert", "delete", "del_", "clear",
+    "batch_update", "values_update", "values_append", "values_clear",
+    "format", "resize", "merge", "unmerge", "duplicate",
+)
+
+
+def _is_write_method(method) -> bool:
+    name = getattr(method, "__name__", "") or getattr(getattr(method, "func", None), "__name__", "")
+    return name.startswith(_WRITE_METHOD_PREFIXES)
+
+
+def _bucket_for(method) -> Tuple[TokenBucket, str]:
+    """Ghi mặc định là BACKGROUND, đọc mặc định là INTERACTIVE (có thể ghi đè bằng call_priority)."""
+    if _is_write_method(method):
+        return SHEETS_WRITE_BUCKET, current_priority(BACKGROUND)
+    return SHEETS_READ_BUCKET, current_priority(INTERACTIVE)
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    resp = getattr(e, "response", None)
+    return getattr(resp, "status_code", None)
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, gspread.exceptions.APIError):
+        return _status_code(e) in RETRYABLE_STATUS
+    return isinstance(e, requests.RequestException)
+
+
+class QuotaAwareClientManager(gspread_asyncio.AsyncioGspreadClientManager):
+    """
+    AsyncioGspreadClientManager có token bucket theo quota đọc/ghi của Sheets
+    và retry (exponential backoff + jitter) cho lỗi 429/5xx và lỗi mạng.
+
+    `_call` gốc giữ `call_lock` quanh cả delay(), các hook và lúc sleep khi lỗi, nên
+    lời gọi BACKGROUND chờ token hay đang backoff sẽ chặn mọi lời gọi khác. Ở đây
+    chờ token và backoff nằm NGOÀI lock; lock chỉ bao lần gọi HTTP. Nhịp 1.1 s/lời gọi
+    mặc định (gspread_delay) được tắt, token bucket là giới hạn duy nhất.
+    """
+
+    def __init__(self, credentials_fn, **kwargs):
+        kwargs.setdefault("gspread_delay", 0)
+        super().__init__(credentials_fn, **kwargs)
+
+    async def _call(self, method, *args, **kwargs):
+        api_call_count = kwargs.pop("api_call_count", 1)
+        bucket, priority = _bucket_for(method)
+        fn = functools.partial(method, *args, **kwargs)
+        name = getattr(method, "__name__", str(method))
+        attempt = 0
+        while True:
+            for _ in range(api_call_count):
+                await bucket.acquire(priority)
+            try:
+                async with self.call_lock:
+                    return await asyncio.get_running_loop().run_in_executor(None, fn)
+            except (gspread.exceptions.APIError, requests.RequestException) as e:
+                if not _is_retryable(e) or attempt >= SHEETS_MAX_RETRIES:
+                    raise
+                if _status_code(e) == 429:
+                    bucket.penalize()
+                delay = backoff_delay(attempt)
+                attempt += 1
+                print(f"[sheets] {name} lỗi ({_status_code(e) or type(e).__name__}), "
+                      f"thử lại lần {attempt}/{SHEETS_MAX_RETRIES} sau {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+def call_with_quota(fn, *args, **kwargs):
+    """
+    Phiên bản đồng bộ (cho code chạy trong threadpool dùng gspread trực tiếp):
+    chờ token rồi gọi fn, retry 429/5xx với backoff + jitter.
+    """
+    bucket, priority = _bucket_for(fn)
+    attempt = 0
+    while True:
+        bucket.acquire_blocking(priority)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= SHEETS_MAX_RETRIES:
+                raise
+            if _status_code(e) == 429:
+                bucket.penalize()
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def sheets_quota_snapshot() -> Dict[str, Dict[str, float]]:
+    return {
+        "read": SHEETS_READ_BUCKET.snapshot(),
+        "write": SHEETS_WRITE_BUCKET.snapshot(),
+    }
+
+
 def _get_async_client_manager():
-    """Create async manager for gspread client."""
-    return gspread_asyncio.AsyncioGspreadClientManager(_get_creds)
+    """Create async manager for gspread client (có rate limit + retry)."""
+    return QuotaAwareClientManager(_get_creds)
 
 
 # =============================
@@ -41,6 +158,27 @@ def _chunked(iterable, n):
         yield [first, *list(islice(iterator, n - 1))]
 
 
+# =============================
+# WRITE LISTENERS
+# =============================
+# Các hàm được gọi sau mỗi lần ghi (ví dụ: bản sao SQLite đánh dấu tab cần đồng bộ lại)
+_WRITE_LISTENERS: List[Callable[[str, str], None]] = []
+
+
+def add_write_listener(fn: Callable[[str, str], None]) -> None:
+    """Đăng ký hàm fn(spreadsheet_id, title) được gọi sau mỗi lần ghi vào sheet."""
+    if fn not in _WRITE_LISTENERS:
+        _WRITE_LISTENERS.append(fn)
+
+
+def _notify_write(spreadsheet_id: str, title: str) -> None:
+    for fn in _WRITE_LISTENERS:
+        try:
+            fn(spreadsheet_id, title)
+        except Exception as e:
+            print(f"Warning: write listener failed for '{title}': {e}")
+
+
 # =============================
 # MAIN FUNCTIONS (ALL ASYNC)
 # CÁC HÀM NÀY GIỜ ĐÂY SẼ NHẬN CLIENT ĐÃ XÁC THỰC
@@ -188,10 +326,177 @@ async def export_rows(
         safe_rows = [[("" if c is None else str(c)) for c in row] for row in rows]
         await ws.append_rows(safe_rows, value_input_option="RAW")
 
+    _notify_write(spreadsheet_id, title)
     print(f"✅ Exported {len(rows)} rows to sheet '{title}' successfully.")
     return {"sheet": title, "added": len(rows), "url": getattr(ws, 'url', None)}
 
 
+# Khóa theo (spreadsheet_id, title): 2 lần upsert cùng lúc không được cùng append một key
+_UPSERT_LOCKS: Dict[Tuple[str, str], asyncio.Lock] = {}
+# Số hàng đầu đọc để tìm hàng tiêu đề thật của sheet khi upsert
+UPSERT_HEADER_SCAN_ROWS = 10
+
+
+def _default_key(value) -> str:
+    return str(value or "").strip()
+
+
+async def upsert_rows(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    title: str,
+    rows: Sequence[Sequence[object]],
+    header_row: Sequence[str],
+    key_column: str,
+    checkbox_columns: Optional[Sequence[str]] = None,
+    preserve_columns: Optional[Sequence[str]] = None,
+    normalize_key: Optional[Callable[[object], str]] = None,
+    locate: Optional[Callable[[str], Awaitable[Optional[List[int]]]]] = None,
+):
+    """
+    Ghi kiểu upsert theo cột `key_column` (giá trị đã chuẩn hóa bằng normalize_key):
+    - key đã có trong sheet -> cập nhật hàng đó tại chỗ (bỏ qua các cột preserve_columns,
+      ví dụ checkbox/link do người dùng điền);
+    - key chưa có -> append như export_rows.
+
+    locate(key) tra row_number từ index có sẵn (ví dụ bản sao SQLite); trả về None nếu
+    index không dùng được. Hàng tìm qua index được xác minh lại bằng cách đọc đúng ô key,
+    nếu lệch (sheet đã bị sửa) thì fallback đọc toàn bộ cột key.
+    Cột được xác định theo hàng tiêu đề thật của sheet (tìm như sheet_mirror), không
+    giả định thứ tự cột của header_row hay tiêu đề nằm ở hàng 1.
+    """
+    from app.services.sheet_mirror import find_header_row  # sheet_mirror import module này
+
+    norm = normalize_key or _default_key
+    header_lower = [str(h).strip().lower() for h in header_row]
+    try:
+        key_idx = header_lower.index(key_column.strip().lower())
+    except ValueError:
+        raise RuntimeError(f"Key column '{key_column}' not in header_row.")
+    preserved = {c.strip().lower() for c in (preserve_columns or [])}
+    update_cols = [i for i, h in enumerate(header_lower) if h not in preserved]
+
+    # Gộp các hàng trùng key trong cùng một lần gọi (giữ hàng sau cùng)
+    by_key: Dict[str, Sequence[object]] = {}
+    keyless: List[Sequence[object]] = []
+    for row in rows:
+        key = norm(row[key_idx]) if key_idx < len(row) else ""
+        if key:
+            by_key[key] = row
+        else:
+            keyless.append(row)
+
+    lock = _UPSERT_LOCKS.setdefault((spreadsheet_id, title), asyncio.Lock())
+    async with lock:
+        sh = await gc.open_by_key(spreadsheet_id)
+        try:
+            ws = await sh.worksheet(title)
+        except gspread.WorksheetNotFound:
+            ws = None
+
+        # Vị trí cột theo hàng tiêu đề THẬT của sheet (thứ tự cột / hàng tiêu đề có thể
+        # khác header_row): sheet_cols[i] = cột 1-based của header_row[i] trên sheet
+        sheet_header: List[str] = []
+        header_at = 1
+        if ws is not None:
+            top = await ws.get_values(f"1:{UPSERT_HEADER_SCAN_ROWS}")
+            h_idx = find_header_row(top)
+            if h_idx >= 0:
+                sheet_header = [str(h) for h in top[h_idx]]
+                header_at = h_idx + 1
+        if sheet_header:
+            actual = {}
+            for i, h in enumerate(sheet_header):
+                actual.setdefault(h.strip().lower(), i + 1)
+            sheet_cols = {i: actual[h] for i, h in enumerate(header_lower) if h in actual}
+        else:
+            sheet_cols = {i: i + 1 for i in range(len(header_lower))}
+        key_col = sheet_cols.get(key_idx)
+
+        targets: Dict[str, int] = {}
+        if ws is not None and by_key and key_col:
+            # 1. Thử index trước
+            use_index = locate is not None
+            candidates: Dict[str, int] = {}
+            if use_index:
+                for key in by_key:
+                    found = await locate(key)
+                    if found is None:
+                        use_index = False
+                        break
+                    if found:
+                        candidates[key] = found[-1]
+            if use_index and candidates:
+                ranges = [rowcol_to_a1(n, key_col) for n in candidates.values()]
+                got = await ws.batch_get(ranges)
+                for (key, n), vr in zip(candidates.items(), got):
+                    cell = vr[0][0] if vr and vr[0] else ""
+                    if n <= header_at or norm(cell) != key:
+                        print(f"[upsert] Index lệch tại R{n} của '{title}', đọc lại cột key.")
+                        use_index = False
+                        break
+                    targets[key] = n
+
+            # 2. Fallback: đọc một cột key (rẻ hơn đọc cả sheet), bỏ qua phần trên hàng tiêu đề
+            if not use_index:
+                targets = {}
+                col_values = await ws.col_values(key_col)
+                for i, v in enumerate(col_values[header_at:], start=header_at + 1):
+                    key = norm(v)
+                    if key in by_key:
+                        targets[key] = i  # trùng nhiều hàng -> lấy hàng mới nhất
+
+        # --- Cập nhật tại chỗ (1 lần gọi batch_update, mỗi hàng một range) ---
+        if targets:
+            # Các cột cần ghi theo vị trí trên sheet, gom thành đoạn liên tiếp để không
+            # ghi đè cột preserve nằm xen giữa
+            write_cols = sorted((sheet_cols[c], c) for c in update_cols if c in sheet_cols)
+            runs: List[List[Tuple[int, int]]] = []
+            for col, c in write_cols:
+                if runs and col == runs[-1][-1][0] + 1:
+                    runs[-1].append((col, c))
+                else:
+                    runs.append([(col, c)])
+            data = []
+            for key, n in targets.items():
+                row = by_key[key]
+                for run in runs:
+                    values = [row[c] if c < len(row) else "" for _, c in run]
+                    data.append({
+                        "range": f"{rowcol_to_a1(n, run[0][0])}:{rowcol_to_a1(n, run[-1][0])}",
+                        "values": [["" if v is None else str(v) for v in values]],
+                    })
+            await ws.batch_update(data, value_input_option="RAW")
+            _notify_write(spreadsheet_id, title)
+            print(f"✅ Upsert: updated {len(targets)} existing row(s) in sheet '{title}'.")
+
+        # --- Append các key mới (sắp lại theo thứ tự cột thật của sheet nếu đã có tiêu đề) ---
+        new_rows = [row for key, row in by_key.items() if key not in targets] + keyless
+        added = 0
+        if new_rows:
+            append_header: Sequence[str] = header_row
+            if sheet_header and all(c in sheet_cols for c in range(len(header_lower))):
+                append_header = sheet_header
+                width = len(sheet_header)
+                laid_out = []
+                for row in new_rows:
+                    out: List[object] = [""] * width
+                    for c, col in sheet_cols.items():
+                        out[col - 1] = row[c] if c < len(row) else ""
+                    laid_out.append(out)
+                new_rows = laid_out
+            await export_rows(
+                gc,
+                spreadsheet_id=spreadsheet_id,
+                title=title,
+                rows=new_rows,
+                header_row=append_header,
+                checkbox_columns=checkbox_columns,
+            )
+            added = len(new_rows)
+    return {"sheet": title, "updated": len(targets), "added": added, "rows": targets}
+
+
 async def update_sheet_cell(
     gc: AsyncioGspreadClient,  # <-- SỬA: Nhận client đã xác thực
     spreadsheet_id: str, 
@@ -214,6 +519,7 @@ async def update_sheet_cell(
         raise RuntimeError(f"Sheet '{title}' not found in spreadsheet.")
     
     await ws.update_cell(row, col, value)
+    _notify_write(spreadsheet_id, title)
     print(f"✅ Updated cell R{row}C{col} in sheet '{title}'.")
     return {"sheet": title, "updated_cell": f"R{row}C{col}", "new_value": value}
 
@@ -240,6 +546,71 @@ async def read_sheet_data(
     values = await ws.get_all_values()
     return values
 
+def _a1_sheet(title: str) -> str:
+    """Tên tab dạng A1 (bao nháy đơn, nhân đôi nháy đơn bên trong)."""
+    return "'" + title.replace("'", "''") + "'"
+
+
+def _user_entered(value) -> str:
+    """Giá trị đọc theo FORMULA -> chuỗi mà ghi lại bằng USER_ENTERED cho ra đúng kiểu cũ."""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return "" if value is None else str(value)
+
+
+async def read_sheet_typed(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    title: str,
+) -> List[List[str]]:
+    """
+    Như read_sheet_data nhưng giữ được kiểu khi ghi lại: đọc công thức (FORMULA), số không
+    định dạng, ngày dạng chuỗi; ghi lại với value_input_option="USER_ENTERED" thì checkbox,
+    số, ngày và công thức giữ nguyên kiểu (RAW sẽ biến tất cả thành text).
+    """
+    sh = await gc.open_by_key(spreadsheet_id)
+    res = await sh.values_get(
+        _a1_sheet(title),
+        params={"valueRenderOption": "FORMULA", "dateTimeRenderOption": "FORMATTED_STRING"},
+    )
+    return fill_gaps([[_user_entered(v) for v in row] for row in res.get("values", [])])
+
+
+async def read_many_sheet_data(
+    gc: AsyncioGspreadClient,
+    spreadsheet_id: str,
+    titles: Sequence[str],
+) -> Tuple[Dict[str, List[List[str]]], List[str]]:
+    """
+    Đọc nhiều tab trong MỘT lần values.batchGet.
+    Trả về ({title: rows}, [các tab không tồn tại]). Các hàng được pad đều như get_all_values.
+    """
+    titles = list(dict.fromkeys(titles))
+    if not titles:
+        return {}, []
+    sh = await gc.open_by_key(spreadsheet_id)
+    missing: List[str] = []
+    try:
+        res = await sh.values_batch_get([_a1_sheet(t) for t in titles])
+    except gspread.exceptions.APIError as e:
+        # batchGet lỗi toàn bộ nếu có một tab không tồn tại -> lọc lại theo danh sách tab rồi thử lần nữa
+        if _status_code(e) != 400:
+            raise
+        existing = {ws.title for ws in await sh.worksheets()}
+        missing = [t for t in titles if t not in existing]
+        titles = [t for t in titles if t in existing]
+        if not titles:
+            return {}, missing
+        res = await sh.values_batch_get([_a1_sheet(t) for t in titles])
+
+    data: Dict[str, List[List[str]]] = {}
+    for title, value_range in zip(titles, res.get("valueRanges", [])):
+        data[title] = fill_gaps(value_range.get("values", []))
+    print(f"✅ Batch-read {len(data)} sheet(s): {', '.join(data)}.")
+    return data, missing
+
 # =============================
 # CÁCH SỬ DỤNG (VÍ DỤ)
 # =============================
@@ -0,0 +1,118 @@
+# app/services/whisper_chunks.py
+"""
+Whisper song song theo đoạn cho video dài (MFA_CHUNKED_WHISPER=1).
+
+Một lần `model.transcribe` trên cả file chạy tuần tự và chiếm phần lớn thời gian job
+với video 10+ phút trên CPU. Ở đây VAD (Silero của faster-whisper) chạy MỘT lần trên WAV
+đã làm sạch, các đoạn có tiếng nói được gom thành chunk ~WHISPER_CHUNK_SEC giây (cắt ở
+khoảng lặng, tối đa WHISPER_CHUNK_MAX_SEC), rồi các chunk được transcribe song song
+bằng WHISPER_WORKERS thread trên cùng một model (`num_workers` của CTranslate2,
+mỗi worker WHISPER_CPU_THREADS thread). Timestamp segment/word được cộng lại offset của
+chunk và ghép theo thứ tự.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CHUNKED_WHISPER = os.getenv("MFA_CHUNKED_WHISPER", "0") == "1"
+# Audio ngắn hơn ngưỡng này transcribe một lần như cũ
+WHISPER_CHUNKED_MIN_SEC = float(os.getenv("WHISPER_CHUNKED_MIN_SEC", "300"))
+WHISPER_CHUNK_SEC = float(os.getenv("WHISPER_CHUNK_SEC", "45"))
+WHISPER_CHUNK_MAX_SEC = float(os.getenv("WHISPER_CHUNK_MAX_SEC", "60"))
+WHISPER_WORKERS = max(1, int(os.getenv("WHISPER_WORKERS", str(max(1, (os.cpu_count() or 4) // 4)))))
+# Chia đều core cho các worker
+WHISPER_CPU_THREADS = max(1, (os.cpu_count() or 4) // WHISPER_WORKERS)
+
+SAMPLE_RATE = 16000
+# Lề giữ lại quanh mỗi chunk (không vượt quá nửa khoảng lặng với chunk bên cạnh)
+_PAD_SEC = 0.3
+
+Span = Tuple[float, float]
+
+
+def enabled(duration: float, override: Optional[bool] = None) -> bool:
+    on = CHUNKED_WHISPER if override is None else override
+    return on and duration >= WHISPER_CHUNKED_MIN_SEC
+
+
+def model_kwargs() -> Dict:
+    """Tham số WhisperModel để nhiều thread transcribe thật sự song song."""
+    if not CHUNKED_WHISPER:
+        return {}
+    return {"num_workers": WHISPER_WORKERS, "cpu_threads": WHISPER_CPU_THREADS}
+
+
+def speech_spans(audio, min_silence_ms: int = 260) -> List[Span]:
+    """VAD một lần trên toàn bộ audio 16 kHz (giây); đoạn nói dài bị VAD tự cắt ở WHISPER_CHUNK_MAX_SEC."""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    opts = VadOptions(min_silence_duration_ms=min_silence_ms, max_speech_duration_s=WHISPER_CHUNK_MAX_SEC)
+    return [(ts["start"] / SAMPLE_RATE, ts["end"] / SAMPLE_RATE) for ts in get_speech_timestamps(audio, opts)]
+
+
+def plan_chunks(speech: Sequence[Span], duration: float,
+                target: float = WHISPER_CHUNK_SEC, max_len: float = WHISPER_CHUNK_MAX_SEC) -> List[Span]:
+    """Gom các đoạn nói liên tiếp đến khi đủ ~`target` giây (không quá `max_len`), cắt ở khoảng lặng."""
+    groups: List[Span] = []
+    start = end = None
+    for s, e in speech:
+        if start is not None and (end - start >= target or e - start > max_len):
+            groups.append((start, end))
+            start = None
+        if start is None:
+            start = s
+        end = e
+    if start is not None:
+        groups.append((start, end))
+
+    chunks: List[Span] = []
+    for i, (s, e) in enumerate(groups):
+        prev_end = groups[i - 1][1] if i > 0 else 0.0
+        next_start = groups[i + 1][0] if i + 1 < len(groups) else duration
+        lo = s - min(_PAD_SEC, (s - prev_end) / 2 if i > 0 else s)
+        hi = e + min(_PAD_SEC, (next_start - e) / 2 if i + 1 < len(groups) else max(0.0, duration - e))
+        chunks.append((max(0.0, lo), min(duration, hi)))
+    return chunks
+
+
+def _shift(segments, offset: float) -> List[SimpleNamespace]:
+    out = []
+    for seg in segments:
+        words = [
+            SimpleNamespace(start=w.start + offset, end=w.end + offset, word=w.word)
+            for w in (getattr(seg, "words", None) or [])
+        ]
+        out.append(SimpleNamespace(start=seg.start + offset, end=seg.end + offset, text=seg.text, words=words))
+    return out
+
+
+def transcribe_chunks(
+    model,
+    audio,
+    chunks: Sequence[Span],
+    cancel_event: Optional[threading.Event] = None,
+    **transcribe_kwargs,
+) -> List[SimpleNamespace]:
+    """
+    Transcribe từng chunk (không chạy VAD lại) trên WHISPER_WORKERS thread, trả danh sách
+    segment đã cộng offset, theo thứ tự thời gian. Job bị hủy -> bỏ các chunk chưa chạy.
+    """
+    def one(span: Span) -> List[SimpleNamespace]:
+        if cancel_event is not None and cancel_event.is_set():
+            return []
+        lo, hi = span
+        segments, _info = model.transcribe(
+            audio=audio[int(lo * SAMPLE_RATE):int(hi * SAMPLE_RATE)], vad_filter=False, **transcribe_kwargs
+        )
+        out = []
+        for seg in segments:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            out.append(seg)
+        return _shift(out, lo)
+
+    with ThreadPoolExecutor(max_workers=WHISPER_WORKERS, thread_name_prefix="whisper") as pool:
+        results = list(pool.map(one, chunks))
+    return [seg for part in results for seg in part]
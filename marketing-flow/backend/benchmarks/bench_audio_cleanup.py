@@ -0,0 +1,102 @@
+# benchmarks/bench_audio_cleanup.py
+"""
+Đánh giá bộ chọn profile làm sạch audio (app/services/audio_cleanup.py) trên tập có nhãn.
+
+Xếp file audio/video mẫu vào thư mục con theo profile mong muốn:
+    samples/none/*.mp4    (giọng thu sạch)
+    samples/light/*.m4a   (nhiễu nhẹ)
+    samples/full/*.mp3    (nhiễu nặng)
+rồi chạy từ thư mục backend:
+    python benchmarks/bench_audio_cleanup.py samples --repeat 3
+
+Với mỗi file: thời gian ước lượng SNR, thời gian tiền xử lý với profile được chọn so với
+chuỗi cũ (luôn afftdn + loudnorm một pass), và profile chọn có khớp nhãn không.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services import audio_cleanup  # noqa: E402
+from app.services.process_runner import run_process_blocking  # noqa: E402
+
+PROFILES = (audio_cleanup.PROFILE_NONE, audio_cleanup.PROFILE_LIGHT, audio_cleanup.PROFILE_FULL)
+LEGACY_AF = "highpass=f=180,lowpass=f=6500,afftdn=nf=-20,loudnorm=I=-18:TP=-1.5:LRA=11"
+MEDIA_EXT = {".mp4", ".mov", ".mkv", ".webm", ".m4a", ".mp3", ".wav", ".aac", ".flac"}
+
+
+def _preprocess(ffmpeg_bin: str, src: Path, af: str, out: Path) -> None:
+    run_process_blocking(
+        [ffmpeg_bin, "-y", "-loglevel", "error", "-i", str(src), "-vn", "-af", af,
+         "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", str(out)],
+        capture_stdout=False, check=True,
+    )
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="Thư mục có các thư mục con none/ light/ full/")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi file (lấy thời gian tốt nhất)")
+    parser.add_argument("--ffmpeg", default=os.getenv("FFMPEG_BIN", "ffmpeg"))
+    args = parser.parse_args(argv)
+
+    if not audio_cleanup.HAVE_NUMPY:
+        print("Cần numpy để ước lượng SNR (pip install numpy)")
+        return 1
+    samples = [
+        (label, p)
+        for label in PROFILES
+        for p in sorted((Path(args.corpus) / label).glob("*"))
+        if p.suffix.lower() in MEDIA_EXT
+    ]
+    if not samples:
+        print(f"Không có file mẫu trong {args.corpus}/{{{','.join(PROFILES)}}}/")
+        return 1
+
+    confusion = {(a, b): 0 for a in PROFILES for b in PROFILES}
+    total_est = total_new = total_old = 0.0
+    print(f"{'file':36} {'label':>6} {'pick':>6} {'SNR':>6} {'estimate':>9} {'new':>9} {'legacy':>9} {'x':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "out.wav"
+        for label, path in samples:
+            est = audio_cleanup.estimate(args.ffmpeg, str(path))
+            t_est = est["elapsed_sec"] if est else 0.0
+            pick = audio_cleanup.choose_profile(est)
+            af = ",".join(audio_cleanup.cleanup_filters(pick, est)) or "anull"
+            t_new = _time(lambda: _preprocess(args.ffmpeg, path, af, out), args.repeat)
+            t_old = _time(lambda: _preprocess(args.ffmpeg, path, LEGACY_AF, out), args.repeat)
+            confusion[(label, pick)] += 1
+            total_est += t_est
+            total_new += t_new
+            total_old += t_old
+            snr = f"{est['snr_db']:.1f}" if est else "-"
+            print(f"{path.name[:36]:36} {label:>6} {pick:>6} {snr:>6} {t_est * 1000:7.0f}ms "
+                  f"{t_new * 1000:7.0f}ms {t_old * 1000:7.0f}ms {t_old / max(t_est + t_new, 1e-9):5.1f}x")
+
+    print("-" * 96)
+    correct = sum(confusion[(p, p)] for p in PROFILES)
+    print(f"{len(samples)} file | đúng nhãn {correct}/{len(samples)} ({correct / len(samples):.0%}) | "
+          f"ước lượng {total_est:.2f}s + tiền xử lý {total_new:.2f}s so với cũ {total_old:.2f}s "
+          f"(nhanh hơn {total_old / max(total_est + total_new, 1e-9):.1f}x)")
+    print("Ma trận nhầm lẫn (hàng = nhãn, cột = profile chọn):")
+    print(" " * 8 + "".join(f"{p:>8}" for p in PROFILES))
+    for a in PROFILES:
+        print(f"{a:>8}" + "".join(f"{confusion[(a, b)]:>8}" for b in PROFILES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
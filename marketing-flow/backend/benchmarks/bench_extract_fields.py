@@ -0,0 +1,93 @@
+# benchmarks/bench_extract_fields.py
+"""
+So sánh tốc độ trích xuất field giữa bản cũ (BeautifulSoup + html.parser, duyệt 4 lần)
+và bản một lần duyệt (app/services/html_extract.py) trên các trang HTML đã lưu.
+
+Lưu trang mẫu (curl / "Save page as") vào một thư mục rồi chạy từ thư mục backend:
+    python benchmarks/bench_extract_fields.py benchmarks/pages --repeat 5
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.html_extract import extract_fields, extract_head  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup
+    HAVE_BS4 = True
+except Exception:
+    HAVE_BS4 = False
+
+
+def legacy_extract(html: str) -> dict:
+    """Bản cũ của crawl.extract_content_fields (để đối chiếu)."""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    metas = {}
+    for m in soup.find_all("meta"):
+        name = (m.get("name") or m.get("property") or m.get("http-equiv") or "").lower()
+        content = m.get("content")
+        if name and content:
+            metas[name] = content
+    paragraphs = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
+    text = " ".join(paragraphs)[:12000]
+    h1s = [h.get_text(" ", strip=True) for h in soup.find_all("h1")]
+    h2s = [h.get_text(" ", strip=True) for h in soup.find_all("h2")]
+    return {"title": title, "metas": metas, "h1": h1s, "h2": h2s, "text": text}
+
+
+def _time(fn, html: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(html)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="Thư mục chứa *.html")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi trang (lấy thời gian tốt nhất)")
+    args = parser.parse_args(argv)
+
+    pages = sorted(Path(args.corpus).glob("**/*.htm*"))
+    if not pages:
+        print(f"Không có file .html trong {args.corpus}")
+        return 1
+    if not HAVE_BS4:
+        print("(bs4 chưa cài: chỉ đo bản một lần duyệt)")
+
+    total_new = total_head = total_old = 0.0
+    mismatches = 0
+    print(f"{'page':40} {'KB':>7} {'single':>9} {'head':>9} {'bs4':>9} {'x':>6}  same")
+    for path in pages:
+        html = path.read_text(encoding="utf-8", errors="replace")
+        t_new = _time(extract_fields, html, args.repeat)
+        t_head = _time(extract_head, html, args.repeat)
+        total_new += t_new
+        total_head += t_head
+        line = f"{path.name[:40]:40} {len(html) / 1024:7.0f} {t_new * 1000:8.1f}ms {t_head * 1000:8.1f}ms"
+        if HAVE_BS4:
+            t_old = _time(legacy_extract, html, args.repeat)
+            total_old += t_old
+            old, new = legacy_extract(html), extract_fields(html)
+            same = old["title"] == new["title"] and old["metas"] == new["metas"] and old["text"] == new["text"]
+            mismatches += not same
+            line += f" {t_old * 1000:8.1f}ms {t_old / max(t_new, 1e-9):5.1f}x  {'yes' if same else 'NO'}"
+        print(line)
+
+    print("-" * 90)
+    summary = f"{len(pages)} trang | single-pass {total_new * 1000:.1f}ms | head-only {total_head * 1000:.1f}ms"
+    if HAVE_BS4:
+        summary += (f" | bs4 {total_old * 1000:.1f}ms | nhanh hơn {total_old / max(total_new, 1e-9):.1f}x"
+                    f" | khác kết quả: {mismatches}")
+    print(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+# tests/test_sheet_maintenance.py
+import time
+
+from app.services.sheet_maintenance import plan_archive
+
+HEADER = ["keyword", "Link Video gốc", "Ready", "Link Facebook", "Link Instagram", "Error"]
+DAY = 86400
+
+
+def test_reused_url_without_date_column_is_not_archived_by_age():
+    # /mvp/run ghi lại URL đối thủ đã gặp từ lâu vào một hàng mới (chưa đăng)
+    url = "https://www.tiktok.com/@shop/video/1"
+    values = [
+        HEADER,
+        ["old post", url, "TRUE", "https://facebook.com/p/1", "", "FALSE"],
+        ["new post", url, "FALSE", "", "", "FALSE"],
+    ]
+    plan = plan_archive(values, "MVP_Content_Plan", max_age_days=30, now=time.time() + 365 * DAY)
+    assert plan["rows"] == [2]  # chỉ hàng đã đăng
+    assert plan["done"] == 1
+    assert plan["old"] == 0
+
+
+def test_age_rule_uses_real_date_column():
+    now = time.time()
+    values = [
+        HEADER + ["Created At"],
+        ["a", "https://x/1", "FALSE", "", "", "FALSE", time.strftime("%Y-%m-%d", time.localtime(now - 40 * DAY))],
+        ["b", "https://x/2", "FALSE", "", "", "FALSE", time.strftime("%Y-%m-%d", time.localtime(now - 2 * DAY))],
+    ]
+    plan = plan_archive(values, "MVP_Content_Plan", max_age_days=30, now=now)
+    assert plan["rows"] == [2]
+    assert plan["old"] == 1
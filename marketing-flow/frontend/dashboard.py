@@ -44,18 +44,85 @@ st.markdown(video_style_16_9, unsafe_allow_html=True)
 
 
 # --- HÀM TẢI LẠI DỮ LIỆU SHEET (DÙNG CHUNG) ---
+# Các tab dashboard cần khi mở: {tên sheet: key trong session_state}
+DASHBOARD_SHEETS = {
+    "Engagement": "sheet_data_report",
+}
+
+def refresh_many_sheet_data(sheets):
+    """
+    Tải lại nhiều sheet trong MỘT lần gọi API (/export/sheet/read-many, backend dùng values.batchGet).
+    sheets: {tên sheet: key trong session_state}.
+    """
+    try:
+        with st.spinner(f"Đang tải dữ liệu từ {len(sheets)} sheet..."):
+            res = requests.get(
+                f"{API_URL}/export/sheet/read-many",
+                params=[("sheet_names", name) for name in sheets]
+            )
+            if res.status_code == 200:
+                body = res.json()
+                for name, rows in body.get('data', {}).items():
+                    st.session_state[sheets[name]] = rows
+                for name in body.get('missing', []):
+                    st.error(f"Lỗi đọc Sheet '{name}': không tồn tại.")
+                st.toast(f"Tải lại dữ liệu {', '.join(body.get('data', {}))} thành công!", icon="✅")
+            else:
+                st.error(f"Lỗi đọc Sheet: {res.text}")
+    except Exception as e:
+        st.error(f"Lỗi kết nối API: {e}")
+
 def refresh_sheet_data(sheet_name, state_key):
     """
     Hàm chung để gọi API và tải lại dữ liệu cho một sheet cụ thể vào session_state.
     """
+    refresh_many_sheet_data({sheet_name: state_key})
+
+# --- HÀNG ĐỢI ĐĂNG TẢI (TAB 3) ---
+# Backend (/publishing/queue) đã tìm header + phân loại sẵn trên dữ liệu cache,
+# dashboard chỉ tải từng trang nhỏ của mỗi danh sách.
+QUEUE_STATUSES = ("pending", "published", "error")
+QUEUE_PAGE_SIZE = 50
+
+def refresh_publishing_queue():
+    """Tải lại trang đầu của cả 3 danh sách (Chờ xử lý / Đã đăng / Bị lỗi) trong MỘT lần gọi API."""
     try:
-        with st.spinner(f"Đang tải dữ liệu từ sheet '{sheet_name}'..."):
-            res = requests.get(f"{API_URL}/export/sheet/read", params={"sheet_name": sheet_name})
+        with st.spinner("Đang tải hàng đợi đăng tải..."):
+            res = requests.get(
+                f"{API_URL}/publishing/queues",
+                params={"limit": QUEUE_PAGE_SIZE}
+            )
             if res.status_code == 200:
-                st.session_state[state_key] = res.json().get('data', [])
-                st.toast(f"Tải lại dữ liệu sheet '{sheet_name}' thành công!", icon="✅")
+                body = res.json()
+                for status in QUEUE_STATUSES:
+                    st.session_state[f"queue_{status}"] = body.get(status)
             else:
-                st.error(f"Lỗi đọc Sheet '{sheet_name}': {res.text}")
+                st.error(f"Lỗi đọc hàng đợi đăng tải: {res.text}")
+    except Exception as e:
+        st.error(f"Lỗi kết nối API: {e}")
+
+def refresh_dashboard():
+    """Làm mới mọi dữ liệu các tab cần: các sheet (1 lần read-many) + hàng đợi Tab 3 (1 lần /publishing/queues)."""
+    refresh_many_sheet_data(DASHBOARD_SHEETS)
+    refresh_publishing_queue()
+
+def load_more_publishing_queue(status):
+    """Tải trang kế tiếp (theo cursor) và nối vào danh sách hiện tại."""
+    current = st.session_state.get(f"queue_{status}") or {}
+    cursor = current.get("next_cursor")
+    if not cursor:
+        return
+    try:
+        res = requests.get(
+            f"{API_URL}/publishing/queue",
+            params={"status": status, "cursor": cursor, "limit": QUEUE_PAGE_SIZE}
+        )
+        if res.status_code == 200:
+            page = res.json()
+            page["items"] = current.get("items", []) + page.get("items", [])
+            st.session_state[f"queue_{status}"] = page
+        else:
+            st.error(f"Lỗi đọc hàng đợi '{status}': {res.text}")
     except Exception as e:
         st.error(f"Lỗi kết nối API: {e}")
 
@@ -102,7 +169,7 @@ def handle_tick(row_gspread, col_gspread, key, column_name, video_title):
 
             # Tải lại sheet NGAY LẬP TỨC để lưu checkbox
             # (Người dùng sẽ phải bấm "Làm mới" sau để lấy link)
-            refresh_sheet_data("MVP_Content_Plan", "sheet_data")
+            refresh_publishing_queue()
             
         else:
             st.error(f"Lỗi cập nhật Sheet: {res.text}")
@@ -112,6 +179,31 @@ def handle_tick(row_gspread, col_gspread, key, column_name, video_title):
         st.error(f"Lỗi kết nối API: {e}")
         st.session_state[key] = not new_value
 
+# --- Thư viện nhạc nền (BGM) trên server ---
+def _load_bgm_library():
+    """Danh sách track trong /bgm (rỗng nếu API lỗi)."""
+    try:
+        res = requests.get(f"{API_URL}/bgm", timeout=10)
+        if res.status_code == 200:
+            return res.json().get("tracks", [])
+    except Exception:
+        pass
+    return []
+
+def _upload_bgm_to_library(uploaded_file):
+    """Đưa file nhạc vào thư viện (server tự bỏ trùng theo nội dung), trả bgm_id."""
+    cache = st.session_state.setdefault("bgm_ids", {})
+    cache_key = (uploaded_file.name, uploaded_file.size)
+    if cache_key not in cache:
+        res = requests.post(
+            f"{API_URL}/bgm",
+            files={'file': (uploaded_file.name, uploaded_file, uploaded_file.type)},
+            timeout=300,
+        )
+        res.raise_for_status()
+        cache[cache_key] = res.json()["id"]
+    return cache[cache_key]
+
 # --- [CẢI TIẾN] CÁC HÀM HELPER ĐỂ HIỂN THỊ N8N ---
 def _find_key_in_dict(data_dict, potential_keys):
     """
@@ -276,8 +368,15 @@ with nav_col:
         label_visibility="collapsed",
         key="active_tab" # Đây là chìa khóa để lưu trạng thái
     )
+    if st.button("🔄 Làm mới tất cả", key="refresh_all_button"):
+        refresh_dashboard()
 # === KẾT THÚC SỬA LỖI ===
 
+# Tải sẵn dữ liệu của dashboard một lần cho mỗi phiên (2 lần gọi API cho mọi tab)
+if not st.session_state.get("dashboard_sheets_loaded"):
+    refresh_dashboard()
+    st.session_state["dashboard_sheets_loaded"] = True
+
 
 # ==========================================================
 # ===== TÍNH NĂNG 1: PHÂN TÍCH TIKTOK  =====
@@ -498,11 +597,20 @@ elif active_tab_key == "2. Chỉnh sửa Video":
                 do_remix = False # Tự động tắt nếu không có highlight
 
             remix_bgm_file = st.file_uploader("2. (Tùy chọn) Tải lên nhạc nền (BGM)", type=["mp3", "wav", "m4a"], key="remix_bgm")
+            bgm_tracks = _load_bgm_library()
+            bgm_names = {t["id"]: f"{t.get('name')} ({t.get('duration_sec', 0):.0f}s)" for t in bgm_tracks}
+            remix_bgm_id = st.selectbox(
+                "Hoặc chọn nhạc đã có trong thư viện",
+                options=[""] + list(bgm_names),
+                format_func=lambda x: "(Không dùng)" if not x else bgm_names[x],
+                key="remix_bgm_id",
+                disabled=bool(remix_bgm_file),
+            )
             
             # [SỬA LỖI] Khởi tạo biến Ở ĐÂY (bên ngoài if)
             remix_remove_original_audio = False
             
-            if remix_bgm_file:
+            if remix_bgm_file or remix_bgm_id:
                 remix_bgm_mode_option = st.selectbox(
                     "Chế độ nhạc nền", 
                     options=["mix", "replace"],
@@ -516,6 +624,16 @@ elif active_tab_key == "2. Chỉnh sửa Video":
                 remix_burn_in = st.checkbox("Ghi đè phụ đề (Hard sub)", value=True, key="remix_burn_in")
             with col2:
                 remix_flip_video = st.checkbox("Lật video (Chỉ dùng cho video không có chữ)", value=False, key="remix_flip")
+            remix_profiles = st.multiselect(
+                "Xuất thêm khung hình (render một lần cho nhiều nền tảng)",
+                ["9:16", "1:1", "4:5", "16:9"],
+                default=[],
+                key="remix_profiles",
+                help="Bỏ trống = một bản như video gốc. 16:9 mặc định thêm viền đen (pad), các khung khác cắt (crop).",
+            )
+            remix_preview = st.checkbox(
+                "Chỉ render bản xem trước (nhanh, 480p, không upload)", value=False, key="remix_preview"
+            )
             
             if st.button("Tạo video cuối cùng"):
                 if not source_video_path:
@@ -537,13 +655,17 @@ elif active_tab_key == "2. Chỉnh sửa Video":
                             
                             'remove_original_audio': str(remix_remove_original_audio), 
                             'burn_in': str(remix_burn_in),
-                            'flip_video': str(remix_flip_video)
+                            'flip_video': str(remix_flip_video),
+                            'preview': str(remix_preview),
+                            'output_profiles': ",".join(remix_profiles)
                         }
                         
-                        # Chuẩn bị File (chỉ BGM)
+                        # BGM: đưa vào thư viện một lần rồi gửi bgm_id (không upload lại mỗi job)
                         files = {}
                         if remix_bgm_file:
-                            files['bgm'] = (remix_bgm_file.name, remix_bgm_file, remix_bgm_file.type)
+                            form_data['bgm_id'] = _upload_bgm_to_library(remix_bgm_file)
+                        elif remix_bgm_id:
+                            form_data['bgm_id'] = remix_bgm_id
 
                         # Gọi Endpoint MỚI
                         start_res = requests.post(
@@ -573,14 +695,20 @@ elif active_tab_key == "2. Chỉnh sửa Video":
                                     status_data = status_res.json()
                                     
                                     if status_data.get('status') == 'complete':
-                                        status_placeholder.success("Xử lý hoàn tất! Video đã được upload lên Dropbox và Google Sheet.")
+                                        if status_data.get('preview'):
+                                            status_placeholder.success("Bản xem trước đã sẵn sàng. Bỏ chọn 'xem trước' để render bản cuối.")
+                                        else:
+                                            status_placeholder.success("Xử lý hoàn tất! Video đã được upload lên Dropbox và Google Sheet.")
                                         download_url = status_data.get('download_url')
                                         break
                                     elif status_data.get('status') == 'failed':
                                         st.error(f"Job thất bại: {status_data.get('error')}")
                                         break
+                                    elif status_data.get('status') == 'cancelled':
+                                        st.warning("Job đã bị hủy.")
+                                        break
                                     
-                                    time.sleep(5) 
+                                    time.sleep(1 if remix_preview else 5) 
                                 
                                 if download_url:
                                     final_url = f"{API_URL}{download_url}"
@@ -595,6 +723,11 @@ elif active_tab_key == "2. Chỉnh sửa Video":
                                     st.markdown(final_video_html, unsafe_allow_html=True)
                                     st.link_button("Tải video về", final_url)
                                     
+                                    # Các khung hình thêm (nếu có chọn output_profiles)
+                                    for profile_key, profile_url in (status_data.get('outputs') or {}).items():
+                                        if profile_url and profile_url != download_url:
+                                            st.link_button(f"Tải bản {profile_key}", f"{API_URL}{profile_url}")
+                                    
                     except Exception as e:
                         st.error(f"Lỗi nghiêm trọng: {e}")
                         
@@ -607,220 +740,158 @@ elif active_tab_key == "3. Đăng tải Đa nền tảng":
     with main_col:
         st.header("Công cụ Đăng tải Đa nền tảng")
         st.write("Giúp bạn chọn video mà bạn muốn đăng cùng với nền tảng.")
-        
+
         if st.button("Làm mới dữ liệu", key="refresh_tab_4_button"):
-            refresh_sheet_data("MVP_Content_Plan", "sheet_data")
+            refresh_publishing_queue()
 
-        if 'sheet_data' not in st.session_state:
+        if 'queue_pending' not in st.session_state:
             # Tải dữ liệu lần đầu
-            refresh_sheet_data("MVP_Content_Plan", "sheet_data")
+            refresh_publishing_queue()
+
+        queues = {s: st.session_state.get(f"queue_{s}") for s in QUEUE_STATUSES}
+        if not all(queues.values()):
+            st.warning("Không tải được hàng đợi đăng tải.")
+            st.stop()
+
+        # --- 1. Header & phân loại đã được backend xử lý (/publishing/queue) ---
+        columns = queues["pending"].get("columns") or {}
+        counts = queues["pending"].get("counts") or {}
+
+        if not columns:
+            st.warning(f"Không tìm thấy dữ liệu trong sheet hoặc sheet trống.")
+            st.stop()
+
+        missing_cols = [columns[k]["label"] for k in ("facebook", "ig", "ready", "error") if not columns[k]["col"]]
+        if missing_cols:
+            st.error(f"Lỗi cấu trúc Sheet. Không tìm thấy cột cần thiết: {missing_cols}.")
+            st.stop()
+
+        COL_FB_CHECK_GSPREAD = columns["facebook"]["col"]
+        COL_IG_CHECK_GSPREAD = columns["ig"]["col"]
+        COL_READY_CHECK_GSPREAD = columns["ready"]["col"]
+        COL_ERROR_CHECK_GSPREAD = columns["error"]["col"]
+
+        pending_rows = queues["pending"]["items"]
+        published_rows = queues["published"]["items"]
+        error_rows = queues["error"]["items"]
+
+        def _load_more_button(status):
+            if queues[status].get("next_cursor"):
+                if st.button("Xem thêm", key=f"queue_more_{status}"):
+                    load_more_publishing_queue(status)
+                    st.rerun()
+
+        # --- 2. Hiển thị bằng st.tabs ---
+
+        tab_pending, tab_published, tab_error = st.tabs(
+            [
+                f"⌛ Chờ xử lý ({counts.get('pending', len(pending_rows))})",
+                f"✅ Đã đăng ({counts.get('published', len(published_rows))})",
+                f"❌ Bị lỗi ({counts.get('error', len(error_rows))})"
+            ]
+        )
 
-        if 'sheet_data' in st.session_state:
-            all_data = st.session_state['sheet_data']
-            
-            if not all_data or len(all_data) < 2:
-                st.warning(f"Không tìm thấy dữ liệu trong sheet hoặc sheet trống.")
-                st.stop()
+        # === TAB 1: CHỜ XỬ LÝ ===
+        with tab_pending:
+            st.subheader("Danh sách video chờ đăng")
 
-            # --- 1. Xử lý Header (Giữ nguyên) ---
-            header_row_index = -1
-            headers = []
-            
-            LOOKUP_COL_1 = "keyword"
-            LOOKUP_COL_2 = "link video gốc" 
+            header_cols = st.columns([4, 1, 1, 1])
+            header_cols[0].markdown(f"**{columns['title']['label']}**")
+            header_cols[1].markdown(f"**{columns['facebook']['label']}**")
+            header_cols[2].markdown(f"**{columns['ig']['label']}**")
+            header_cols[3].markdown(f"**{columns['ready']['label']}**")
 
-            for i, row in enumerate(all_data):
-                if not row: continue
-                cleaned_row = [str(cell).strip().lower() for cell in row]
-                
-                if LOOKUP_COL_1 in cleaned_row and LOOKUP_COL_2 in cleaned_row:
-                    header_row_index = i
-                    headers = all_data[header_row_index] 
-                    break 
-            
-            if header_row_index == -1:
-                st.error(f"Không tìm thấy hàng tiêu đề. Cần tìm thấy CỘT '{LOOKUP_COL_1}' VÀ '{LOOKUP_COL_2}'.")
-                st.stop()
-
-            cleaned_header_map = {str(h).strip().lower(): idx for idx, h in enumerate(headers)}
-
-            try:
-                IDX_TITLE = cleaned_header_map[LOOKUP_COL_1]
-                IDX_FB_CHECK = cleaned_header_map["facebook"]
-                IDX_IG_CHECK = cleaned_header_map["ig"]
-                IDX_READY_CHECK = cleaned_header_map["ready"]
-                IDX_ERROR_CHECK = cleaned_header_map["error"]
-                IDX_FB_LINK = cleaned_header_map.get("link facebook", -1)
-                IDX_IG_LINK = cleaned_header_map.get("link instagram", -1)
-            except KeyError as e:
-                st.error(f"Lỗi cấu trúc Sheet. Không tìm thấy cột cần thiết: {e}.")
-                st.stop()
-            
-            # --- 2. Phân loại dữ liệu (Giữ nguyên) ---
-            pending_rows = []
-            published_rows = []
-            error_rows = []
+            if not pending_rows:
+                st.info("Không có video nào đang chờ xử lý.")
 
-            for i, row_data in enumerate(all_data):
-                if i <= header_row_index:
-                    continue 
+            for item in pending_rows:
+                with st.container(border=True):
+                    row_index_gspread = item["row"]
+                    video_title = item["title"]
 
-                try:
-                    video_title = str(row_data[IDX_TITLE]).strip()
-                    if not video_title:
-                        continue 
+                    key_fb = f"check_{row_index_gspread}_{COL_FB_CHECK_GSPREAD}"
+                    key_ig = f"check_{row_index_gspread}_{COL_IG_CHECK_GSPREAD}"
+                    key_ready = f"check_{row_index_gspread}_{COL_READY_CHECK_GSPREAD}"
 
-                    val_error = str(row_data[IDX_ERROR_CHECK]).upper() == 'TRUE'
-                    link_fb = row_data[IDX_FB_LINK] if IDX_FB_LINK != -1 else ""
-                    link_ig = row_data[IDX_IG_LINK] if IDX_IG_LINK != -1 else ""
-                    
-                    has_link = (link_fb and "http" in str(link_fb)) or \
-                               (link_ig and "http" in str(link_ig))
-                    
-                    row_info = {
-                        "row_data": row_data,
-                        "gspread_index": i + 1, 
-                        "title": video_title,
-                        "link_fb": link_fb,
-                        "link_ig": link_ig
-                    }
+                    row_cols = st.columns([4, 1, 1, 1])
+                    row_cols[0].write(video_title)
 
-                    if val_error:
-                        error_rows.append(row_info)
-                    elif has_link:
-                        published_rows.append(row_info)
-                    else:
-                        pending_rows.append(row_info)
+                    row_cols[1].checkbox("FB", value=item["facebook"], key=key_fb, on_change=handle_tick, args=(row_index_gspread, COL_FB_CHECK_GSPREAD, key_fb, "facebook", video_title), label_visibility="collapsed")
+                    row_cols[2].checkbox("IG", value=item["ig"], key=key_ig, on_change=handle_tick, args=(row_index_gspread, COL_IG_CHECK_GSPREAD, key_ig, "ig", video_title), label_visibility="collapsed")
+                    row_cols[3].checkbox("Ready", value=item["ready"], key=key_ready, on_change=handle_tick, args=(row_index_gspread, COL_READY_CHECK_GSPREAD, key_ready, "ready", video_title), label_visibility="collapsed")
 
-                except IndexError:
-                    continue 
+            _load_more_button("pending")
 
-            # --- 3. Hiển thị bằng st.tabs (Giữ nguyên) ---
-            
-            tab_pending, tab_published, tab_error = st.tabs(
-                [
-                    f"⌛ Chờ xử lý ({len(pending_rows)})",
-                    f"✅ Đã đăng ({len(published_rows)})",
-                    f"❌ Bị lỗi ({len(error_rows)})"
-                ]
-            )
 
-            # === TAB 1: CHỜ XỬ LÝ ===
-            with tab_pending:
-                st.subheader("Danh sách video chờ đăng")
-                
-                # --- [SỬA LỖI CĂN LỀ] ---
-                # Bỏ HTML và dùng st.markdown đơn giản.
-                # Nó sẽ tự động căn lề trái, khớp với checkbox bên dưới.
-                header_cols = st.columns([4, 1, 1, 1])
-                header_cols[0].markdown(f"**{headers[IDX_TITLE]}**")
-                header_cols[1].markdown(f"**{headers[IDX_FB_CHECK]}**")
-                header_cols[2].markdown(f"**{headers[IDX_IG_CHECK]}**")
-                header_cols[3].markdown(f"**{headers[IDX_READY_CHECK]}**")
-                # --- KẾT THÚC SỬA LỖI ---
-
-                if not pending_rows:
-                    st.info("Không có video nào đang chờ xử lý.")
-
-                # Dùng container cho mỗi item (Giữ nguyên)
-                for item in pending_rows:
-                    with st.container(border=True): 
-                        row_data = item["row_data"]
-                        row_index_gspread = item["gspread_index"]
-                        video_title = item["title"]
-
-                        val_fb = str(row_data[IDX_FB_CHECK]).upper() == 'TRUE'
-                        val_ig = str(row_data[IDX_IG_CHECK]).upper() == 'TRUE'
-                        val_ready = str(row_data[IDX_READY_CHECK]).upper() == 'TRUE'
-                        
-                        COL_FB_CHECK_GSPREAD = IDX_FB_CHECK + 1
-                        COL_IG_CHECK_GSPREAD = IDX_IG_CHECK + 1
-                        COL_READY_CHECK_GSPREAD = IDX_READY_CHECK + 1
+        # === TAB 2: ĐÃ ĐĂNG ===
+        with tab_published:
+            st.subheader("Danh sách video đã đăng tải")
+
+            header_cols = st.columns([4, 3])
+            header_cols[0].markdown(f"**{columns['title']['label']}**")
+            header_cols[1].markdown(f"**Links**")
+            st.divider()
 
-                        key_fb = f"check_{row_index_gspread}_{COL_FB_CHECK_GSPREAD}"
-                        key_ig = f"check_{row_index_gspread}_{COL_IG_CHECK_GSPREAD}"
-                        key_ready = f"check_{row_index_gspread}_{COL_READY_CHECK_GSPREAD}"
+            if not published_rows:
+                st.info("Chưa có video nào được đăng tải.")
 
-                        row_cols = st.columns([4, 1, 1, 1])
-                        row_cols[0].write(video_title)
-                        
-                        # Code checkbox giữ nguyên (vì nó đã căn lề trái)
-                        row_cols[1].checkbox("FB", value=val_fb, key=key_fb, on_change=handle_tick, args=(row_index_gspread, COL_FB_CHECK_GSPREAD, key_fb, "facebook", video_title), label_visibility="collapsed")
-                        row_cols[2].checkbox("IG", value=val_ig, key=key_ig, on_change=handle_tick, args=(row_index_gspread, COL_IG_CHECK_GSPREAD, key_ig, "ig", video_title), label_visibility="collapsed")
-                        row_cols[3].checkbox("Ready", value=val_ready, key=key_ready, on_change=handle_tick, args=(row_index_gspread, COL_READY_CHECK_GSPREAD, key_ready, "ready", video_title), label_visibility="collapsed")
+            for item in published_rows:
+                with st.container(border=True):
+                    video_title = item["title"]
+                    link_fb = item["link_fb"]
+                    link_ig = item["link_ig"]
+
+                    row_cols = st.columns([4, 3])
+                    row_cols[0].write(video_title)
+
+                    with row_cols[1]:
+                        links_md = []
+                        if link_fb and "http" in str(link_fb):
+                            links_md.append(f"[Facebook]({link_fb})")
+                        if link_ig and "http" in str(link_ig):
+                            links_md.append(f"[Instagram]({link_ig})")
+
+                        if links_md:
+                            st.markdown(" | ".join(links_md), unsafe_allow_html=True)
+                        else:
+                            st.caption("Không có link")
 
+            _load_more_button("published")
 
-            # === TAB 2: ĐÃ ĐĂNG ===
-            with tab_published:
-                # (Tab này code đã đúng, không cần sửa)
-                st.subheader("Danh sách video đã đăng tải")
-                
-                header_cols = st.columns([4, 3])
-                header_cols[0].markdown(f"**{headers[IDX_TITLE]}**")
-                header_cols[1].markdown(f"**Links**")
-                st.divider()
-
-                if not published_rows:
-                    st.info("Chưa có video nào được đăng tải.")
-
-                for item in published_rows:
-                    with st.container(border=True): 
-                        video_title = item["title"]
-                        link_fb = item["link_fb"]
-                        link_ig = item["link_ig"]
-
-                        row_cols = st.columns([4, 3])
-                        row_cols[0].write(video_title)
-                        
-                        with row_cols[1]:
-                            links_md = []
-                            if link_fb and "http" in str(link_fb):
-                                links_md.append(f"[Facebook]({link_fb})")
-                            if link_ig and "http" in str(link_ig):
-                                links_md.append(f"[Instagram]({link_ig})")
-                            
-                            if links_md:
-                                st.markdown(" | ".join(links_md), unsafe_allow_html=True)
-                            else:
-                                st.caption("Không có link")
-            
-            # === TAB 3: BỊ LỖI ===
-            with tab_error:
-                st.subheader("Danh sách video bị lỗi")
-                st.caption("Các video này đã được đánh dấu 'Error' trong Sheet. Bạn có thể bỏ tick 'Error' ở đây để 'reset' và gửi lại video vào hàng chờ.")
-
-                # --- [SỬA LỖI CĂN LỀ] ---
-                # Bỏ HTML và dùng st.markdown đơn giản
-                header_cols = st.columns([4, 2])
-                header_cols[0].markdown(f"**{headers[IDX_TITLE]}**")
-                header_cols[1].markdown(f"**{headers[IDX_ERROR_CHECK]} (Bỏ tick để reset)**")
-                # --- KẾT THÚC SỬA LỖI ---
-                
-                st.divider()
+        # === TAB 3: BỊ LỖI ===
+        with tab_error:
+            st.subheader("Danh sách video bị lỗi")
+            st.caption("Các video này đã được đánh dấu 'Error' trong Sheet. Bạn có thể bỏ tick 'Error' ở đây để 'reset' và gửi lại video vào hàng chờ.")
 
-                if not error_rows:
-                    st.info("Không có video nào bị lỗi.")
+            header_cols = st.columns([4, 2])
+            header_cols[0].markdown(f"**{columns['title']['label']}**")
+            header_cols[1].markdown(f"**{columns['error']['label']} (Bỏ tick để reset)**")
 
-                for item in error_rows:
-                    with st.container(border=True): 
-                        row_index_gspread = item["gspread_index"]
-                        video_title = item["title"]
+            st.divider()
 
-                        COL_ERROR_CHECK_GSPREAD = IDX_ERROR_CHECK + 1
-                        key_error = f"check_{row_index_gspread}_{COL_ERROR_CHECK_GSPREAD}"
+            if not error_rows:
+                st.info("Không có video nào bị lỗi.")
 
-                        row_cols = st.columns([4, 2])
-                        row_cols[0].write(video_title)
-                        
-                        # Code checkbox giữ nguyên (nó sẽ căn lề trái)
-                        row_cols[1].checkbox(
-                            "Error", 
-                            value=True, 
-                            key=key_error, 
-                            on_change=handle_tick, 
-                            args=(row_index_gspread, COL_ERROR_CHECK_GSPREAD, key_error, "error", video_title), 
-                            label_visibility="collapsed"
-                        )
+            for item in error_rows:
+                with st.container(border=True):
+                    row_index_gspread = item["row"]
+                    video_title = item["title"]
+
+                    key_error = f"check_{row_index_gspread}_{COL_ERROR_CHECK_GSPREAD}"
+
+                    row_cols = st.columns([4, 2])
+                    row_cols[0].write(video_title)
+
+                    row_cols[1].checkbox(
+                        "Error",
+                        value=True,
+                        key=key_error,
+                        on_change=handle_tick,
+                        args=(row_index_gspread, COL_ERROR_CHECK_GSPREAD, key_error, "error", video_title),
+                        label_visibility="collapsed"
+                    )
+
+            _load_more_button("error")
 # ==========================================================
 # ===== TÍNH NĂNG 4: BÁO CÁO =====
 # ==========================================================